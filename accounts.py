@@ -0,0 +1,94 @@
+###########################################################################
+#   accounts.py  --  This file is part of traderie-bot.                   #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+# Per-seller state for running several Traderie accounts in one process. Threads, HTTP connections, caches and the
+# Telegram bot are shared, the account a piece of code is working for is carried in a context variable
+
+import contextlib
+import contextvars
+from dataclasses import dataclass, field
+import datetime
+import threading
+from typing import Dict, Iterator, List, Optional, Set
+
+# Constants
+# Keys of the default account are left unprefixed, so state from single account setups keeps working
+DEFAULT_ACCOUNT = "default"
+
+# Global vars
+currentAccount: contextvars.ContextVar["Account"] = contextvars.ContextVar("currentAccount")
+registry: Dict[str, "Account"] = {}
+registryLock = threading.Lock()
+
+
+@dataclass
+class Account:
+    name: str
+    chatID: int
+    sellerID: int
+    auth: str = ""
+    offersPerDay: int = 0
+    relistTime: Optional[datetime.time] = None
+    dcloneAlertRealms: Set[str] = field(default_factory=set)
+
+    def key(self, key: str) -> str:
+        # Namespaces keys in caches and stores shared by all accounts
+        if self.name == DEFAULT_ACCOUNT:
+            return key
+        return f"{self.name}:{key}"
+
+
+def register(account: Account) -> None:
+    with registryLock:
+        registry[account.name] = account
+
+
+def clear() -> None:
+    with registryLock:
+        registry.clear()
+
+
+def getAll() -> List[Account]:
+    with registryLock:
+        return list(registry.values())
+
+
+def forChat(chatID: int) -> Optional[Account]:
+    for account in getAll():
+        if account.chatID == chatID:
+            return account
+    return None
+
+
+def current() -> Account:
+    return currentAccount.get()
+
+
+def getCurrent() -> Optional[Account]:
+    return currentAccount.get(None)
+
+
+@contextlib.contextmanager
+def use(account: Account) -> Iterator[Account]:
+    token = currentAccount.set(account)
+    try:
+        yield account
+    finally:
+        currentAccount.reset(token)
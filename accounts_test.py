@@ -0,0 +1,78 @@
+###########################################################################
+#   accounts_test.py  --  This file is part of traderie-bot.              #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import concurrent.futures
+import types
+import unittest
+
+import accounts
+import bot
+import traderie
+
+
+class TestAccounts(unittest.TestCase):
+    def setUp(self):
+        accounts.clear()
+        self.main = accounts.Account(name=accounts.DEFAULT_ACCOUNT, chatID=1, sellerID=10, auth="main-token")
+        self.alt = accounts.Account(name="alt", chatID=2, sellerID=20, auth="alt-token")
+        accounts.register(self.main)
+        accounts.register(self.alt)
+
+    def tearDown(self):
+        accounts.clear()
+
+    def testKeys(self):
+        self.assertEqual(self.main.key("offersPerDay"), "offersPerDay")
+        self.assertEqual(self.alt.key("offersPerDay"), "alt:offersPerDay")
+
+    def testLookup(self):
+        self.assertIs(accounts.forChat(2), self.alt)
+        self.assertIsNone(accounts.forChat(3))
+        self.assertIsNone(accounts.getCurrent())
+        with accounts.use(self.alt):
+            self.assertIs(accounts.current(), self.alt)
+        self.assertIsNone(accounts.getCurrent())
+
+    def testHeadersPerThread(self):
+        def getAuth(account):
+            with accounts.use(account):
+                return traderie.getHeaders()["authorization"]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(getAuth, [self.main, self.alt] * 10))
+        self.assertEqual(results, ["main-token", "alt-token"] * 10)
+        self.assertEqual(traderie.getHeaders()["authorization"], "")
+
+    def testHandlerRouting(self):
+        seen = []
+        handler = bot.withAccount(lambda update, context: seen.append(accounts.current()))
+        handler(types.SimpleNamespace(effective_chat=types.SimpleNamespace(id=2)), None)
+        handler(types.SimpleNamespace(effective_chat=types.SimpleNamespace(id=1)), None)
+        # Unknown chats are ignored once there's more than one account
+        handler(types.SimpleNamespace(effective_chat=types.SimpleNamespace(id=3)), None)
+        self.assertEqual(seen, [self.alt, self.main])
+        accounts.clear()
+        accounts.register(self.main)
+        handler(types.SimpleNamespace(effective_chat=types.SimpleNamespace(id=3)), None)
+        self.assertEqual(seen, [self.alt, self.main, self.main])
+
+
+if __name__ == '__main__':
+    unittest.main()
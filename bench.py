@@ -0,0 +1,212 @@
+###########################################################################
+#   bench.py  --  This file is part of traderie-bot.                      #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+# Runs the bot's hot paths against fakeserver and compares them with a stored baseline. Wall time depends on the
+# machine, request counts don't, so a change in the number of requests is always reported
+
+import argparse
+import configparser
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from typing import Callable, Dict, Optional
+
+import accounts
+import bot
+import dclone
+import fakeserver
+import log
+import lru
+import telegram.utils.request
+import traderie
+
+# Constants
+BASELINE_FILE = "bench_baseline.json"
+DEFAULT_TOLERANCE = 0.5
+FAKE_TELEGRAM_TOKEN = "123456:fake-token"
+FAKE_CHAT_ID = 1
+STARTUP_TIMEOUT = 30
+
+# Global vars
+logger = log.getLogger(__name__)
+
+
+def setupBot(server: fakeserver.FakeServer) -> telegram.Bot:
+    traderie.API_BASE_URL = server.traderieURL
+    dclone.DcloneTracker1.url = server.baseURL + fakeserver.D2RUNEWIZARD_PREFIX
+    dclone.DcloneTracker2.url = server.baseURL + fakeserver.DIABLO2IO_PATH
+    account = accounts.Account(name=accounts.DEFAULT_ACCOUNT, chatID=FAKE_CHAT_ID, sellerID=fakeserver.SELLER_ID, auth="Bearer fake")
+    accounts.clear()
+    accounts.register(account)
+    accounts.currentAccount.set(account)
+    bot.conversationCache = lru.LRUCache(1000)
+    bot.userCache = lru.LRUCache(1000)
+    return bot.MeteredBot(
+        token=FAKE_TELEGRAM_TOKEN,
+        base_url=server.telegramURL,
+        request=telegram.utils.request.Request(con_pool_size=8),
+    )
+
+
+def benchRelist(server: fakeserver.FakeServer, telegramBot: telegram.Bot) -> None:
+    bot.doRelist(telegramBot)
+
+
+def benchNotificationStorm(server: fakeserver.FakeServer, telegramBot: telegram.Bot) -> None:
+    while any(not notification["read"] for notification in server.state.notifications):
+        bot.doNotifications(telegramBot, True)
+
+
+def benchOfferLookups(server: fakeserver.FakeServer, telegramBot: telegram.Bot) -> None:
+    for listingID in range(1, server.state.config.numListings + 1):
+        bot.doOffersForListing(listingID, fakeserver.SELLER_ID)
+
+
+def benchOffersReceived(server: fakeserver.FakeServer, telegramBot: telegram.Bot) -> None:
+    bot.offersReceivedHandler(None, types.SimpleNamespace(bot=telegramBot, args=[]))
+
+
+def benchStartup(server: fakeserver.FakeServer, telegramBot: telegram.Bot) -> float:
+    # Cold start of main.py until its first Traderie request. That one is the first poll, the bot has no other reason
+    # to call Traderie before then
+    with tempfile.TemporaryDirectory() as tmpdir:
+        configPath = os.path.join(tmpdir, "config.ini")
+        parser = configparser.ConfigParser(interpolation=None)
+        parser["bot"] = {
+            "api_key": FAKE_TELEGRAM_TOKEN,
+            "target_chat_id": str(FAKE_CHAT_ID),
+            "traderie_seller_id": str(fakeserver.SELLER_ID),
+            "traderie_auth": "Bearer fake",
+            "telegram_api_url": server.telegramURL,
+            "traderie_api_url": server.traderieURL,
+            "data_dir": os.path.join(tmpdir, "data"),
+            "dclone_d2runewizard_url": server.baseURL + fakeserver.D2RUNEWIZARD_PREFIX,
+            "dclone_diablo2io_url": server.baseURL + fakeserver.DIABLO2IO_PATH,
+        }
+        with open(configPath, "w") as f:
+            parser.write(f)
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py"), "--config", configPath],
+            cwd=tmpdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            while not any(key.split(" ", 1)[1].startswith(fakeserver.TRADERIE_PREFIX) for key in list(server.state.requestCounts)):
+                if time.perf_counter() - start > STARTUP_TIMEOUT or process.poll() is not None:
+                    raise RuntimeError("The bot never polled Traderie")
+                time.sleep(0.001)
+            return time.perf_counter() - start
+        finally:
+            process.kill()
+            process.wait()
+
+
+# name -> (scenario, fake server setup)
+SCENARIOS: Dict[str, tuple] = {
+    "relist_5k": (benchRelist, fakeserver.FakeConfig(numListings=5000, numOffers=0)),
+    "notification_storm": (benchNotificationStorm, fakeserver.FakeConfig(numListings=50, numOffers=50, numNotifications=200)),
+    "offer_lookups": (benchOfferLookups, fakeserver.FakeConfig(numListings=50, numOffers=500)),
+    "offers_recv": (benchOffersReceived, fakeserver.FakeConfig(numListings=100, numOffers=200)),
+    "startup": (benchStartup, fakeserver.FakeConfig(numListings=10, numOffers=0)),
+}
+
+
+def runScenario(scenario: Callable, config: fakeserver.FakeConfig) -> Dict[str, float]:
+    with fakeserver.FakeServer(config) as server:
+        telegramBot = setupBot(server)
+        start = time.perf_counter()
+        # Scenarios that only care about part of their run return the time they measured themselves
+        elapsed = scenario(server, telegramBot)
+        if elapsed is None:
+            return {
+                "seconds": round(time.perf_counter() - start, 3),
+                "requests": sum(server.state.requestCounts.values()),
+            }
+        return {"seconds": round(elapsed, 3), "requests": None}
+
+
+def compareResults(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> Optional[str]:
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        if reference["requests"] is not None and result["requests"] != reference["requests"]:
+            regressions.append(f"{name}: {result['requests']} requests, baseline was {reference['requests']}")
+        if result["seconds"] > reference["seconds"] * (1 + tolerance):
+            regressions.append(f"{name}: {result['seconds']:.3f}s, baseline was {reference['seconds']:.3f}s")
+    if len(regressions) != 0:
+        return "\n".join(regressions)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bot against a local fake Traderie/Telegram/dclone server")
+    parser.add_argument("scenarios", nargs="*", help=f"Scenarios to run (default: all): {', '.join(SCENARIOS)}")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of latency added to every fake response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake responses that fail with a 500")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed slowdown over the baseline, as a fraction")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--update-baseline", default=False, action="store_true")
+    args = parser.parse_args()
+    # The bot logs every relisted listing and delivered notification, which would dominate the timings
+    log.setSeverity(logging.WARNING)
+
+    names = args.scenarios if len(args.scenarios) != 0 else list(SCENARIOS)
+    results = {}
+    for name in names:
+        if name not in SCENARIOS:
+            logger.error(f"Unknown scenario: {name}")
+            exit(1)
+        scenario, config = SCENARIOS[name]
+        config.latency = args.latency
+        config.errorRate = args.error_rate
+        results[name] = runScenario(scenario, config)
+        if results[name]["requests"] is None:
+            print(f"{name}: {results[name]['seconds']:.3f}s")
+        else:
+            print(f"{name}: {results[name]['seconds']:.3f}s, {results[name]['requests']} requests")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}, run with --update-baseline to create one")
+        return
+    regressions = compareResults(results, baseline, args.tolerance)
+    if regressions is not None:
+        print(f"Regressions against {args.baseline}:\n{regressions}")
+        sys.exit(1)
+    print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,20 +18,39 @@
 #                                                                         #
 ###########################################################################
 
+# Handler annotations reference telegram.ext, which is only imported once the Updater is built
+from __future__ import annotations
+
+import concurrent.futures
+import contextvars
 import datetime
+import multiprocessing
+import os
+import queue
 import re
 import threading
-import traceback
-from typing import Callable, Dict, List, Optional
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 import telegram
-import telegram.ext
+import telegram.utils.helpers
+import telegram.utils.request
 
+import accounts
 import blocklist
 import dclone
+import dclonehistory
+import jobwatchdog
 import log
 import lru
+import metrics
+import profiler
+import responsecapture
+import scheduler
+import seenindex
+import statestore
 import traderie
+import userdirectory
 
 # Constants
 # Put your Telegram Bot API key here
@@ -40,11 +59,43 @@ APIKEY = ""
 TARGET_CHAT_ID = 0
 # Put your Traderie seller ID here
 TRADERIE_SELLER_ID = 0
+# Traderie authorization header. If empty, the bot asks for it with /auth on startup
+TRADERIE_AUTH = ""
+# Extra seller accounts, as dicts with name, chat_id, seller_id and optionally auth. The constants above make up
+# the default account and are ignored if this is set
+ACCOUNTS: List[Dict] = []
+TELEGRAM_API_URL = "https://api.telegram.org/bot"
 
 NOTIFICATION_POLLING_INTERVAL = 10
 STATUS_INTERVAL = 1800
-DCLONE_POLLING_INTERVAL = 60
+# Realms that trigger dclone alerts. All realms are polled regardless
+DCLONE_ALERT_REALMS = ["softcore-nonladder"]
 MAX_MESSAGES_FETCH = 10
+CACHE_SNAPSHOT_INTERVAL = 300
+STATE_FLUSH_INTERVAL = 5
+# Port for the Prometheus text metrics endpoint on localhost. 0 disables it
+METRICS_PORT = 0
+# Warn when the p95 time from a notification being created to its alert being delivered goes above this many
+# seconds. 0 disables it
+NOTIFICATION_LATENCY_P95_THRESHOLD = 120
+NOTIFICATION_LATENCY_ALERT_COOLDOWN = 3600
+# The p95 above only covers notifications delivered in the last this many seconds
+NOTIFICATION_LATENCY_WINDOW = 900
+# Seconds a background job may go without making any request before the watchdog dumps its stack and replaces it.
+# Every request has a timeout well under this, so only a real hang gets there
+JOB_TIMEOUT = 120
+
+DATA_DIR = "data"
+# Subdirectory of DATA_DIR for the cache snapshots. Supervisor workers each get their own, since they hold different
+# accounts and would overwrite each other's files. The SQLite stores are shared
+SNAPSHOT_DIR = ""
+USER_CACHE_SNAPSHOT = "user_cache.json"
+CONVERSATION_CACHE_SNAPSHOT = "conversation_cache.json"
+USER_DIRECTORY_DB = "users.db"
+MESSAGE_ROUTES_SNAPSHOT = "message_routes.json"
+OFFER_SNAPSHOTS_SNAPSHOT = "offer_snapshots.json"
+DCLONE_HISTORY_SNAPSHOT = "dclone_history.bin"
+STATE_DB = "state.db"
 
 DEFAULT_RELIST_TIME_HOUR = 19
 DEFAULT_RELIST_TIME_MINUTE = 00
@@ -54,73 +105,68 @@ DEFAULT_MODE = "softcore"
 DEFAULT_LADDER = "NONLADDER"
 DEFAULT_PLATFORM = "PC"
 GREETING_TEXT = "Hello! wanna trade? which region are you in?"
+NOTIFICATION_KINDS = [
+    ("message", "^You got a new message from .*$"),
+    ("offer", "^.*? made an ? offer for .*$"),
+    ("completed", "^.*? completed their offer for your .*?\\. Leave them a review$"),
+    ("review", "^You just got a 5 star review from .*$"),
+    ("chat_request", "^You have a chat request from .*$"),
+]
+
+
+class MeteredBot(telegram.Bot):
+    # Every Bot API method goes through _post, so this times all Telegram calls in one place
+    def _post(self, endpoint: str, data=None, timeout=telegram.utils.helpers.DEFAULT_NONE, api_kwargs=None):
+        jobwatchdog.checkCancelled()
+        start = time.monotonic()
+        status = "error"
+        try:
+            result = super()._post(endpoint, data, timeout, api_kwargs)
+            status = "ok"
+            return result
+        finally:
+            metrics.observe("telegram_request_duration_seconds", time.monotonic() - start, {"endpoint": endpoint})
+            jobwatchdog.beat()
+            metrics.incCounter("telegram_requests_total", {"endpoint": endpoint, "status": status})
+
 
 # Global vars
 logger = log.getLogger(__name__)
-relistTime = datetime.time(
-    hour=DEFAULT_RELIST_TIME_HOUR,
-    minute=DEFAULT_RELIST_TIME_MINUTE,
-    tzinfo=datetime.timezone.utc
-)
 exitEvent = threading.Event()
-conversationCache = lru.LRUCache(10)
-userCache = lru.LRUCache(10)
-offersPerDay = 0
-dclonePreviousStatus = {
-    "Americas": 1,
-    "Asia": 1,
-    "Europe": 1,
-}
-
-
-def monitoringLoop(bot: telegram.Bot, threadList: Dict[str, Callable]) -> None:
-    monitoredThreads = {}
-    runningThreads = threading.enumerate()
-
-    # Populate already running threads
-    for thread in runningThreads:
-        if thread.name in threadList:
-            monitoredThreads[thread.name] = thread
-
-    while not exitEvent.is_set():
-        runningThreads = list(map(lambda x: x.name, threading.enumerate()))
-        for thread in threadList:
-            if thread not in runningThreads:
-                logger.error(f"Uh oh, {thread} was not found in running thread list. Restarting...")
-                monitoredThreads[thread] = threadList[thread](bot)
-        exitEvent.wait(10)
-
-    for thread in monitoredThreads:
-        monitoredThreads[thread].join()
-        logger.info(f"{thread} thread shutdown!")
-
-
-def startStatusThread(bot: telegram.Bot) -> threading.Thread:
-    statusThread = threading.Thread(target=statusLoop, args=(bot, STATUS_INTERVAL))
-    statusThread.name = "status_thread"
-    statusThread.start()
-    return statusThread
-
-
-def startNotificationThread(bot: telegram.Bot) -> threading.Thread:
-    notificationThread = threading.Thread(target=pollNotificationsLoop, args=(bot, NOTIFICATION_POLLING_INTERVAL))
-    notificationThread.name = "notification_thread"
-    notificationThread.start()
-    return notificationThread
-
-
-def startRelistThread(bot: telegram.Bot) -> threading.Thread:
-    relistThread = threading.Thread(target=relistLoop, args=(bot,))
-    relistThread.name = "relist_thread"
-    relistThread.start()
-    return relistThread
-
-
-def startDcloneThread(bot: telegram.Bot) -> threading.Thread:
-    dcloneThread = threading.Thread(target=dcloneLoop, args=(bot, DCLONE_POLLING_INTERVAL))
-    dcloneThread.name = "dclone_thread"
-    dcloneThread.start()
-    return dcloneThread
+# Caches are shared by all accounts. Keys that only make sense for one account are namespaced with Account.key()
+# Traderie user ID -> last message ID seen in the conversation with them
+conversationCache = lru.LRUCache(1000)
+userCache = lru.LRUCache(1000)
+# Telegram message ID -> [Traderie user ID, conversation ID] of the user that message is about
+messageRoutes = lru.LRUCache(5000)
+# Traderie user ID -> conversation ID
+conversationIDCache = lru.LRUCache(1000)
+# Offer ID -> fields needed to accept or decline it, recorded when the offer alert is sent
+offerSnapshots = lru.LRUCache(1000)
+userDirectory: Optional[userdirectory.UserDirectory] = None
+stateStore: Optional[statestore.StateStore] = None
+seenNotifications: Optional[seenindex.SeenIndex] = None
+lastLatencyAlert = 0.0
+recentDeliveryLatency = metrics.WindowedHistogram(NOTIFICATION_LATENCY_WINDOW)
+# Realm key -> last status per region
+dclonePreviousStatus: Dict[str, Dict[str, int]] = {realm: {} for realm in dclone.REALMS}
+# Realm key -> (monotonic time of the poll, status per region)
+dcloneLatestStatus: Dict[str, Tuple[float, Dict[str, int]]] = {}
+dclonePollingInterval = dclone.getPollingInterval(None)
+dcloneHistory = dclonehistory.DcloneHistory()
+# Daemon threads, so shutting down doesn't wait for a relist to go through every listing
+relistExecutor = scheduler.DaemonPool("relist", 2)
+jobScheduler = scheduler.Scheduler()
+
+
+def saveState(key: str, value) -> None:
+    jobwatchdog.checkCancelled()
+    if stateStore is not None:
+        stateStore.set(key, value)
+
+
+def saveAccountState(key: str, value) -> None:
+    saveState(accounts.current().key(key), value)
 
 
 def calculateEffectiveRelistTime(relistTime: datetime.datetime) -> datetime.datetime:
@@ -133,7 +179,7 @@ def calculateEffectiveRelistTime(relistTime: datetime.datetime) -> datetime.date
 
 def helpHandler(update: telegram.Update, context: telegram.ext.CallbackContext):
     context.bot.send_message(
-        chat_id=TARGET_CHAT_ID,
+        chat_id=accounts.current().chatID,
         text="\n".join([
             "/help: Show this message",
             "/relist_all: Relist all listings older than 24 hours",
@@ -144,14 +190,27 @@ def helpHandler(update: telegram.Update, context: telegram.ext.CallbackContext):
             "/send_msg USERNAME MESSAGE: Send MESSAGE to USERNAME",
             "/offers_recv: List offers received by the trader",
             "/offers_sent: List offers made by the trader",
-            "/dclone: Get dclone status",
+            "/dclone [soft|hard ladder|nonladder]: Get dclone status",
+            "/dclone_alerts [REALM...]: Show or set the realms that trigger dclone alerts",
+            "/dclone_history [REALM]: Show recent dclone progress and estimated time to 6/6",
+            "/dclone_trackers: Show dclone tracker latency and disagreement stats",
+            "/stats: Show latency and error stats for every upstream endpoint",
+            "/profile: Dump the CPU and memory profiles (requires --profile or --profile-mem)",
+            "/bad_responses: Dump the last failed or invalid upstream responses",
         ])
     )
 
 
-def notificationPostActions(bot: telegram.Bot, notification: traderie.Notification, notificationMessage: telegram.Message) -> None:
-    global offersPerDay
-    if re.search("^You got a new message from .*$", notification.text) is not None:
+def classifyNotification(text: str) -> Optional[str]:
+    for kind, pattern in NOTIFICATION_KINDS:
+        if re.search(pattern, text) is not None:
+            return kind
+    return None
+
+
+def notificationPostActions(bot: telegram.Bot, notification: traderie.Notification, notificationMessage: telegram.Message, kind: Optional[str]) -> None:
+    account = accounts.current()
+    if kind == "message":
         username = re.search("^You got a new message from (.*)$", notification.text).group(1)
         userCache.put(username, str(notification.fromUserID))
         lastMessages = doLastMessagesFrom(notification.fromUserID)
@@ -160,14 +219,15 @@ def notificationPostActions(bot: telegram.Bot, notification: traderie.Notificati
             return
         if len(lastMessages) != 0:
             lastMessagesText = '\n' + '\n'.join(list(map(lambda x: x.text, lastMessages)))
-            bot.send_message(
-                chat_id=TARGET_CHAT_ID,
+            lastMessagesMessage = bot.send_message(
+                chat_id=accounts.current().chatID,
                 text=f"Last messages from {username}:{lastMessagesText}",
                 reply_to_message_id=notificationMessage.message_id,
             )
+            recordMessageRoute(lastMessagesMessage, notification.fromUserID)
             logger.info(f"Last messages from {username}:{lastMessagesText}")
-    elif re.search("^.*? made an ? offer for .*$", notification.text) is not None:
-        offers = doOffersForListing(notification.listingID, TRADERIE_SELLER_ID)
+    elif kind == "offer":
+        offers = doOffersForListing(notification.listingID, accounts.current().sellerID)
         if offers is None:
             logger.error("Unable to get offers for listing")
             return
@@ -182,12 +242,13 @@ def notificationPostActions(bot: telegram.Bot, notification: traderie.Notificati
         if lst is None:
             logger.error(f"Unable to find the listing the notification is mentioning: {notification.listingID}")
             return
-        offersPerDay += 1
+        account.offersPerDay += 1
+        saveAccountState("offersPerDay", account.offersPerDay)
         offerStr = ' OR '.join(list(map(lambda x: str(x), targetOffer.offer)))
         listingStr = ' OR '.join(list(map(lambda x: str(x), lst.price)))
         msgText = f"Their offer {offerStr}\nYour Price {listingStr}"
-        bot.send_message(
-            chat_id=TARGET_CHAT_ID,
+        offerMessage = bot.send_message(
+            chat_id=accounts.current().chatID,
             text=msgText,
             reply_to_message_id=notificationMessage.message_id,
             reply_markup=telegram.InlineKeyboardMarkup(
@@ -197,8 +258,10 @@ def notificationPostActions(bot: telegram.Bot, notification: traderie.Notificati
                 ]]
             )
         )
+        recordMessageRoute(offerMessage, targetOffer.buyerID)
+        recordOfferSnapshot(targetOffer, lst)
         logger.info(msgText)
-    elif re.search("^.*? completed their offer for your .*?\\. Leave them a review$", notification.text) is not None:
+    elif kind == "completed":
         notificationMessage.edit_reply_markup(
             reply_markup=telegram.InlineKeyboardMarkup(
                 inline_keyboard=[[
@@ -206,11 +269,11 @@ def notificationPostActions(bot: telegram.Bot, notification: traderie.Notificati
                 ]]
             )
         )
-    elif re.search("^You just got a 5 star review from .*$", notification.text) is not None:
+    elif kind == "review":
         res = traderie.sendReview(notification.fromUserID, 5, "")
         if res is not None:
             logger.error(f"Unable to send review: {res}")
-    elif re.search("^You have a chat request from .*$", notification.text) is not None:
+    elif kind == "chat_request":
         res = traderie.acceptChatRequest(notification.notificationID)
         if res is not None:
             logger.error(f"Unable to automatically accept conversation request: {res}")
@@ -226,38 +289,106 @@ def notificationPostActions(bot: telegram.Bot, notification: traderie.Notificati
                 traderie.archiveChat(notification.notificationID)
                 traderie.blockUser(notification.fromUserID)
                 bot.send_message(
-                    chat_id=TARGET_CHAT_ID,
+                    chat_id=accounts.current().chatID,
                     text=f"Asshole detected: {username}. Reason: {reason}",
                     reply_to_message_id=notificationMessage.message_id,
                 )
                 return
         if len(lastMessages) != 0:
             lastMessagesText = '\n' + '\n'.join(list(map(lambda x: x.text, lastMessages)))
-            bot.send_message(
-                chat_id=TARGET_CHAT_ID,
+            lastMessagesMessage = bot.send_message(
+                chat_id=accounts.current().chatID,
                 text=f"Last messages from {username}:{lastMessagesText}",
                 reply_to_message_id=notificationMessage.message_id,
             )
+            recordMessageRoute(lastMessagesMessage, notification.fromUserID)
             logger.info(f"Last messages from {username}:{lastMessagesText}")
 
 
-def doSendMessage(bot: telegram.Bot, username: str, message: str) -> None:
+def getGreetingListingInfo(lst: traderie.Listing) -> str:
+    mode = DEFAULT_MODE
+    ladder = DEFAULT_LADDER
+    platform = DEFAULT_PLATFORM
+    if lst.properties.get("Mode") is not None:
+        mode = lst.properties.get("Mode").value
+    if lst.properties.get("Ladder") is not None and lst.properties["Ladder"].value == "True":
+        ladder = "LADDER"
+    if lst.properties.get("Platform") is not None:
+        platform = lst.properties.get("Platform").value
+    return f"{platform}:{mode}:{ladder}"
+
+
+def recordOfferSnapshot(offer: traderie.Offer, lst: Optional[traderie.Listing]) -> Dict:
+    snapshot = {
+        "offerID": offer.offerID,
+        "buyerID": offer.buyerID,
+        "buyerUsername": offer.buyerUsername,
+        "listingID": offer.listingID,
+        "amount": offer.amount,
+        "itemID": offer.itemID,
+        "greeting": getGreetingListingInfo(lst) if lst is not None else None,
+    }
+    offerSnapshots.put(str(offer.offerID), snapshot)
+    return snapshot
+
+
+def getOfferSnapshot(offerID: int) -> Optional[Dict]:
+    snapshot = offerSnapshots.get(str(offerID))
+    if snapshot is not None:
+        return snapshot
+    # Offers alerted before the snapshot was taken (or evicted since) need the full offer list
+    logger.info(f"No snapshot for offer {offerID}, fetching open offers")
+    offers = traderie.getOffers(toSellerID=accounts.current().sellerID)
+    if offers is None or offers.get(offerID) is None:
+        return None
+    offer = offers[offerID]
+    lst = traderie.getListing(offer.listingID)
+    if lst is None:
+        logger.error(f"Unable to find the listing the offer is about: {offer.listingID}")
+    return recordOfferSnapshot(offer, lst)
+
+
+def recordMessageRoute(message: Optional[telegram.Message], userID: Optional[int]) -> None:
+    if message is None or userID is None or userID == accounts.current().sellerID:
+        return
+    account = accounts.current()
+    messageRoutes.put(account.key(str(message.message_id)), [userID, conversationIDCache.get(account.key(str(userID)))])
+
+
+def lookupUserID(username: str) -> Optional[int]:
     userID = userCache.get(username)
+    if userID is not None:
+        return int(userID)
+    if userDirectory is not None:
+        userID = userDirectory.getUserID(username)
+        if userID is not None:
+            userCache.put(username, str(userID))
+            return userID
+    return None
+
+
+def doSendMessage(bot: telegram.Bot, username: str, message: str) -> None:
+    userID = lookupUserID(username)
     if userID is None:
+        logger.info(f"User '{username}' not found in directory, searching for it")
         userID = traderie.searchUser(username)
         if userID is None:
             logger.error(f"Searching for username '{username}' yielded no results")
             bot.send_message(
-                chat_id=TARGET_CHAT_ID,
+                chat_id=accounts.current().chatID,
                 text=f"Unable to send message: '{username}' not found"
             )
             return
         userCache.put(username, str(userID))
+    doSendMessageToUser(bot, userID, message)
+
+
+def doSendMessageToUser(bot: telegram.Bot, userID: int, message: str) -> None:
     res = traderie.sendMessage(userID, message)
     if res is not None:
         logger.error(f"Unable to send message: {res}")
         bot.send_message(
-            chat_id=TARGET_CHAT_ID,
+            chat_id=accounts.current().chatID,
             text=f"Unable to send message: {res}"
         )
     else:
@@ -278,10 +409,10 @@ def doOffersForListing(listingID: int, seller: int) -> Optional[List[traderie.Of
 
 
 def doRelist(bot: telegram.Bot) -> None:
-    listings = traderie.getAllListings(TRADERIE_SELLER_ID)
+    listings = traderie.getAllListings(accounts.current().sellerID)
     if listings is None:
         bot.send_message(
-            chat_id=TARGET_CHAT_ID,
+            chat_id=accounts.current().chatID,
             text="Unable to get all listings from user",
         )
         return
@@ -290,6 +421,9 @@ def doRelist(bot: telegram.Bot) -> None:
 
     errors = 0
     for listing in possibleListings:
+        if exitEvent.is_set():
+            logger.info(f"Shutting down, leaving the rest of the listings of {accounts.current().name} unrelisted")
+            return
         res = traderie.relistItem(listing.listingID)
         if res is not None:
             logger.error(f"Unable to relist listing {listing.listingID}: {res}")
@@ -298,25 +432,27 @@ def doRelist(bot: telegram.Bot) -> None:
             logger.info(f"Successfully relisted listing {listing.listingID}")
     if errors != 0:
         bot.send_message(
-            chat_id=TARGET_CHAT_ID,
+            chat_id=accounts.current().chatID,
             text=f"Completed. Some listings failed to relist ({errors} out of {len(possibleListings)})",
         )
         logger.info(f"Completed. Some listings failed to relist ({errors} out of {len(possibleListings)})")
         return
     bot.send_message(
-        chat_id=TARGET_CHAT_ID,
+        chat_id=accounts.current().chatID,
         text=f"All listings ({len(possibleListings)}) refreshed successfully!",
     )
     logger.info(f"All listings ({len(possibleListings)}) refreshed successfully!")
 
 
 def doLastMessagesFrom(fromUserID: int) -> Optional[List[traderie.Message]]:
-    conversations = traderie.getConversations(True, TRADERIE_SELLER_ID)
+    conversations = traderie.getConversations(True, accounts.current().sellerID)
 
     if conversations.get(fromUserID) is None:
         logger.error(f"Unable to find an active conversation with user {fromUserID}")
         return None
 
+    account = accounts.current()
+    conversationIDCache.put(account.key(str(fromUserID)), conversations[fromUserID].conversationID)
     messages = traderie.getMessages(fromUserID, MAX_MESSAGES_FETCH, conversations[fromUserID].conversationID)
     if messages is None or len(messages) == 0:
         logger.error(f"Unable to get messages from user {fromUserID}: {messages}")
@@ -324,7 +460,7 @@ def doLastMessagesFrom(fromUserID: int) -> Optional[List[traderie.Message]]:
 
     lastMessages = []
     index = -1
-    lastMessageID = conversationCache.get(str(fromUserID))
+    lastMessageID = conversationCache.get(account.key(str(fromUserID)))
     if lastMessageID is not None:
         for i in range(len(messages)):
             if messages[i].msgID == lastMessageID:
@@ -344,16 +480,56 @@ def doLastMessagesFrom(fromUserID: int) -> Optional[List[traderie.Message]]:
     if len(lastMessages) == 0:
         logger.error(f"No last messages found for user {fromUserID}. Last message index: {index}. Last message ID: {lastMessageID}")
         return None
-    conversationCache.put(str(fromUserID), lastMessages[-1].msgID)
+    conversationCache.put(account.key(str(fromUserID)), lastMessages[-1].msgID)
     return lastMessages
 
 
+def observeDeliveryLatency(notification: traderie.Notification) -> None:
+    import dateutil.parser
+
+    try:
+        created = dateutil.parser.isoparse(notification.date)
+    except ValueError:
+        logger.warning(f"Unable to parse notification date: {notification.date}")
+        return
+    latency = (datetime.datetime.now(datetime.timezone.utc) - created).total_seconds()
+    # Clamp clock skew between us and the server
+    metrics.observe("notification_delivery_seconds", max(latency, 0))
+    recentDeliveryLatency.observe(max(latency, 0))
+
+
+def checkDeliveryLatency(bot: telegram.Bot) -> None:
+    # Latency is measured across all accounts, so every account gets the alert
+    global lastLatencyAlert
+
+    if NOTIFICATION_LATENCY_P95_THRESHOLD == 0:
+        return
+    p95 = recentDeliveryLatency.percentile(0.95)
+    if p95 is None or p95 <= NOTIFICATION_LATENCY_P95_THRESHOLD:
+        return
+    if time.monotonic() - lastLatencyAlert < NOTIFICATION_LATENCY_ALERT_COOLDOWN:
+        return
+    lastLatencyAlert = time.monotonic()
+    logger.warning(f"Notification delivery p95 is {p95:.0f}s, above the {NOTIFICATION_LATENCY_P95_THRESHOLD}s threshold")
+    for account in accounts.getAll():
+        try:
+            bot.send_message(
+                chat_id=account.chatID,
+                text=f"Notification delivery is slow: p95 is {p95:.0f}s (threshold {NOTIFICATION_LATENCY_P95_THRESHOLD}s). Check /stats",
+            )
+        except telegram.error.NetworkError as e:
+            logger.error(f"Failed to send latency alert to {account.name}: {str(e)}", exc_info=True)
+
+
 def doNotifications(bot: telegram.Bot, new: bool) -> None:
-    allNotifications = traderie.getNotifications(False, 10)
+    fetchStart = time.monotonic()
     newNotifications = traderie.getNotifications(True, 10)
-    if allNotifications is None or newNotifications is None:
+    allNotifications = None
+    if not new:
+        allNotifications = traderie.getNotifications(False, 10)
+    if newNotifications is None or (not new and allNotifications is None):
         bot.send_message(
-            chat_id=TARGET_CHAT_ID,
+            chat_id=accounts.current().chatID,
             text="Error getting notification list",
         )
         return
@@ -361,26 +537,44 @@ def doNotifications(bot: telegram.Bot, new: bool) -> None:
         res = traderie.markNewNotificationsAsRead(newNotifications)
         if res is not None:
             bot.send_message(
-                chat_id=TARGET_CHAT_ID,
+                chat_id=accounts.current().chatID,
                 text=f"Error marking notifications as read: {res}",
             )
 
+    if new:
+        metrics.observe("notification_stage_seconds", time.monotonic() - fetchStart, {"stage": "fetch"})
+
     notifications = newNotifications
     if not new:
         notifications = allNotifications
+    elif seenNotifications is not None:
+        # Notifications we failed to mark as read come back as new. Skip them before doing any work for them again
+        notifications = list(filter(lambda x: not seenNotifications.contains(accounts.current().key(x.notificationID)), newNotifications))
+        if len(notifications) != len(newNotifications):
+            logger.info(f"Skipping {len(newNotifications) - len(notifications)} already processed notifications")
 
     notifications.reverse()
     for notification in notifications:
         if new:
-            notificationMessage = bot.send_message(
-                chat_id=TARGET_CHAT_ID,
-                text=f"⚠️ ALERT ⚠️: [{notification.date}] {notification.text}",
-            )
+            # An abandoned run must not mark notifications as seen that the run replacing it still has to alert on
+            jobwatchdog.checkCancelled()
+            if seenNotifications is not None:
+                seenNotifications.add(accounts.current().key(notification.notificationID))
+            with metrics.timer("notification_stage_seconds", {"stage": "classify"}):
+                kind = classifyNotification(notification.text)
+            with metrics.timer("notification_stage_seconds", {"stage": "send"}):
+                notificationMessage = bot.send_message(
+                    chat_id=accounts.current().chatID,
+                    text=f"⚠️ ALERT ⚠️: [{notification.date}] {notification.text}",
+                )
+            observeDeliveryLatency(notification)
             logger.info(f"⚠️ ALERT ⚠️: [{notification.date}] {notification.text}")
-            notificationPostActions(bot, notification, notificationMessage)
+            with metrics.timer("notification_stage_seconds", {"stage": "post_actions"}):
+                notificationPostActions(bot, notification, notificationMessage, kind)
+            recordMessageRoute(notificationMessage, notification.fromUserID)
         else:
             bot.send_message(
-                chat_id=TARGET_CHAT_ID,
+                chat_id=accounts.current().chatID,
                 text=f"[{notification.date}] {notification.text}",
             )
 
@@ -388,23 +582,23 @@ def doNotifications(bot: telegram.Bot, new: bool) -> None:
 def authHandler(update: telegram.Update, context: telegram.ext.CallbackContext):
     if len(context.args) < 1:
         context.bot.send_message(
-            chat_id=TARGET_CHAT_ID,
+            chat_id=accounts.current().chatID,
             text=f"/auth needs an argument: {len(context.args)}",
         )
         logger.error(f"Invalid args for /auth: {context.args}")
         return
-    traderie.httpHeaders['authorization'] = ' '.join(context.args)
+    accounts.current().auth = ' '.join(context.args)
     context.bot.send_message(
-        chat_id=TARGET_CHAT_ID,
+        chat_id=accounts.current().chatID,
         text="Successfully set auth data",
     )
     logger.info("Successfully set auth data")
 
 
 def relistAllHandler(update: telegram.Update, context: telegram.ext.CallbackContext):
-    if traderie.httpHeaders['authorization'] == "":
+    if accounts.current().auth == "":
         context.bot.send_message(
-            chat_id=TARGET_CHAT_ID,
+            chat_id=accounts.current().chatID,
             text="Authentication data has not been set. Please do so with the /auth command",
         )
         return
@@ -412,61 +606,61 @@ def relistAllHandler(update: telegram.Update, context: telegram.ext.CallbackCont
 
 
 def notificationsHandler(update: telegram.Update, context: telegram.ext.CallbackContext):
-    if traderie.httpHeaders['authorization'] == "":
+    if accounts.current().auth == "":
         context.bot.send_message(
-            chat_id=TARGET_CHAT_ID,
+            chat_id=accounts.current().chatID,
             text="Authentication data has not been set. Please do so with the /auth command",
         )
         return
     doNotifications(context.bot, False)
     context.bot.send_message(
-        chat_id=TARGET_CHAT_ID,
+        chat_id=accounts.current().chatID,
         text="Finished listing notifications",
     )
 
 
 def relistTimeHandler(update: telegram.Update, context: telegram.ext.CallbackContext):
-    global relistTime
-
+    account = accounts.current()
     if len(context.args) > 1:
         context.bot.send_message(
-            chat_id=TARGET_CHAT_ID,
+            chat_id=accounts.current().chatID,
             text=f"Invalid arguments supplied to /relist_time: {len(context.args)}",
         )
         logger.error(f"Invalid args for /relist_time: {context.args}")
         return
     if len(context.args) == 0:
-        effectiveTime = calculateEffectiveRelistTime(relistTime)
+        effectiveTime = calculateEffectiveRelistTime(account.relistTime)
         context.bot.send_message(
-            chat_id=TARGET_CHAT_ID,
-            text=f"Current time for relisting: {relistTime.hour:02}:{relistTime.minute:02}\nEffective relisting time: {effectiveTime.hour:02}:{effectiveTime.minute:02}",
+            chat_id=accounts.current().chatID,
+            text=f"Current time for relisting: {account.relistTime.hour:02}:{account.relistTime.minute:02}\nEffective relisting time: {effectiveTime.hour:02}:{effectiveTime.minute:02}",
         )
         return
     try:
         newTime = datetime.time.fromisoformat(context.args[0])
-        relistTime = datetime.time(hour=newTime.hour, minute=newTime.minute, tzinfo=datetime.timezone.utc)
+        account.relistTime = datetime.time(hour=newTime.hour, minute=newTime.minute, tzinfo=datetime.timezone.utc)
+        saveAccountState("relistTime", f"{account.relistTime.hour:02}:{account.relistTime.minute:02}")
         context.bot.send_message(
-            chat_id=TARGET_CHAT_ID,
-            text=f"Successfully set new relist time to {relistTime.hour:02}:{relistTime.minute:02} UTC",
+            chat_id=accounts.current().chatID,
+            text=f"Successfully set new relist time to {account.relistTime.hour:02}:{account.relistTime.minute:02} UTC",
         )
     except ValueError:
         context.bot.send_message(
-            chat_id=TARGET_CHAT_ID,
+            chat_id=accounts.current().chatID,
             text="Invalid format. Needs to be HH:MM",
         )
         logger.error(f"Invalid time format for /relist_time: {context.args[0]}")
 
 
 def sendMessageHandler(update: telegram.Update, context: telegram.ext.CallbackContext):
-    if traderie.httpHeaders['authorization'] == "":
+    if accounts.current().auth == "":
         context.bot.send_message(
-            chat_id=TARGET_CHAT_ID,
+            chat_id=accounts.current().chatID,
             text="Authentication data has not been set. Please do so with the /auth command",
         )
         return
     if len(context.args) < 2:
         context.bot.send_message(
-            chat_id=TARGET_CHAT_ID,
+            chat_id=accounts.current().chatID,
             text=f"Incorrect arguments for /send_msg: {context.args}",
         )
         return
@@ -479,35 +673,23 @@ def callbackQueryHandler(update: telegram.Update, context: telegram.ext.Callback
     if action == "accept":
         query.edit_message_reply_markup(reply_markup=telegram.InlineKeyboardMarkup(inline_keyboard=[[]]))
         offerID = int(query.data.split(":")[1])
-        offers = traderie.getOffers(toSellerID=TRADERIE_SELLER_ID)
-        offer = offers.get(offerID)
+        offer = getOfferSnapshot(offerID)
         if offer is None:
             logger.error(f"Unable to find offer from callback data: {offerID}")
             context.bot.send_message(
-                chat_id=TARGET_CHAT_ID,
+                chat_id=accounts.current().chatID,
                 text=f"Unable to find offer from callback data: {offerID}",
             )
             return
-        res = traderie.acceptOffer(offer.offerID, offer.buyerID, offer.listingID, offer.amount, offer.itemID)
+        res = traderie.acceptOffer(offer["offerID"], offer["buyerID"], offer["listingID"], offer["amount"], offer["itemID"])
+        offerSnapshots.evict(str(offerID))
         if res is None:
             logger.info("Successfully accepted offer")
-            lst = traderie.getListing(offer.listingID)
-            greetingCallbackData = f"greeting:{offer.buyerUsername}"
-            if lst is None:
-                logger.error(f"Unable to find the listing the offer is about: {offer.listingID}")
-            else:
-                mode = DEFAULT_MODE
-                ladder = DEFAULT_LADDER
-                platform = DEFAULT_PLATFORM
-                if lst.properties.get("Mode") is not None:
-                    mode = lst.properties.get("Mode").value
-                if lst.properties.get("Ladder") is not None and lst.properties["Ladder"].value == "True":
-                    ladder = "LADDER"
-                if lst.properties.get("Platform") is not None:
-                    platform = lst.properties.get("Platform").value
-                greetingCallbackData += f":{platform}:{mode}:{ladder}"
+            greetingCallbackData = f"greeting:{offer['buyerUsername']}"
+            if offer["greeting"] is not None:
+                greetingCallbackData += f":{offer['greeting']}"
             context.bot.send_message(
-                chat_id=TARGET_CHAT_ID,
+                chat_id=accounts.current().chatID,
                 text="Successfully accepted offer",
                 reply_markup=telegram.InlineKeyboardMarkup(
                     inline_keyboard=[[
@@ -517,37 +699,37 @@ def callbackQueryHandler(update: telegram.Update, context: telegram.ext.Callback
             )
         else:
             context.bot.send_message(
-                chat_id=TARGET_CHAT_ID,
-                text=f"Unable to accept offer: {res}",
+                chat_id=accounts.current().chatID,
+                text=f"Unable to accept offer: {res}. It may have been withdrawn",
             )
             return
-        res = traderie.openConversation(offer.buyerID, offer.buyerUsername, offer.offerID)
+        res = traderie.openConversation(offer["buyerID"], offer["buyerUsername"], offer["offerID"])
         if res is not None:
-            logger.error("Unable to start conversation: {res}")
+            logger.error(f"Unable to start conversation: {res}")
 
     elif action == "decline":
         query.edit_message_reply_markup(reply_markup=telegram.InlineKeyboardMarkup(inline_keyboard=[[]]))
         offerID = int(query.data.split(":")[1])
-        offers = traderie.getOffers(toSellerID=TRADERIE_SELLER_ID)
-        offer = offers.get(offerID)
+        offer = getOfferSnapshot(offerID)
         if offer is None:
             logger.error(f"Unable to find offer from callback data: {offerID}")
             context.bot.send_message(
-                chat_id=TARGET_CHAT_ID,
+                chat_id=accounts.current().chatID,
                 text=f"Unable to find offer from callback data: {offerID}",
             )
             return
-        res = traderie.declineOffer(offer.offerID, offer.buyerID, offer.listingID)
+        res = traderie.declineOffer(offer["offerID"], offer["buyerID"], offer["listingID"])
+        offerSnapshots.evict(str(offerID))
         if res is None:
             logger.info("Successfully declined offer")
             context.bot.send_message(
-                chat_id=TARGET_CHAT_ID,
+                chat_id=accounts.current().chatID,
                 text="Successfully declined offer",
             )
         else:
             context.bot.send_message(
-                chat_id=TARGET_CHAT_ID,
-                text=f"Unable to decline offer: {res}",
+                chat_id=accounts.current().chatID,
+                text=f"Unable to decline offer: {res}. It may have been withdrawn",
             )
     elif action == "review":
         query.edit_message_reply_markup(reply_markup=telegram.InlineKeyboardMarkup(inline_keyboard=[[]]))
@@ -556,7 +738,7 @@ def callbackQueryHandler(update: telegram.Update, context: telegram.ext.Callback
         if res is not None:
             logger.error(f"Unable to send review: {res}")
             context.bot.send_message(
-                chat_id=TARGET_CHAT_ID,
+                chat_id=accounts.current().chatID,
                 text=f"Unable to send review: {res}"
             )
         else:
@@ -575,6 +757,10 @@ def callbackQueryHandler(update: telegram.Update, context: telegram.ext.Callback
 
 def messageHandler(update: telegram.Update, context: telegram.ext.CallbackContext) -> None:
     if update.message.reply_to_message is not None:
+        route = messageRoutes.get(accounts.current().key(str(update.message.reply_to_message.message_id)))
+        if route is not None:
+            doSendMessageToUser(context.bot, route[0], update.message.text)
+            return
         originalMessageText = update.message.reply_to_message.text
         if re.search("^Last messages from (.*?):$", originalMessageText.split("\n")[0]) is not None:
             username = re.search("^Last messages from (.*?):$", originalMessageText.split("\n")[0]).group(1)
@@ -589,19 +775,19 @@ def dcloneHandler(update: telegram.Update, context: telegram.ext.CallbackContext
     if len(context.args) != 0:
         if len(context.args) != 2:
             context.bot.send_message(
-                chat_id=TARGET_CHAT_ID,
+                chat_id=accounts.current().chatID,
                 text=f"Incorrect arguments for /dclone: {context.args}",
             )
             return
         if context.args[0] != "soft" and context.args[0] != "hard":
             context.bot.send_message(
-                chat_id=TARGET_CHAT_ID,
+                chat_id=accounts.current().chatID,
                 text=f"Incorrect first argument. Must be either 'hard' or 'soft': {context.args}",
             )
             return
         if context.args[1] != "ladder" and context.args[1] != "nonladder":
             context.bot.send_message(
-                chat_id=TARGET_CHAT_ID,
+                chat_id=accounts.current().chatID,
                 text=f"Incorrect second argument. Must be either 'ladder' or 'nonladder': {context.args}",
             )
             return
@@ -611,10 +797,15 @@ def dcloneHandler(update: telegram.Update, context: telegram.ext.CallbackContext
         if context.args[1] == "ladder":
             ladder = True
 
-    status = dclone.getDcloneStatus(softcore, ladder)
+    realm = dclone.getRealmKey(softcore, ladder)
+    latest = dcloneLatestStatus.get(realm)
+    if latest is not None and time.monotonic() - latest[0] < 2 * dclonePollingInterval:
+        status = latest[1]
+    else:
+        status = dclone.getDcloneStatus(softcore, ladder)
     if status is None:
         context.bot.send_message(
-            chat_id=TARGET_CHAT_ID,
+            chat_id=accounts.current().chatID,
             text="Unable to get dclone status. Check logs",
         )
         return
@@ -624,22 +815,135 @@ def dcloneHandler(update: telegram.Update, context: telegram.ext.CallbackContext
     if message == "":
         message = "No data!"
     context.bot.send_message(
-        chat_id=TARGET_CHAT_ID,
+        chat_id=accounts.current().chatID,
         text=message,
     )
 
 
+def dcloneAlertsHandler(update: telegram.Update, context: telegram.ext.CallbackContext) -> None:
+    account = accounts.current()
+    if len(context.args) != 0:
+        invalidRealms = [realm for realm in context.args if realm not in dclone.REALMS]
+        if len(invalidRealms) != 0:
+            context.bot.send_message(
+                chat_id=accounts.current().chatID,
+                text=f"Unknown realms: {' '.join(invalidRealms)}. Valid realms are: {' '.join(dclone.REALMS)}",
+            )
+            return
+        account.dcloneAlertRealms = set(context.args)
+        saveAccountState("dcloneAlertRealms", sorted(account.dcloneAlertRealms))
+    context.bot.send_message(
+        chat_id=accounts.current().chatID,
+        text=f"Dclone alerts enabled for: {' '.join(sorted(account.dcloneAlertRealms))}",
+    )
+
+
+def formatDuration(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f"{minutes}m"
+    return f"{minutes // 60}h {minutes % 60:02}m"
+
+
+def dcloneHistoryHandler(update: telegram.Update, context: telegram.ext.CallbackContext) -> None:
+    realm = dclone.getRealmKey(True, False)
+    if len(context.args) != 0:
+        if len(context.args) != 1 or context.args[0] not in dclone.REALMS:
+            context.bot.send_message(
+                chat_id=accounts.current().chatID,
+                text=f"Incorrect arguments for /dclone_history: {context.args}. Valid realms are: {' '.join(dclone.REALMS)}",
+            )
+            return
+        realm = context.args[0]
+    now = time.time()
+    message = ""
+    for region in dcloneHistory.getRegions(realm):
+        transitions = dcloneHistory.getTransitions(realm, region)
+        since, progress = transitions[-1]
+        message += f"{region}: {progress}/6 for {formatDuration(now - since)}"
+        eta = dcloneHistory.estimateTimeToWalk(realm, region)
+        if eta is not None:
+            message += f", estimated 6/6 in {formatDuration(eta)}"
+        changes = ", ".join(f"{p}/6 {formatDuration(now - t)} ago" for t, p in transitions[-4:-1])
+        if changes != "":
+            message += f" (previously {changes})"
+        message += "\n"
+    if message == "":
+        message = "No data!"
+    context.bot.send_message(
+        chat_id=accounts.current().chatID,
+        text=f"{realm}:\n{message}",
+    )
+
+
+def dcloneTrackersHandler(update: telegram.Update, context: telegram.ext.CallbackContext) -> None:
+    message = ""
+    for name, stats in dclone.getTrackerStats().items():
+        averageLatency = stats.averageLatency()
+        averageLatencyText = f"{averageLatency * 1000:.0f}ms" if averageLatency is not None else "N/A"
+        message += f"{name}: {stats.requests} requests, {stats.failures} failed, {stats.timeouts} timed out, {stats.throttled} throttled, {stats.disagreements} disagreements, avg latency {averageLatencyText}\n"
+    if message == "":
+        message = "No data!"
+    context.bot.send_message(
+        chat_id=accounts.current().chatID,
+        text=message,
+    )
+
+
+def statsHandler(update: telegram.Update, context: telegram.ext.CallbackContext) -> None:
+    lines = ["HTTP:"] + metrics.renderSummary("http_request_duration_seconds")
+    lines += ["HTTP errors:"] + metrics.renderErrorSummary("http_requests_total", "200")
+    lines += ["Telegram:"] + metrics.renderSummary("telegram_request_duration_seconds")
+    lines += ["Telegram errors:"] + metrics.renderErrorSummary("telegram_requests_total", "ok")
+    lines += ["Notification stages:"] + metrics.renderSummary("notification_stage_seconds")
+    lines += ["Notification delivery:"] + metrics.renderSummary("notification_delivery_seconds")
+    context.bot.send_message(
+        chat_id=accounts.current().chatID,
+        text="\n".join(lines),
+    )
+
+
+def profileHandler(update: telegram.Update, context: telegram.ext.CallbackContext) -> None:
+    if not profiler.isEnabled():
+        context.bot.send_message(
+            chat_id=accounts.current().chatID,
+            text="Profiling is disabled. Start the bot with --profile or --profile-mem",
+        )
+        return
+    paths = profiler.dump()
+    context.bot.send_message(
+        chat_id=accounts.current().chatID,
+        text=f"Profiles written to: {', '.join(paths)}",
+    )
+
+
+def badResponsesHandler(update: telegram.Update, context: telegram.ext.CallbackContext) -> None:
+    counts = responsecapture.responses.getCounts()
+    if len(counts) == 0:
+        context.bot.send_message(
+            chat_id=accounts.current().chatID,
+            text="No bad responses captured",
+        )
+        return
+    path = responsecapture.dump()
+    lines = [f"{endpoint}: {count}" for endpoint, count in sorted(counts.items())]
+    context.bot.send_message(
+        chat_id=accounts.current().chatID,
+        text=f"Captured responses written to {path}\n" + "\n".join(lines),
+    )
+
+
 def offersReceivedHandler(update: telegram.Update, context: telegram.ext.CallbackContext) -> None:
-    if traderie.httpHeaders['authorization'] == "":
+    if accounts.current().auth == "":
         context.bot.send_message(
-            chat_id=TARGET_CHAT_ID,
+            chat_id=accounts.current().chatID,
             text="Authentication data has not been set. Please do so with the /auth command",
         )
         return
-    offers = traderie.getOffers(toSellerID=TRADERIE_SELLER_ID)
+    offers = traderie.getOffers(toSellerID=accounts.current().sellerID)
     if len(offers) == 0:
         context.bot.send_message(
-            chat_id=TARGET_CHAT_ID,
+            chat_id=accounts.current().chatID,
             text="No offers received"
         )
         return
@@ -649,29 +953,29 @@ def offersReceivedHandler(update: telegram.Update, context: telegram.ext.Callbac
         if lst is None:
             logger.error(f"Can't find listing {offer.listingID} for offer {offer.offerID}")
             context.bot.send_message(
-                chat_id=TARGET_CHAT_ID,
+                chat_id=accounts.current().chatID,
                 text=f"Can't find listing {offer.listingID} for offer {offer.offerID}"
             )
             return
         offerStr = ' OR '.join(list(map(lambda x: str(x), offer.offer)))
         listingStr = ' OR '.join(list(map(lambda x: str(x), lst.price)))
         context.bot.send_message(
-            chat_id=TARGET_CHAT_ID,
+            chat_id=accounts.current().chatID,
             text=f"Offer for {offer.itemName} from {offer.buyerUsername}:\nTheir offer {offerStr}\nYour Price {listingStr}",
         )
 
 
 def offersSentHandler(update: telegram.Update, context: telegram.ext.CallbackContext) -> None:
-    if traderie.httpHeaders['authorization'] == "":
+    if accounts.current().auth == "":
         context.bot.send_message(
-            chat_id=TARGET_CHAT_ID,
+            chat_id=accounts.current().chatID,
             text="Authentication data has not been set. Please do so with the /auth command",
         )
         return
-    offers = traderie.getOffers(fromUserID=TRADERIE_SELLER_ID)
+    offers = traderie.getOffers(fromUserID=accounts.current().sellerID)
     if len(offers) == 0:
         context.bot.send_message(
-            chat_id=TARGET_CHAT_ID,
+            chat_id=accounts.current().chatID,
             text="No offers sent"
         )
         return
@@ -681,171 +985,364 @@ def offersSentHandler(update: telegram.Update, context: telegram.ext.CallbackCon
         if lst is None:
             logger.error(f"Can't find listing {offer.listingID} for offer {offer.offerID}")
             context.bot.send_message(
-                chat_id=TARGET_CHAT_ID,
+                chat_id=accounts.current().chatID,
                 text=f"Can't find listing {offer.listingID} for offer {offer.offerID}"
             )
             return
         offerStr = ' OR '.join(list(map(lambda x: str(x), offer.offer)))
         listingStr = ' OR '.join(list(map(lambda x: str(x), lst.price)))
         context.bot.send_message(
-            chat_id=TARGET_CHAT_ID,
+            chat_id=accounts.current().chatID,
             text=f"Offer for {offer.itemName} from {offer.sellerUsername}:\nYour offer {offerStr}\nTheir Price {listingStr}",
         )
 
 
 def telegramErrorHandler(update: telegram.Update, context: telegram.ext.CallbackContext) -> None:
     if context.error is not None:
-        logger.error(f"Error while getting updates (or running handler): {str(context.error)}")
-        logger.error(f"Stacktrace:\n{''.join(traceback.format_exception(type(context.error), context.error, context.error.__traceback__))}")
+        logger.error(f"Error while getting updates (or running handler): {str(context.error)}", exc_info=context.error)
         return
 
 
-def pollNotificationsLoop(bot: telegram.Bot, frequency: int) -> None:
-    global exitEvent
-    while not exitEvent.is_set():
-        if traderie.httpHeaders['authorization'] != "":
+def pollNotifications(bot: telegram.Bot) -> Optional[float]:
+    polled = False
+    for account in accounts.getAll():
+        with accounts.use(account):
+            if account.auth == "":
+                logger.warning(f"Skipping notification polling for {account.name} since auth data is unset")
+                continue
+            polled = True
             try:
                 doNotifications(bot, True)
             except telegram.error.NetworkError as e:
-                logger.error(f"Failed to read notifications: {str(e)}")
-                logger.error(f"Stacktrace:\n{traceback.format_exc()}")
-            exitEvent.wait(frequency)
-        else:
-            logger.warning("Skipping notification polling since auth data is unset")
-            exitEvent.wait(10)
-
-
-def relistLoop(bot: telegram.Bot) -> None:
-    global exitEvent
-    global relistTime
-    global offersPerDay
-
-    while not exitEvent.is_set():
-        if traderie.httpHeaders['authorization'] != "":
-            currentTime = datetime.datetime.utcnow()
-            effectiveTime = calculateEffectiveRelistTime(relistTime)
-            if currentTime.hour == effectiveTime.hour and currentTime.minute == effectiveTime.minute:
-                logger.info("Time to relist!")
-                try:
-                    if offersPerDay == 0:
-                        logger.warning("No offers in 24h! Notifying user...")
-                        bot.send_message(
-                            chat_id=TARGET_CHAT_ID,
-                            text="No offers received in 24h. Please check that everything is running correctly",
-                        )
-                    offersPerDay = 0
-                    doRelist(bot)
-                except telegram.error.NetworkError as e:
-                    logger.error(f"Failed to relist listings: {str(e)}")
-                    logger.error(f"Stacktrace:\n{traceback.format_exc()}")
-            exitEvent.wait(60)
-        else:
-            logger.warning("Skipping automatic relisting since auth data is unset")
-            exitEvent.wait(10)
+                logger.error(f"Failed to read notifications for {account.name}: {str(e)}", exc_info=True)
+    checkDeliveryLatency(bot)
+    return None if polled else 10
+
+
+def doScheduledRelist(bot: telegram.Bot) -> None:
+    account = accounts.current()
+    logger.info(f"Time to relist {account.name}!")
+    # Relists run outside of the job scheduler, but a hung one should still show up
+    with jobwatchdog.watch(jobwatchdog.Heartbeat(f"relist {account.name}", JOB_TIMEOUT)):
+        try:
+            if account.offersPerDay == 0:
+                logger.warning("No offers in 24h! Notifying user...")
+                bot.send_message(
+                    chat_id=accounts.current().chatID,
+                    text="No offers received in 24h. Please check that everything is running correctly",
+                )
+            account.offersPerDay = 0
+            saveAccountState("offersPerDay", account.offersPerDay)
+            doRelist(bot)
+        except telegram.error.NetworkError as e:
+            logger.error(f"Failed to relist listings: {str(e)}", exc_info=True)
+
+
+def checkRelistFinished(accountName: str, future: concurrent.futures.Future) -> None:
+    # Relists run outside of the job scheduler, so nothing else would ever see what they raised
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Uh oh, the relist of {accountName} failed", exc_info=future.exception())
+
+
+def checkRelists(bot: telegram.Bot) -> float:
+    polled = False
+    for account in accounts.getAll():
+        if account.auth == "":
+            logger.warning(f"Skipping automatic relisting for {account.name} since auth data is unset")
+            continue
+        polled = True
+        currentTime = datetime.datetime.utcnow()
+        effectiveTime = calculateEffectiveRelistTime(account.relistTime)
+        if currentTime.hour == effectiveTime.hour and currentTime.minute == effectiveTime.minute:
+            # A big relist takes minutes, running it here would make the next accounts miss their minute
+            with accounts.use(account):
+                future = relistExecutor.submit(contextvars.copy_context().run, doScheduledRelist, bot)
+            future.add_done_callback(lambda run, name=account.name: checkRelistFinished(name, run))
+    if not polled:
+        return 10
+    # Check again just after the next minute starts, so drift can never skip the relist minute or hit it twice
+    currentTime = datetime.datetime.utcnow()
+    return 61 - currentTime.second - currentTime.microsecond / 1000000
+
+
+def notifyDcloneChanges(bot: telegram.Bot, realm: str, status: Dict[str, int]) -> None:
+    previousStatus = dclonePreviousStatus.get(realm, {})
+    for region in status:
+        previous = previousStatus.get(region, 1)
+        if status[region] > previous:
+            dcloneText = f"{'❗' * (status[region] - 1)} Region {region} ({realm}) dclone status: {dclone.DCLONE_STATUS[status[region]]} {'❗' * (status[region] - 1)}"
+            bot.send_message(
+                chat_id=accounts.current().chatID,
+                text=dcloneText,
+            )
+            logger.info(dcloneText)
+        elif (status[region] < previous) and (previous != 6):
+            dcloneText = f"Region {region} ({realm}) dclone status went back to {status[region]}/6. Likely a false alarm"
+            bot.send_message(
+                chat_id=accounts.current().chatID,
+                text=dcloneText
+            )
+            logger.info(dcloneText)
 
 
-def dcloneLoop(bot: telegram.Bot, frequency: int) -> None:
-    global exitEvent
-    global dclonePreviousStatus
-    while not exitEvent.is_set():
-        status = dclone.getDcloneStatus(True, False)
+def applyDcloneStatuses(bot: telegram.Bot, statuses: Dict[str, Optional[Dict[str, int]]]) -> None:
+    for realm, status in statuses.items():
         if status is None:
-            logger.error("Unable to get dclone status")
-        else:
-            for region in status:
-                if status[region] > dclonePreviousStatus[region]:
-                    dcloneText = f"{'❗' * (status[region] - 1)} Region {region} dclone status: {dclone.DCLONE_STATUS[status[region]]} {'❗' * (status[region] - 1)}"
-                    bot.send_message(
-                        chat_id=TARGET_CHAT_ID,
-                        text=dcloneText,
-                    )
-                    logger.info(dcloneText)
-                elif (status[region] < dclonePreviousStatus[region]) and (dclonePreviousStatus[region] != 6):
-                    dcloneText = f"Region {region} dclone status went back to {status[region]}/6. Likely a false alarm"
-                    bot.send_message(
-                        chat_id=TARGET_CHAT_ID,
-                        text=dcloneText
-                    )
-                    logger.info(dcloneText)
-
-            dclonePreviousStatus = status
-        exitEvent.wait(frequency)
-
-
-def statusLoop(bot: telegram.Bot, frequency: int) -> None:
-    global exitEvent
-    while not exitEvent.is_set():
-        if traderie.httpHeaders['authorization'] != "":
-            status = traderie.getStatus(TRADERIE_SELLER_ID)
+            logger.error(f"Unable to get dclone status for {realm}")
+            continue
+        dcloneLatestStatus[realm] = (time.monotonic(), status)
+        dcloneHistory.record(realm, status)
+        for account in accounts.getAll():
+            if realm in account.dcloneAlertRealms:
+                with accounts.use(account):
+                    notifyDcloneChanges(bot, realm, status)
+        dclonePreviousStatus[realm] = status
+
+
+def getDclonePollingInterval(alertRealms: Set[str]) -> float:
+    # Poll as often as the most advanced of the given realms requires
+    progress = [max(dclonePreviousStatus[realm].values(), default=1) for realm in alertRealms if realm in dclonePreviousStatus]
+    return dclone.getPollingInterval(max(progress, default=None))
+
+
+def pollDclone(bot: telegram.Bot) -> float:
+    global dclonePollingInterval
+    applyDcloneStatuses(bot, dclone.getAllDcloneStatuses())
+    saveState("dclonePreviousStatus", dict(dclonePreviousStatus))
+    dclonePollingInterval = getDclonePollingInterval(set().union(*(account.dcloneAlertRealms for account in accounts.getAll())))
+    logger.debug(f"Next dclone poll in {dclonePollingInterval:.0f}s")
+    return dclonePollingInterval
+
+
+def feedDcloneStatuses(bot: telegram.Bot, dcloneSource: multiprocessing.Queue) -> float:
+    # Supervisor workers don't poll the trackers, they get every poll's results from the supervisor instead. The
+    # supervisor also keeps dclonePreviousStatus in the state store, so workers don't write it
+    global dclonePollingInterval
+    try:
+        statuses, dclonePollingInterval = dcloneSource.get(timeout=1)
+    except queue.Empty:
+        return 0
+    applyDcloneStatuses(bot, statuses)
+    return 0
+
+
+def pollStatus(bot: telegram.Bot) -> Optional[float]:
+    polled = False
+    for account in accounts.getAll():
+        with accounts.use(account):
+            if account.auth == "":
+                logger.warning(f"Skipping status polling for {account.name} since auth data is unset")
+                continue
+            polled = True
+            status = traderie.getStatus(account.sellerID)
             if status is None:
-                logger.error("Unable to get status")
+                logger.error(f"Unable to get status for {account.name}")
             elif status != "online":
-                logger.info(f"Status is {status}, switching to online")
+                logger.info(f"Status of {account.name} is {status}, switching to online")
                 res = traderie.setStatus("online")
                 if res is None:
                     logger.info("Successfully set status to online")
                 else:
                     logger.error("Unable to set status to online")
-            exitEvent.wait(frequency)
-        else:
-            logger.warning("Skipping status polling since auth data is unset")
-            exitEvent.wait(10)
+    return None if polled else 10
+
+
+def getSnapshotPath(name: str) -> str:
+    return os.path.join(DATA_DIR, SNAPSHOT_DIR, name)
+
+
+def loadSnapshots() -> None:
+    userCache.loadSnapshot(getSnapshotPath(USER_CACHE_SNAPSHOT))
+    conversationCache.loadSnapshot(getSnapshotPath(CONVERSATION_CACHE_SNAPSHOT))
+    messageRoutes.loadSnapshot(getSnapshotPath(MESSAGE_ROUTES_SNAPSHOT))
+    offerSnapshots.loadSnapshot(getSnapshotPath(OFFER_SNAPSHOTS_SNAPSHOT))
+    dcloneHistory.load(getSnapshotPath(DCLONE_HISTORY_SNAPSHOT))
+
+
+def saveSnapshots() -> None:
+    os.makedirs(os.path.join(DATA_DIR, SNAPSHOT_DIR), exist_ok=True)
+    userCache.saveSnapshot(getSnapshotPath(USER_CACHE_SNAPSHOT))
+    conversationCache.saveSnapshot(getSnapshotPath(CONVERSATION_CACHE_SNAPSHOT))
+    messageRoutes.saveSnapshot(getSnapshotPath(MESSAGE_ROUTES_SNAPSHOT))
+    offerSnapshots.saveSnapshot(getSnapshotPath(OFFER_SNAPSHOTS_SNAPSHOT))
+    dcloneHistory.save(getSnapshotPath(DCLONE_HISTORY_SNAPSHOT))
+
+
+def loadAccounts() -> None:
+    accounts.clear()
+    if len(ACCOUNTS) == 0:
+        accounts.register(accounts.Account(name=accounts.DEFAULT_ACCOUNT, chatID=TARGET_CHAT_ID, sellerID=TRADERIE_SELLER_ID, auth=TRADERIE_AUTH))
+        return
+    for entry in ACCOUNTS:
+        accounts.register(accounts.Account(name=entry["name"], chatID=entry["chat_id"], sellerID=entry["seller_id"], auth=entry.get("auth", "")))
+    logger.info(f"Running {len(ACCOUNTS)} accounts: {', '.join(entry['name'] for entry in ACCOUNTS)}")
+
+
+def loadAccountState(account: accounts.Account) -> None:
+    account.offersPerDay = stateStore.get(account.key("offersPerDay"), account.offersPerDay)
+    # Defaults are read here rather than at import since the config file may have changed them
+    newTime = datetime.time(hour=DEFAULT_RELIST_TIME_HOUR, minute=DEFAULT_RELIST_TIME_MINUTE)
+    storedRelistTime = stateStore.get(account.key("relistTime"))
+    if storedRelistTime is not None:
+        newTime = datetime.time.fromisoformat(storedRelistTime)
+    account.relistTime = datetime.time(hour=newTime.hour, minute=newTime.minute, tzinfo=datetime.timezone.utc)
+    account.dcloneAlertRealms = set(stateStore.get(account.key("dcloneAlertRealms"), DCLONE_ALERT_REALMS))
+
+
+def loadState() -> None:
+    global stateStore
+
+    stateStore = statestore.StateStore(os.path.join(DATA_DIR, STATE_DB))
+    for account in accounts.getAll():
+        loadAccountState(account)
+    dclonePreviousStatus.update(stateStore.get("dclonePreviousStatus", {}))
+
+
+def flushState() -> None:
+    stateStore.flush()
+    if seenNotifications is not None:
+        seenNotifications.flush()
+    if userDirectory is not None:
+        userDirectory.flush()
 
 
 def initBot(bot: telegram.Bot) -> None:
     bot.send_message(
-        chat_id=TARGET_CHAT_ID,
+        chat_id=accounts.current().chatID,
         text="Hello! Please input the authorization header using the /auth command, following the example below",
     )
     bot.send_message(
-        chat_id=TARGET_CHAT_ID,
+        chat_id=accounts.current().chatID,
         text="/auth AUTH_HEADER_DATA",
     )
 
 
-def start() -> None:
-    updater = telegram.ext.Updater(token=APIKEY, use_context=True)
+def withAccount(handler: Callable) -> Callable:
+    # Runs a Telegram handler as the account whose chat the update came from
+    def accountHandler(update: telegram.Update, context: telegram.ext.CallbackContext) -> None:
+        account = None
+        if update is not None and update.effective_chat is not None:
+            account = accounts.forChat(update.effective_chat.id)
+        if account is None:
+            allAccounts = accounts.getAll()
+            if len(allAccounts) != 1:
+                logger.warning(f"Ignoring update from unknown chat: {update.effective_chat.id if update is not None and update.effective_chat is not None else None}")
+                return
+            # With a single account, keep answering wherever the command came from
+            account = allAccounts[0]
+        with accounts.use(account):
+            handler(update, context)
+    return accountHandler
+
+
+def feedUpdates(bot: telegram.Bot, updateQueue, updateSource: multiprocessing.Queue) -> float:
+    # Blocks for at most a second so stopping doesn't wait on it
+    try:
+        data = updateSource.get(timeout=1)
+    except queue.Empty:
+        return 0
+    updateQueue.put(telegram.Update.de_json(data, bot))
+    return 0
+
+
+def startUpdater(meteredBot: MeteredBot, updateSource: Optional[multiprocessing.Queue] = None) -> telegram.ext.Updater:
+    # telegram.ext pulls in tornado and apscheduler, which is most of our import time. Nothing before the first
+    # poll needs it
+    import telegram.ext
+
+    updater = telegram.ext.Updater(bot=meteredBot, use_context=True)
     dispatcher = updater.dispatcher
-    dispatcher.add_handler(telegram.ext.CommandHandler('help', helpHandler))
-    dispatcher.add_handler(telegram.ext.CommandHandler('relist_all', relistAllHandler))
-    dispatcher.add_handler(telegram.ext.CommandHandler('auth', authHandler))
-    dispatcher.add_handler(telegram.ext.CommandHandler('notifications', notificationsHandler))
-    dispatcher.add_handler(telegram.ext.CommandHandler('relist_time', relistTimeHandler))
-    dispatcher.add_handler(telegram.ext.CommandHandler('send_msg', sendMessageHandler))
-    dispatcher.add_handler(telegram.ext.CommandHandler('offers_recv', offersReceivedHandler))
-    dispatcher.add_handler(telegram.ext.CommandHandler('offers_sent', offersSentHandler))
-    dispatcher.add_handler(telegram.ext.CommandHandler('dclone', dcloneHandler))
-    dispatcher.add_handler(telegram.ext.CallbackQueryHandler(callbackQueryHandler))
+    dispatcher.add_handler(telegram.ext.CommandHandler('help', withAccount(helpHandler)))
+    dispatcher.add_handler(telegram.ext.CommandHandler('relist_all', withAccount(relistAllHandler)))
+    dispatcher.add_handler(telegram.ext.CommandHandler('auth', withAccount(authHandler)))
+    dispatcher.add_handler(telegram.ext.CommandHandler('notifications', withAccount(notificationsHandler)))
+    dispatcher.add_handler(telegram.ext.CommandHandler('relist_time', withAccount(relistTimeHandler)))
+    dispatcher.add_handler(telegram.ext.CommandHandler('send_msg', withAccount(sendMessageHandler)))
+    dispatcher.add_handler(telegram.ext.CommandHandler('offers_recv', withAccount(offersReceivedHandler)))
+    dispatcher.add_handler(telegram.ext.CommandHandler('offers_sent', withAccount(offersSentHandler)))
+    dispatcher.add_handler(telegram.ext.CommandHandler('dclone', withAccount(dcloneHandler)))
+    dispatcher.add_handler(telegram.ext.CommandHandler('dclone_alerts', withAccount(dcloneAlertsHandler)))
+    dispatcher.add_handler(telegram.ext.CommandHandler('dclone_history', withAccount(dcloneHistoryHandler)))
+    dispatcher.add_handler(telegram.ext.CommandHandler('dclone_trackers', withAccount(dcloneTrackersHandler)))
+    dispatcher.add_handler(telegram.ext.CommandHandler('stats', withAccount(statsHandler)))
+    dispatcher.add_handler(telegram.ext.CommandHandler('profile', withAccount(profileHandler)))
+    dispatcher.add_handler(telegram.ext.CommandHandler('bad_responses', withAccount(badResponsesHandler)))
+    dispatcher.add_handler(telegram.ext.CallbackQueryHandler(withAccount(callbackQueryHandler)))
     dispatcher.add_error_handler(telegramErrorHandler)
-    dispatcher.add_handler(telegram.ext.MessageHandler(telegram.ext.Filters.all, messageHandler))
-    updater.start_polling()
-    initBot(updater.bot)
-
-    threadMap = {
-        "status_thread": startStatusThread,
-        "notification_thread": startNotificationThread,
-        "relist_thread": startRelistThread,
-        "dclone_thread": startDcloneThread,
-    }
+    dispatcher.add_handler(telegram.ext.MessageHandler(telegram.ext.Filters.all, withAccount(messageHandler)))
+    if updateSource is None:
+        updater.start_polling()
+    else:
+        # A bot token can only have one getUpdates consumer, so supervisor workers get theirs from the supervisor
+        dispatcherThread = threading.Thread(target=dispatcher.start)
+        dispatcherThread.name = "dispatcher_thread"
+        dispatcherThread.start()
+    return updater
+
+
+def startTelegram(meteredBot: MeteredBot, updateSource: Optional[multiprocessing.Queue]) -> telegram.ext.Updater:
+    updater = startUpdater(meteredBot, updateSource)
+    for account in accounts.getAll():
+        if account.auth == "":
+            with accounts.use(account):
+                initBot(meteredBot)
+    return updater
+
+
+def checkTelegramStarted(updaterFuture: concurrent.futures.Future) -> None:
+    # Without Telegram there's nobody to alert, so don't keep polling for nothing
+    if updaterFuture.exception() is not None:
+        logger.error("Unable to start the Telegram updater. Shutting down", exc_info=updaterFuture.exception())
+        stop()
+
+
+def scheduleJobs(bot: telegram.Bot, updaterFuture: concurrent.futures.Future, updateSource: Optional[multiprocessing.Queue], dcloneSource: Optional[multiprocessing.Queue]) -> None:
+    jobScheduler.add(scheduler.Job("status", lambda: pollStatus(bot), STATUS_INTERVAL, jitter=0.1, timeout=JOB_TIMEOUT))
+    jobScheduler.add(scheduler.Job("notifications", lambda: pollNotifications(bot), NOTIFICATION_POLLING_INTERVAL, jitter=0.1, timeout=JOB_TIMEOUT))
+    # checkRelists times itself to the minute, and getPollingInterval already adds jitter
+    jobScheduler.add(scheduler.Job("relist", lambda: checkRelists(bot), 60, timeout=JOB_TIMEOUT))
+    if dcloneSource is None:
+        jobScheduler.add(scheduler.Job("dclone", lambda: pollDclone(bot), dclonePollingInterval, timeout=JOB_TIMEOUT))
+    else:
+        jobScheduler.add(scheduler.Job("dclone_feed", lambda: feedDcloneStatuses(bot, dcloneSource), 0, timeout=JOB_TIMEOUT))
+    jobScheduler.add(scheduler.Job("snapshot", saveSnapshots, CACHE_SNAPSHOT_INTERVAL, timeout=JOB_TIMEOUT, runAtStart=False))
+    jobScheduler.add(scheduler.Job("state", flushState, STATE_FLUSH_INTERVAL, timeout=JOB_TIMEOUT, runAtStart=False))
+    if updateSource is not None:
+        jobScheduler.add(scheduler.Job("update_feed", lambda: feedUpdates(bot, updaterFuture.result().update_queue, updateSource), 0))
+
+
+def start(updateSource: Optional[multiprocessing.Queue] = None, dcloneSource: Optional[multiprocessing.Queue] = None) -> None:
+    global userDirectory
+    global seenNotifications
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    loadAccounts()
+    loadSnapshots()
+    loadState()
+    userDirectory = userdirectory.UserDirectory(os.path.join(DATA_DIR, USER_DIRECTORY_DB))
+    traderie.userObservers.append(userDirectory.record)
+    # Lives next to the rest of the state, and is written by the same flush job
+    seenNotifications = seenindex.SeenIndex(os.path.join(DATA_DIR, STATE_DB))
+    if METRICS_PORT != 0:
+        metrics.startHTTPServer(METRICS_PORT)
+    meteredBot = MeteredBot(token=APIKEY, base_url=TELEGRAM_API_URL, request=telegram.utils.request.Request(con_pool_size=8))
+
+    # Telegram goes to a job thread so the first poll doesn't wait for telegram.ext to import
+    updaterFuture = scheduler.runInThread("telegram_start_thread", startTelegram, meteredBot, updateSource)
+    updaterFuture.add_done_callback(checkTelegramStarted)
+    scheduleJobs(meteredBot, updaterFuture, updateSource, dcloneSource)
+    jobScheduler.start()
+    logger.info("Jobs stopped!")
+
+    # Last flush, so nothing done since the previous one is lost
+    saveSnapshots()
+    flushState()
+    if updaterFuture.exception() is None:
+        logger.info("Stopping updater...")
+        updaterFuture.result().stop()
+    logger.info("Shutting down...")
 
-    startStatusThread(updater.bot)
-    startNotificationThread(updater.bot)
-    startRelistThread(updater.bot)
-    startDcloneThread(updater.bot)
-
-    monitoringThread = threading.Thread(target=monitoringLoop, args=(updater.bot, threadMap))
-    monitoringThread.start()
-
-    while True:
-        monitoringThread.join()
-        logger.info("Monitoring thread shutdown!")
-        if not exitEvent.is_set():
-            logger.error("Monitoring thread exited WITHOUT shutdown being triggered. This is real bad. Restarting thread...")
-            monitoringThread = threading.Thread(target=monitoringLoop, args=(updater.bot, threadMap))
-            monitoringThread.start()
-        else:
-            break
 
-    logger.info("Stopping updater...")
-    updater.stop()
-    logger.info("Shutting down...")
+def stop() -> None:
+    exitEvent.set()
+    jobScheduler.stop()
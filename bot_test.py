@@ -0,0 +1,341 @@
+###########################################################################
+#   bot_test.py  --  This file is part of traderie-bot.                   #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import concurrent.futures
+import datetime
+import queue
+import unittest
+from unittest import mock
+
+import requests
+
+import accounts
+import bot
+import lru
+import metrics
+import traderie
+
+
+class TestNotifications(unittest.TestCase):
+    def testClassify(self):
+        self.assertEqual(bot.classifyNotification("You got a new message from bob"), "message")
+        self.assertEqual(bot.classifyNotification("bob made an offer for your Shako"), "offer")
+        self.assertEqual(bot.classifyNotification("bob completed their offer for your Shako. Leave them a review"), "completed")
+        self.assertEqual(bot.classifyNotification("You just got a 5 star review from bob"), "review")
+        self.assertEqual(bot.classifyNotification("You have a chat request from bob"), "chat_request")
+        self.assertEqual(bot.classifyNotification("Your listing expired"), None)
+
+
+class TestDeliveryLatency(unittest.TestCase):
+    def setUp(self):
+        accounts.clear()
+        accounts.register(accounts.Account(name=accounts.DEFAULT_ACCOUNT, chatID=1, sellerID=10, auth="token"))
+        accounts.register(accounts.Account(name="alt", chatID=2, sellerID=20, auth="alt-token"))
+        self.bot = mock.Mock()
+        bot.lastLatencyAlert = 0.0
+        bot.recentDeliveryLatency = metrics.WindowedHistogram(bot.NOTIFICATION_LATENCY_WINDOW)
+
+    def tearDown(self):
+        accounts.clear()
+
+    def check(self):
+        # Runs from the notifications job, outside of any account
+        self.assertIsNone(accounts.getCurrent())
+        bot.checkDeliveryLatency(self.bot)
+
+    def alertedChats(self):
+        return [call.kwargs["chat_id"] for call in self.bot.send_message.call_args_list]
+
+    @mock.patch('bot.time.monotonic')
+    def testThresholdAndCooldown(self, monotonic):
+        monotonic.return_value = 100000.0
+        self.check()
+        for _ in range(20):
+            bot.recentDeliveryLatency.observe(1.0)
+        self.check()
+        self.bot.send_message.assert_not_called()
+
+        for _ in range(5):
+            bot.recentDeliveryLatency.observe(bot.NOTIFICATION_LATENCY_P95_THRESHOLD * 2)
+        self.check()
+        self.assertEqual(self.alertedChats(), [1, 2])
+        monotonic.return_value += bot.NOTIFICATION_LATENCY_ALERT_COOLDOWN / 2
+        self.check()
+        self.assertEqual(self.alertedChats(), [1, 2])
+
+    # Also moves the clock of the latency window, since both modules share the time module
+    @mock.patch('bot.time.monotonic')
+    def testSlowBurstAgesOut(self, monotonic):
+        monotonic.return_value = 100000.0
+        for _ in range(5):
+            bot.recentDeliveryLatency.observe(bot.NOTIFICATION_LATENCY_P95_THRESHOLD * 2)
+        self.check()
+        self.assertEqual(self.alertedChats(), [1, 2])
+        # Past the cooldown, but the burst has left the window too
+        monotonic.return_value = 100000.0 + max(bot.NOTIFICATION_LATENCY_ALERT_COOLDOWN, bot.NOTIFICATION_LATENCY_WINDOW) * 2
+        bot.recentDeliveryLatency.observe(1.0)
+        self.check()
+        self.assertEqual(self.alertedChats(), [1, 2])
+
+
+class TestNotificationPolling(unittest.TestCase):
+    def setUp(self):
+        accounts.clear()
+        accounts.register(accounts.Account(name=accounts.DEFAULT_ACCOUNT, chatID=1, sellerID=10, auth="slow-token"))
+        accounts.register(accounts.Account(name="alt", chatID=2, sellerID=20, auth="alt-token"))
+        self.bot = mock.Mock()
+
+    def tearDown(self):
+        accounts.clear()
+
+    @mock.patch('bot.checkDeliveryLatency')
+    @mock.patch('bot.seenNotifications', None)
+    def testReadTimeoutOnlyAffectsItsAccount(self, checkDeliveryLatency):
+        polled = []
+
+        def request(endpoint, method, url, **kwargs):
+            polled.append(kwargs["headers"]["authorization"])
+            if kwargs["headers"]["authorization"] == "slow-token":
+                raise requests.exceptions.ReadTimeout("read timed out")
+            response = requests.Response()
+            response.status_code = 200
+            response._content = b'{"notifications": []}'
+            return response
+
+        with mock.patch('httpclient.request', side_effect=request):
+            bot.pollNotifications(self.bot)
+        self.assertEqual(polled, ["slow-token", "alt-token"])
+        self.assertEqual([call.kwargs["chat_id"] for call in self.bot.send_message.call_args_list], [1])
+        checkDeliveryLatency.assert_called_once_with(self.bot)
+
+
+class TestDcloneFeed(unittest.TestCase):
+    def setUp(self):
+        accounts.clear()
+        accounts.register(accounts.Account(name=accounts.DEFAULT_ACCOUNT, chatID=1, sellerID=10, dcloneAlertRealms={"softcore-nonladder"}))
+        accounts.register(accounts.Account(name="alt", chatID=2, sellerID=20, dcloneAlertRealms={"hardcore-ladder"}))
+        self.bot = mock.Mock()
+
+    def tearDown(self):
+        accounts.clear()
+
+    @mock.patch.dict('bot.dclonePreviousStatus', {"softcore-nonladder": {"Americas": 4}, "hardcore-ladder": {"Americas": 4}})
+    @mock.patch('bot.dclonePollingInterval', 60.0)
+    def testFeedAlertsOwningAccounts(self):
+        source = queue.Queue()
+        self.assertEqual(bot.feedDcloneStatuses(self.bot, source), 0)
+        source.put(({"softcore-nonladder": {"Americas": 5}, "hardcore-ladder": {"Americas": 4}}, 20.0))
+        with mock.patch('dclone.getAllDcloneStatuses') as poll:
+            bot.feedDcloneStatuses(self.bot, source)
+        # Workers never go to the trackers themselves
+        poll.assert_not_called()
+        self.assertEqual([call.kwargs["chat_id"] for call in self.bot.send_message.call_args_list], [1])
+        self.assertEqual(bot.dclonePreviousStatus["softcore-nonladder"], {"Americas": 5})
+        self.assertEqual(bot.dclonePollingInterval, 20.0)
+
+
+class TestRelist(unittest.TestCase):
+    def setUp(self):
+        accounts.clear()
+        accounts.register(accounts.Account(name=accounts.DEFAULT_ACCOUNT, chatID=1, sellerID=10, auth="token"))
+        self.bot = mock.Mock()
+
+    def tearDown(self):
+        bot.exitEvent.clear()
+        accounts.clear()
+
+    @mock.patch('traderie.isListingRelistable', return_value=True)
+    @mock.patch('traderie.getAllListings')
+    def testStopsOnShutdown(self, getAllListings, isListingRelistable):
+        getAllListings.return_value = {listingID: mock.Mock(listingID=listingID) for listingID in range(5)}
+
+        def relistItem(listingID):
+            bot.exitEvent.set()
+
+        with mock.patch('traderie.relistItem', side_effect=relistItem) as relist, accounts.use(accounts.forChat(1)):
+            bot.doRelist(self.bot)
+        relist.assert_called_once_with(0)
+        self.bot.send_message.assert_not_called()
+
+    @mock.patch('bot.calculateEffectiveRelistTime', return_value=datetime.time(19, 0))
+    @mock.patch('bot.doScheduledRelist', side_effect=RuntimeError("boom"))
+    @mock.patch('bot.relistExecutor')
+    def testFailureIsLogged(self, relistExecutor, doScheduledRelist, calculateEffectiveRelistTime):
+        def submit(func, *args):
+            future = concurrent.futures.Future()
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        relistExecutor.submit.side_effect = submit
+        relistMinute = datetime.datetime(2022, 1, 1, 19, 0, 30)
+        with mock.patch('bot.datetime.datetime') as now, self.assertLogs(bot.logger, "ERROR") as logs:
+            now.utcnow.return_value = relistMinute
+            bot.checkRelists(self.bot)
+        doScheduledRelist.assert_called_once_with(self.bot)
+        self.assertIn(f"the relist of {accounts.DEFAULT_ACCOUNT} failed", logs.output[0])
+        self.assertIn("RuntimeError: boom", logs.output[0])
+
+
+class TestReplyRouting(unittest.TestCase):
+    def setUp(self):
+        for patch in [
+            mock.patch('bot.userDirectory', None),
+            mock.patch('bot.userCache', lru.LRUCache(10)),
+            mock.patch('bot.messageRoutes', lru.LRUCache(10)),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+        accounts.clear()
+        accounts.register(accounts.Account(name=accounts.DEFAULT_ACCOUNT, chatID=1, sellerID=10, auth="token"))
+        accounts.register(accounts.Account(name="alt", chatID=2, sellerID=20, auth="alt-token"))
+        self.context = mock.Mock()
+
+    def tearDown(self):
+        accounts.clear()
+
+    def reply(self, chatID: int, messageID: int, originalText: str, text: str) -> None:
+        update = mock.Mock()
+        update.message.text = text
+        update.message.reply_to_message.message_id = messageID
+        update.message.reply_to_message.text = originalText
+        with accounts.use(accounts.forChat(chatID)):
+            bot.messageHandler(update, self.context)
+
+    @mock.patch('traderie.searchUser')
+    @mock.patch('traderie.sendMessage', return_value=None)
+    def testRouteHit(self, sendMessage, searchUser):
+        with accounts.use(accounts.forChat(1)):
+            bot.recordMessageRoute(mock.Mock(message_id=100), 55)
+        # The route wins over the username in the text
+        self.reply(1, 100, "Last messages from bob:\nhello", "hi")
+        sendMessage.assert_called_once_with(55, "hi")
+        searchUser.assert_not_called()
+        self.context.bot.send_message.assert_not_called()
+
+    @mock.patch('traderie.searchUser', return_value=77)
+    @mock.patch('traderie.sendMessage', return_value=None)
+    def testRegexFallback(self, sendMessage, searchUser):
+        with accounts.use(accounts.forChat(1)):
+            bot.recordMessageRoute(mock.Mock(message_id=100), 55)
+        # Routes belong to the chat of the account that recorded them
+        self.reply(2, 100, "Last messages from bob:\nhello", "hi")
+        searchUser.assert_called_once_with("bob")
+        sendMessage.assert_called_once_with(77, "hi")
+        # Found users are remembered
+        self.reply(2, 101, "Last messages from bob:\nhello", "again")
+        searchUser.assert_called_once_with("bob")
+        sendMessage.assert_called_with(77, "again")
+
+    @mock.patch('traderie.searchUser')
+    @mock.patch('traderie.sendMessage')
+    def testUnknownReply(self, sendMessage, searchUser):
+        self.reply(1, 100, "All listings (3) refreshed successfully!", "hi")
+        sendMessage.assert_not_called()
+        searchUser.assert_not_called()
+
+
+class TestOfferCallbacks(unittest.TestCase):
+    def setUp(self):
+        for patch in [
+            mock.patch('bot.offerSnapshots', lru.LRUCache(10)),
+            mock.patch('traderie.getListing', return_value=None),
+            mock.patch('traderie.openConversation', return_value=None),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+        accounts.clear()
+        accounts.register(accounts.Account(name=accounts.DEFAULT_ACCOUNT, chatID=1, sellerID=10, auth="token"))
+        self.context = mock.Mock()
+        self.offer = traderie.Offer(
+            itemName="Shako", offerID=5, listingID=7, sellerID=10, sellerUsername="me", buyerID=55, buyerUsername="bob",
+            offer=[], amount=2, itemID=9,
+        )
+
+    def tearDown(self):
+        accounts.clear()
+
+    def press(self, data: str) -> None:
+        update = mock.Mock()
+        update.callback_query.data = data
+        with accounts.use(accounts.forChat(1)):
+            bot.callbackQueryHandler(update, self.context)
+
+    def sentTexts(self):
+        return [call.kwargs["text"] for call in self.context.bot.send_message.call_args_list]
+
+    @mock.patch('traderie.getOffers')
+    @mock.patch('traderie.acceptOffer', return_value=None)
+    def testAcceptFromSnapshot(self, acceptOffer, getOffers):
+        bot.recordOfferSnapshot(self.offer, None)
+        self.press("accept:5")
+        acceptOffer.assert_called_once_with(5, 55, 7, 2, 9)
+        getOffers.assert_not_called()
+        self.assertEqual(self.sentTexts(), ["Successfully accepted offer"])
+        self.assertIsNone(bot.offerSnapshots.get("5"))
+
+    @mock.patch('traderie.getOffers')
+    @mock.patch('traderie.declineOffer', return_value=None)
+    def testDeclineFromSnapshot(self, declineOffer, getOffers):
+        bot.recordOfferSnapshot(self.offer, None)
+        self.press("decline:5")
+        declineOffer.assert_called_once_with(5, 55, 7)
+        getOffers.assert_not_called()
+        self.assertEqual(self.sentTexts(), ["Successfully declined offer"])
+
+    @mock.patch('traderie.getOffers')
+    @mock.patch('traderie.acceptOffer', return_value=None)
+    def testMissingSnapshotFetchesOffers(self, acceptOffer, getOffers):
+        getOffers.return_value = {5: self.offer}
+        self.press("accept:5")
+        getOffers.assert_called_once_with(toSellerID=10)
+        acceptOffer.assert_called_once_with(5, 55, 7, 2, 9)
+
+    @mock.patch('traderie.getOffers')
+    @mock.patch('traderie.declineOffer', return_value=None)
+    def testExpiredSnapshotFetchesOffers(self, declineOffer, getOffers):
+        bot.offerSnapshots.put("5", {"offerID": 5, "buyerID": 0, "listingID": 0}, ttl=0)
+        getOffers.return_value = {5: self.offer}
+        self.press("decline:5")
+        getOffers.assert_called_once_with(toSellerID=10)
+        declineOffer.assert_called_once_with(5, 55, 7)
+
+    @mock.patch('traderie.getOffers', return_value={})
+    @mock.patch('traderie.acceptOffer')
+    def testStaleOffer(self, acceptOffer, getOffers):
+        self.press("accept:5")
+        acceptOffer.assert_not_called()
+        self.assertEqual(self.sentTexts(), ["Unable to find offer from callback data: 5"])
+
+    @mock.patch('traderie.getOffers')
+    @mock.patch('traderie.acceptOffer', return_value="Offer not found")
+    def testWithdrawnOffer(self, acceptOffer, getOffers):
+        bot.recordOfferSnapshot(self.offer, None)
+        self.press("accept:5")
+        acceptOffer.assert_called_once()
+        getOffers.assert_not_called()
+        traderie.openConversation.assert_not_called()
+        self.assertEqual(self.sentTexts(), ["Unable to accept offer: Offer not found. It may have been withdrawn"])
+
+
+if __name__ == '__main__':
+    unittest.main()
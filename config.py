@@ -0,0 +1,158 @@
+###########################################################################
+#   config.py  --  This file is part of traderie-bot.                     #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+# Reads settings from an INI file and TRADERIE_BOT_* environment variables and applies them over the module constants.
+# Environment variables win over the file, the file wins over the defaults in the code
+
+import configparser
+import importlib
+import os
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+import log
+
+# Constants
+CONFIG_SECTION = "bot"
+# Each [account:NAME] section adds a seller account to bot.ACCOUNTS
+ACCOUNT_SECTION_PREFIX = "account:"
+DEFAULT_CONFIG_FILE = "config.ini"
+ENV_PREFIX = "TRADERIE_BOT_"
+
+
+def parseList(value: str) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip() != ""]
+
+
+# Setting -> (module, constant or dotted attribute path, parser)
+SETTINGS: Dict[str, Tuple[str, str, Callable[[str], Any]]] = {
+    "api_key": ("bot", "APIKEY", str),
+    "target_chat_id": ("bot", "TARGET_CHAT_ID", int),
+    "traderie_seller_id": ("bot", "TRADERIE_SELLER_ID", int),
+    "traderie_auth": ("bot", "TRADERIE_AUTH", str),
+    "notification_polling_interval": ("bot", "NOTIFICATION_POLLING_INTERVAL", int),
+    "status_interval": ("bot", "STATUS_INTERVAL", int),
+    "dclone_alert_realms": ("bot", "DCLONE_ALERT_REALMS", parseList),
+    "max_messages_fetch": ("bot", "MAX_MESSAGES_FETCH", int),
+    "cache_snapshot_interval": ("bot", "CACHE_SNAPSHOT_INTERVAL", int),
+    "state_flush_interval": ("bot", "STATE_FLUSH_INTERVAL", int),
+    "metrics_port": ("bot", "METRICS_PORT", int),
+    "notification_latency_p95_threshold": ("bot", "NOTIFICATION_LATENCY_P95_THRESHOLD", int),
+    "data_dir": ("bot", "DATA_DIR", str),
+    "relist_time_hour": ("bot", "DEFAULT_RELIST_TIME_HOUR", int),
+    "relist_time_minute": ("bot", "DEFAULT_RELIST_TIME_MINUTE", int),
+    "greeting_text": ("bot", "GREETING_TEXT", str),
+    "telegram_api_url": ("bot", "TELEGRAM_API_URL", str),
+    "traderie_api_url": ("traderie", "API_BASE_URL", str),
+    "hedge_budget": ("httpclient", "HEDGE_BUDGET", float),
+    "dclone_d2runewizard_url": ("dclone", "DcloneTracker1.url", str),
+    "dclone_diablo2io_url": ("dclone", "DcloneTracker2.url", str),
+}
+
+# Account setting -> parser. Every account needs the ones without a default
+ACCOUNT_SETTINGS: Dict[str, Callable[[str], Any]] = {
+    "chat_id": int,
+    "seller_id": int,
+    "auth": str,
+}
+REQUIRED_ACCOUNT_SETTINGS = ["chat_id", "seller_id"]
+
+# Global vars
+logger = log.getLogger(__name__)
+settings: Dict[str, Any] = {}
+accountSettings: List[Dict[str, Any]] = []
+
+
+def isUnset(value: str) -> bool:
+    # Keys left blank, like the ones in config.example.ini, fall back to the default instead of failing to parse
+    return value.strip() == ""
+
+
+def parseAccount(name: str, section: Mapping[str, str]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    account: Dict[str, Any] = {"name": name}
+    for key, value in section.items():
+        if isUnset(value):
+            continue
+        if key not in ACCOUNT_SETTINGS:
+            logger.warning(f"Ignoring unknown setting {key} for account {name}")
+            continue
+        try:
+            account[key] = ACCOUNT_SETTINGS[key](value)
+        except ValueError:
+            return None, f"Invalid value for {key} in account {name}: {value}"
+    for key in REQUIRED_ACCOUNT_SETTINGS:
+        if key not in account:
+            return None, f"Account {name} is missing {key}"
+    return account, None
+
+
+def load(path: Optional[str], environ: Mapping[str, str] = os.environ) -> Optional[str]:
+    # A missing file is fine, everything can come from the environment. A file that doesn't parse is not
+    global settings
+    global accountSettings
+
+    raw: Dict[str, str] = {}
+    parsedAccounts = []
+    if path is not None and os.path.exists(path):
+        parser = configparser.ConfigParser(interpolation=None)
+        try:
+            parser.read(path)
+        except configparser.Error as e:
+            return f"Unable to parse config file {path}: {str(e)}"
+        if parser.has_section(CONFIG_SECTION):
+            raw.update({key: value for key, value in parser[CONFIG_SECTION].items() if not isUnset(value)})
+        for section in parser.sections():
+            if not section.startswith(ACCOUNT_SECTION_PREFIX):
+                continue
+            account, err = parseAccount(section[len(ACCOUNT_SECTION_PREFIX):], parser[section])
+            if err is not None:
+                return err
+            parsedAccounts.append(account)
+        for key in raw:
+            if key not in SETTINGS:
+                logger.warning(f"Ignoring unknown setting {key} in {path}")
+    for key in SETTINGS:
+        envValue = environ.get(ENV_PREFIX + key.upper())
+        if envValue is not None and not isUnset(envValue):
+            raw[key] = envValue
+
+    parsed = {}
+    for key, value in raw.items():
+        if key not in SETTINGS:
+            continue
+        try:
+            parsed[key] = SETTINGS[key][2](value)
+        except ValueError:
+            return f"Invalid value for {key}: {value}"
+    settings = parsed
+    accountSettings = parsedAccounts
+    return None
+
+
+def apply() -> None:
+    # Imports the target modules, so call this only once it's fine to pay for them
+    for key, value in settings.items():
+        moduleName, attribute, _ = SETTINGS[key]
+        target = importlib.import_module(moduleName)
+        path = attribute.split(".")
+        for name in path[:-1]:
+            target = getattr(target, name)
+        setattr(target, path[-1], value)
+    if len(accountSettings) != 0:
+        importlib.import_module("bot").ACCOUNTS = accountSettings
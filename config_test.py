@@ -0,0 +1,100 @@
+###########################################################################
+#   config_test.py  --  This file is part of traderie-bot.                #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import os
+import tempfile
+import unittest
+
+import config
+import traderie
+
+
+class TestConfig(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "config.ini")
+
+    def tearDown(self):
+        config.settings = {}
+        config.accountSettings = []
+        self.tmpdir.cleanup()
+
+    def writeConfig(self, text: str) -> None:
+        with open(self.path, "w") as f:
+            f.write(text)
+
+    def testFileAndEnv(self):
+        self.writeConfig("[bot]\ntarget_chat_id = 42\nstatus_interval = 60\ndclone_alert_realms = softcore-ladder, hardcore-ladder\n")
+        self.assertIsNone(config.load(self.path, {"TRADERIE_BOT_STATUS_INTERVAL": "120"}))
+        self.assertEqual(config.settings, {
+            "target_chat_id": 42,
+            "status_interval": 120,
+            "dclone_alert_realms": ["softcore-ladder", "hardcore-ladder"],
+        })
+
+    def testMissingFile(self):
+        self.assertIsNone(config.load(self.path, {"TRADERIE_BOT_API_KEY": "key"}))
+        self.assertEqual(config.settings, {"api_key": "key"})
+
+    def testInvalid(self):
+        self.writeConfig("[bot]\ntarget_chat_id = me\n")
+        self.assertIsNotNone(config.load(self.path, {}))
+        self.writeConfig("not an ini file")
+        self.assertIsNotNone(config.load(self.path, {}))
+
+    def testAccounts(self):
+        self.writeConfig("[account:main]\nchat_id = 1\nseller_id = 10\nauth = token\n[account:alt]\nchat_id = 2\nseller_id = 20\n")
+        self.assertIsNone(config.load(self.path, {}))
+        self.assertEqual(config.accountSettings, [
+            {"name": "main", "chat_id": 1, "seller_id": 10, "auth": "token"},
+            {"name": "alt", "chat_id": 2, "seller_id": 20},
+        ])
+        self.writeConfig("[account:main]\nchat_id = 1\n")
+        self.assertIsNotNone(config.load(self.path, {}))
+
+    def testBlankKeysAreUnset(self):
+        # Like config.example.ini, with the legacy single account keys left blank
+        self.writeConfig(
+            "[bot]\napi_key = key\ntarget_chat_id =\ntraderie_seller_id =\ntraderie_auth =\n"
+            "[account:main]\nchat_id = 1\nseller_id = 10\nauth =\n"
+            "[account:alt]\nchat_id = 2\nseller_id = 20\nauth = token\n"
+        )
+        self.assertIsNone(config.load(self.path, {"TRADERIE_BOT_STATUS_INTERVAL": ""}))
+        self.assertEqual(config.settings, {"api_key": "key"})
+        self.assertEqual(config.accountSettings, [
+            {"name": "main", "chat_id": 1, "seller_id": 10},
+            {"name": "alt", "chat_id": 2, "seller_id": 20, "auth": "token"},
+        ])
+        # Still required, blank or not
+        self.writeConfig("[account:main]\nchat_id =\nseller_id = 10\n")
+        self.assertEqual(config.load(self.path, {}), "Account main is missing chat_id")
+
+    def testApply(self):
+        originalURL = traderie.API_BASE_URL
+        try:
+            self.assertIsNone(config.load(None, {"TRADERIE_BOT_TRADERIE_API_URL": "http://localhost/api"}))
+            config.apply()
+            self.assertEqual(traderie.API_BASE_URL, "http://localhost/api")
+        finally:
+            traderie.API_BASE_URL = originalURL
+
+
+if __name__ == '__main__':
+    unittest.main()
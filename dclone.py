@@ -18,13 +18,22 @@
 #                                                                         #
 ###########################################################################
 
-from typing import Dict, Optional
+import collections
+import concurrent.futures
+import contextlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
 import json
+import random
 import requests
-import traceback
+import threading
+import time
 import urllib3
 
+import httpclient
 import log
+import lru
+import responsecapture
 
 # Constants
 DCLONE_STATUS = {
@@ -36,13 +45,48 @@ DCLONE_STATUS = {
     6: "(6/6): Terror has invaded Sanctuary",
 }
 DCLONE_DIABLO2_IO_UA = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/99.0.4844.51 Safari/537.36'
+DCLONE_TRACKER_TIMEOUT = 10
+# Tracker answers are reused for this many seconds, so that pollers and /dclone don't hit the same upstream twice
+DCLONE_CACHE_TTL = 15
+DCLONE_POOL_SIZE = 8
+# Return the first valid answer from any tracker
+POLICY_FASTEST = "fastest"
+# Wait for all trackers and take the most common value per region, or the highest one on a tie. Once one tracker
+# has answered, the rest get DCLONE_QUORUM_GRACE more seconds, so a slow tracker can't hold back an alert
+POLICY_QUORUM = "quorum"
+DCLONE_QUORUM_GRACE = 1.5
+DEFAULT_POLICY = POLICY_QUORUM
+# Progress -> seconds between polls. Polls are rare while dclone is far away and aggressive once it gets close
+DCLONE_POLLING_INTERVALS = {
+    1: 300,
+    2: 240,
+    3: 120,
+    4: 45,
+    5: 20,
+    6: 60,
+}
+DCLONE_POLLING_JITTER = 0.1
+# Requests per minute allowed to each tracker
+DCLONE_TRACKER_RATE_LIMIT = 30
+# Realm key -> (softcore, ladder)
+REALMS: Dict[str, Tuple[bool, bool]] = {
+    "softcore-nonladder": (True, False),
+    "softcore-ladder": (True, True),
+    "hardcore-nonladder": (False, False),
+    "hardcore-ladder": (False, True),
+}
+# Requests per hour allowed across all trackers. Twice what polling both trackers in every realm at the fastest
+# interval takes, so /dclone and retries don't get throttled right when dclone is about to walk
+DCLONE_REQUEST_BUDGET = 2 * 2 * len(REALMS) * 3600 / (min(DCLONE_POLLING_INTERVALS.values()) * (1 - DCLONE_POLLING_JITTER))
 
 
 class DcloneTracker():
+    name: str
     headers: Dict[str, str]
     url: str
 
-    def __init__(self, baseURL: str, headers: Dict[str, str]):
+    def __init__(self, name: str, baseURL: str, headers: Dict[str, str]):
+        self.name = name
         self.url = baseURL
         self.headers = headers
 
@@ -50,14 +94,79 @@ class DcloneTracker():
         pass
 
 
+class RateLimiter():
+    rate: float
+    capacity: float
+    tokens: float
+    lastRefill: float
+
+    def __init__(self, rate: float, capacity: float):
+        # Token bucket: rate tokens per second, holding at most capacity tokens
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.lastRefill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self) -> None:
+        # Needs self.lock held
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.lastRefill) * self.rate)
+        self.lastRefill = now
+
+    def tryAcquire(self) -> bool:
+        return tryAcquireAll([self])
+
+
+def tryAcquireAll(limiters: List[RateLimiter]) -> bool:
+    # Takes a token from every limiter, or from none of them if any is empty. Callers must pass the limiters in the
+    # same order (tracker before global) so the locks can't deadlock
+    with contextlib.ExitStack() as stack:
+        for limiter in limiters:
+            stack.enter_context(limiter.lock)
+            limiter.refill()
+        if any(limiter.tokens < 1 for limiter in limiters):
+            return False
+        for limiter in limiters:
+            limiter.tokens -= 1
+        return True
+
+
+@dataclass
+class TrackerStats:
+    requests: int = 0
+    failures: int = 0
+    timeouts: int = 0
+    throttled: int = 0
+    disagreements: int = 0
+    totalLatency: float = 0.0
+    lastLatency: Optional[float] = None
+
+    def averageLatency(self) -> Optional[float]:
+        successes = self.requests - self.failures
+        if successes <= 0:
+            return None
+        return self.totalLatency / successes
+
+
 # Global vars
 logger = log.getLogger(__name__)
+# Shared keep-alive connections to all trackers
+session = requests.Session()
+session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=DCLONE_POOL_SIZE))
+# "tracker:softcore:ladder" -> last valid status from that tracker
+responseCache = lru.LRUCache(32, ttl=DCLONE_CACHE_TTL)
+# Same keys -> future for the fetch currently in progress
+inFlightFetches: Dict[str, concurrent.futures.Future] = {}
+inFlightLock = threading.Lock()
 DcloneTracker1 = DcloneTracker(
+    "d2runewizard",
     "https://d2runewizard.com/api/diablo-clone-progress/", {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/99.0.4844.51 Safari/537.36',
     }
 )
 DcloneTracker2 = DcloneTracker(
+    "diablo2.io",
     "https://diablo2.io/dclone_api.php", {
         'User-Agent': DCLONE_DIABLO2_IO_UA,
     }
@@ -77,29 +186,35 @@ def getDcloneStatusTracker1(self: DcloneTracker, softcore: bool, ladder: bool) -
         effectiveURL += "/nonLadder/hardcore"
 
     try:
-        response = requests.get(effectiveURL, headers=self.headers)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to get dclone status: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request(self.name, "GET", effectiveURL, httpSession=session, headers=self.headers, timeout=DCLONE_TRACKER_TIMEOUT)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to get dclone status: {str(e)}", exc_info=True)
         return None
     if response.status_code != 200:
         logger.error(f"Failed to get dclone status: Request returned code {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return None
 
-    data = json.loads(response.text)
+    try:
+        data = json.loads(response.text)
+    except json.JSONDecodeError:
+        logger.error("Unable to decode JSON data from API")
+        logger.debug("Raw data: %s", log.Payload(response.text))
+        responsecapture.record(self.name, response, "Unable to decode JSON data from API")
+        return None
     if data.get("servers") is None or (not isinstance(data.get("servers"), list)):
         logger.error("Invalid JSON data from dclone call")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
+        responsecapture.record(self.name, response, "Invalid JSON data from dclone call")
         return None
     serverList = data.get("servers")
     for server in serverList:
         if server.get("server").endswith("Asia"):
-            status["Asia"] = server.get("progress")
+            status["Asia"] = int(server.get("progress"))
         elif server.get("server").endswith("Americas"):
-            status["Americas"] = server.get("progress")
+            status["Americas"] = int(server.get("progress"))
         elif server.get("server").endswith("Europe"):
-            status["Europe"] = server.get("progress")
+            status["Europe"] = int(server.get("progress"))
     return status
 
 
@@ -110,25 +225,26 @@ def getDcloneStatusTracker2(self: DcloneTracker, softcore: bool, ladder: bool) -
     status = {}
     params = {'ladder': 1 if ladder else 2, 'hc': 1 if not softcore else 2}
     try:
-        response = requests.get(self.url, params=params, headers=self.headers)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to get dclone status: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request(self.name, "GET", self.url, httpSession=session, params=params, headers=self.headers, timeout=DCLONE_TRACKER_TIMEOUT)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to get dclone status: {str(e)}", exc_info=True)
         return None
     if response.status_code != 200:
         logger.error(f"Failed to get dclone status: Request returned code {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return None
 
     try:
         data = json.loads(response.text)
     except json.JSONDecodeError:
         logger.error("Unable to decode JSON data from API")
-        logger.debug(f"Raw data: {response.text}")
+        logger.debug("Raw data: %s", log.Payload(response.text))
+        responsecapture.record(self.name, response, "Unable to decode JSON data from API")
         return None
     if not isinstance(data, list):
         logger.error("Invalid JSON data from dclone call")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
+        responsecapture.record(self.name, response, "Invalid JSON data from dclone call")
         return None
     for server in data:
         if server.get("region") == "1":
@@ -143,5 +259,169 @@ def getDcloneStatusTracker2(self: DcloneTracker, softcore: bool, ladder: bool) -
 DcloneTracker2.getData = getDcloneStatusTracker2
 
 
-def getDcloneStatus(softcore: bool, ladder: bool) -> Optional[Dict[str, str]]:
-    return DcloneTracker2.getData(DcloneTracker2, softcore, ladder)
+trackers: List[DcloneTracker] = [DcloneTracker1, DcloneTracker2]
+trackerStats: Dict[str, TrackerStats] = {tracker.name: TrackerStats() for tracker in trackers}
+trackerStatsLock = threading.Lock()
+trackerLimiters: Dict[str, RateLimiter] = {
+    tracker.name: RateLimiter(DCLONE_TRACKER_RATE_LIMIT / 60, DCLONE_TRACKER_RATE_LIMIT / 2) for tracker in trackers
+}
+requestBudget = RateLimiter(DCLONE_REQUEST_BUDGET / 3600, DCLONE_REQUEST_BUDGET / 12)
+fetchExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="dclone_fetch")
+# Realm fetches wait on tracker fetches, so they need their own pool to avoid starving it
+realmExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=len(REALMS), thread_name_prefix="dclone_realm")
+
+
+def getPollingInterval(progress: Optional[int]) -> float:
+    interval = DCLONE_POLLING_INTERVALS.get(progress, DCLONE_POLLING_INTERVALS[1])
+    return interval * random.uniform(1 - DCLONE_POLLING_JITTER, 1 + DCLONE_POLLING_JITTER)
+
+
+def acquireTracker(tracker: DcloneTracker) -> bool:
+    limiter = trackerLimiters.get(tracker.name)
+    if not tryAcquireAll(([limiter] if limiter is not None else []) + [requestBudget]):
+        logger.debug(f"Dclone tracker {tracker.name} is rate limited")
+        with trackerStatsLock:
+            trackerStats.setdefault(tracker.name, TrackerStats()).throttled += 1
+        return False
+    return True
+
+
+def getRealmKey(softcore: bool, ladder: bool) -> str:
+    return f"{'softcore' if softcore else 'hardcore'}-{'ladder' if ladder else 'nonladder'}"
+
+
+def fetchFromTracker(tracker: DcloneTracker, softcore: bool, ladder: bool) -> Optional[Dict[str, int]]:
+    start = time.monotonic()
+    try:
+        status = tracker.getData(tracker, softcore, ladder)
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        logger.error(f"Unexpected data from dclone tracker {tracker.name}: {str(e)}")
+        status = None
+    latency = time.monotonic() - start
+    with trackerStatsLock:
+        stats = trackerStats.setdefault(tracker.name, TrackerStats())
+        stats.requests += 1
+        if not status:
+            stats.failures += 1
+        else:
+            stats.totalLatency += latency
+            stats.lastLatency = latency
+    return status if status else None
+
+
+def getCacheKey(tracker: DcloneTracker, softcore: bool, ladder: bool) -> str:
+    return f"{tracker.name}:{softcore}:{ladder}"
+
+
+def fetchCoalesced(tracker: DcloneTracker, softcore: bool, ladder: bool) -> Tuple[Optional[Dict[str, int]], bool]:
+    # Returns the status and whether it was fetched by this call, rather than taken from the cache or another fetch
+    key = getCacheKey(tracker, softcore, ladder)
+    cached = responseCache.get(key)
+    if cached is not None:
+        return cached, False
+    with inFlightLock:
+        future = inFlightFetches.get(key)
+        owner = future is None
+        if owner:
+            future = concurrent.futures.Future()
+            inFlightFetches[key] = future
+    if not owner:
+        # Someone else is already fetching this, wait for their answer instead of sending another request
+        try:
+            return future.result(timeout=DCLONE_TRACKER_TIMEOUT), False
+        except concurrent.futures.TimeoutError:
+            return None, False
+
+    status = None
+    try:
+        if acquireTracker(tracker):
+            status = fetchFromTracker(tracker, softcore, ladder)
+            if status is not None:
+                responseCache.put(key, status)
+    finally:
+        with inFlightLock:
+            del inFlightFetches[key]
+        future.set_result(status)
+    return status, status is not None
+
+
+def mergeStatuses(results: Dict[str, Dict[str, int]], fresh: Set[str] = frozenset()) -> Dict[str, int]:
+    # Disagreements are only counted for the trackers in fresh, so a cached answer isn't counted again on every merge
+    merged = {}
+    regions = set()
+    for status in results.values():
+        regions |= status.keys()
+    for region in sorted(regions):
+        votes = collections.Counter(status[region] for status in results.values() if region in status)
+        topCount = max(votes.values())
+        merged[region] = max(value for value, count in votes.items() if count == topCount)
+    with trackerStatsLock:
+        for trackerName, status in results.items():
+            if trackerName not in fresh:
+                continue
+            for region, value in status.items():
+                if value != merged[region]:
+                    logger.debug(f"Tracker {trackerName} disagrees on {region}: {value} vs {merged[region]}")
+                    trackerStats.setdefault(trackerName, TrackerStats()).disagreements += 1
+    return merged
+
+
+def getDcloneStatus(softcore: bool, ladder: bool, policy: str = DEFAULT_POLICY) -> Optional[Dict[str, int]]:
+    results = {}
+    fresh = set()
+    futures = {}
+    for tracker in trackers:
+        cached = responseCache.get(getCacheKey(tracker, softcore, ladder))
+        if cached is not None:
+            results[tracker.name] = cached
+        else:
+            futures[fetchExecutor.submit(fetchCoalesced, tracker, softcore, ladder)] = tracker
+    if len(futures) == 0:
+        return mergeStatuses(results)
+
+    if policy == POLICY_FASTEST:
+        if len(results) != 0:
+            return next(iter(results.values()))
+        try:
+            for future in concurrent.futures.as_completed(futures, timeout=DCLONE_TRACKER_TIMEOUT):
+                status, _ = future.result()
+                if status is not None:
+                    return status
+        except concurrent.futures.TimeoutError:
+            logger.error("Timed out waiting for dclone trackers")
+        return None
+
+    deadline = time.monotonic() + DCLONE_TRACKER_TIMEOUT
+    if len(results) != 0:
+        deadline = time.monotonic() + DCLONE_QUORUM_GRACE
+    notDone = set(futures)
+    while len(notDone) != 0:
+        done, notDone = concurrent.futures.wait(notDone, timeout=max(0, deadline - time.monotonic()), return_when=concurrent.futures.FIRST_COMPLETED)
+        if len(done) == 0:
+            break
+        for future in done:
+            status, fetched = future.result()
+            if status is not None:
+                if len(results) == 0:
+                    deadline = min(deadline, time.monotonic() + DCLONE_QUORUM_GRACE)
+                results[futures[future].name] = status
+                if fetched:
+                    fresh.add(futures[future].name)
+    with trackerStatsLock:
+        for future in notDone:
+            trackerStats.setdefault(futures[future].name, TrackerStats()).timeouts += 1
+    if len(results) == 0:
+        return None
+    return mergeStatuses(results, fresh)
+
+
+def getTrackerStats() -> Dict[str, TrackerStats]:
+    with trackerStatsLock:
+        return {name: TrackerStats(**vars(stats)) for name, stats in trackerStats.items()}
+
+
+def getAllDcloneStatuses(policy: str = DEFAULT_POLICY) -> Dict[str, Optional[Dict[str, int]]]:
+    futures = {
+        realm: realmExecutor.submit(getDcloneStatus, softcore, ladder, policy) for realm, (softcore, ladder) in REALMS.items()
+    }
+    return {realm: future.result() for realm, future in futures.items()}
@@ -0,0 +1,217 @@
+###########################################################################
+#   dclone_test.py  --  This file is part of traderie-bot.                #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import concurrent.futures
+import threading
+import time
+import unittest
+from unittest import mock
+
+import dclone
+
+# Released after every test, so slow trackers don't outlive the test that made them
+trackerEvents = []
+
+
+def fakeTracker(name, status, delay=None):
+    tracker = dclone.DcloneTracker(name, "http://localhost", {})
+    event = threading.Event()
+    trackerEvents.append(event)
+
+    def getData(self, softcore, ladder):
+        if delay is not None:
+            event.wait(delay)
+        return status
+    tracker.getData = getData
+    return tracker
+
+
+def releaseTrackers():
+    for event in trackerEvents:
+        event.set()
+    trackerEvents.clear()
+    with dclone.inFlightLock:
+        pending = list(dclone.inFlightFetches.values())
+    concurrent.futures.wait(pending)
+    dclone.responseCache.clear()
+
+
+class TestDcloneFanOut(unittest.TestCase):
+    def setUp(self):
+        dclone.trackerStats.clear()
+        dclone.responseCache.clear()
+
+    def tearDown(self):
+        releaseTrackers()
+
+    def testQuorum(self):
+        trackers = [
+            fakeTracker("t1", {"Americas": 2, "Europe": 3, "Asia": 1}),
+            fakeTracker("t2", {"Americas": 2, "Europe": 4, "Asia": 1}),
+            fakeTracker("t3", {"Americas": 3, "Europe": 3}),
+        ]
+        with mock.patch('dclone.trackers', trackers):
+            status = dclone.getDcloneStatus(True, False, dclone.POLICY_QUORUM)
+        self.assertEqual(status, {"Americas": 2, "Europe": 3, "Asia": 1})
+        stats = dclone.getTrackerStats()
+        self.assertEqual(stats["t1"].disagreements, 0)
+        self.assertEqual(stats["t2"].disagreements, 1)
+        self.assertEqual(stats["t3"].disagreements, 1)
+
+    def testQuorumDoesNotWaitForSlowTracker(self):
+        trackers = [
+            fakeTracker("t1", {"Americas": 5}),
+            fakeTracker("t2", {"Americas": 5}, delay=0.05),
+            fakeTracker("t3", {"Americas": 1}, delay=5),
+        ]
+        with mock.patch('dclone.trackers', trackers), mock.patch('dclone.DCLONE_QUORUM_GRACE', 0.5):
+            start = time.monotonic()
+            status = dclone.getDcloneStatus(True, False, dclone.POLICY_QUORUM)
+            self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(status, {"Americas": 5})
+        self.assertEqual(dclone.getTrackerStats()["t3"].timeouts, 1)
+
+    def testQuorumTieTakesMax(self):
+        results = {
+            "t1": {"Americas": 4},
+            "t2": {"Americas": 5},
+        }
+        self.assertEqual(dclone.mergeStatuses(results), {"Americas": 5})
+
+    def testFastestSkipsFailures(self):
+        trackers = [
+            fakeTracker("t1", None),
+            fakeTracker("t2", {"Americas": 5}, delay=0.05),
+            fakeTracker("t3", {"Americas": 1}, delay=2),
+        ]
+        with mock.patch('dclone.trackers', trackers):
+            status = dclone.getDcloneStatus(True, False, dclone.POLICY_FASTEST)
+        self.assertEqual(status, {"Americas": 5})
+        self.assertEqual(dclone.getTrackerStats()["t1"].failures, 1)
+
+    def testCachedResultsNotRecounted(self):
+        trackers = [
+            fakeTracker("t1", {"Americas": 2}),
+            fakeTracker("t2", {"Americas": 2}),
+            fakeTracker("t3", {"Americas": 3}),
+        ]
+        with mock.patch('dclone.trackers', trackers):
+            for _ in range(3):
+                self.assertEqual(dclone.getDcloneStatus(True, False, dclone.POLICY_QUORUM), {"Americas": 2})
+        self.assertEqual(dclone.getTrackerStats()["t3"].disagreements, 1)
+
+    def testAllFailed(self):
+        with mock.patch('dclone.trackers', [fakeTracker("t1", None), fakeTracker("t2", {})]):
+            self.assertEqual(dclone.getDcloneStatus(True, False), None)
+
+    def testAllRealms(self):
+        tracker = dclone.DcloneTracker("t1", "http://localhost", {})
+        tracker.getData = lambda self, softcore, ladder: {"Americas": (2 if softcore else 4) + (1 if ladder else 0)}
+        with mock.patch('dclone.trackers', [tracker]):
+            statuses = dclone.getAllDcloneStatuses()
+        self.assertEqual(statuses, {
+            "softcore-nonladder": {"Americas": 2},
+            "softcore-ladder": {"Americas": 3},
+            "hardcore-nonladder": {"Americas": 4},
+            "hardcore-ladder": {"Americas": 5},
+        })
+
+
+class TestDclonePolling(unittest.TestCase):
+    def setUp(self):
+        dclone.trackerStats.clear()
+        dclone.responseCache.clear()
+
+    def testPollingInterval(self):
+        for progress in [None, 1, 4, 5]:
+            interval = dclone.getPollingInterval(progress)
+            expected = dclone.DCLONE_POLLING_INTERVALS[progress or 1]
+            self.assertGreaterEqual(interval, expected * (1 - dclone.DCLONE_POLLING_JITTER))
+            self.assertLessEqual(interval, expected * (1 + dclone.DCLONE_POLLING_JITTER))
+        self.assertLess(dclone.getPollingInterval(5), dclone.getPollingInterval(1))
+
+    @mock.patch('dclone.time.monotonic')
+    def testRateLimiter(self, monotonic):
+        monotonic.return_value = 0.0
+        limiter = dclone.RateLimiter(0.5, 2)
+        self.assertTrue(limiter.tryAcquire())
+        self.assertTrue(limiter.tryAcquire())
+        self.assertFalse(limiter.tryAcquire())
+        monotonic.return_value = 2.0
+        self.assertTrue(limiter.tryAcquire())
+        self.assertFalse(limiter.tryAcquire())
+        monotonic.return_value = 100.0
+        self.assertTrue(limiter.tryAcquire())
+        self.assertTrue(limiter.tryAcquire())
+        self.assertFalse(limiter.tryAcquire())
+
+    def testGlobalBudgetKeepsTrackerTokens(self):
+        tracker = dclone.DcloneTracker("t1", "http://localhost", {})
+        trackerLimiter = dclone.RateLimiter(0, 1)
+        with mock.patch.dict('dclone.trackerLimiters', {"t1": trackerLimiter}), mock.patch('dclone.requestBudget', dclone.RateLimiter(0, 0)):
+            self.assertFalse(dclone.acquireTracker(tracker))
+        self.assertEqual(trackerLimiter.tokens, 1)
+
+    def testBudgetCoversFastestPolling(self):
+        fastestPerHour = len(dclone.REALMS) * len(dclone.trackers) * 3600 / (dclone.DCLONE_POLLING_INTERVALS[5] * (1 - dclone.DCLONE_POLLING_JITTER))
+        self.assertGreater(dclone.DCLONE_REQUEST_BUDGET, fastestPerHour)
+        self.assertGreater(dclone.DCLONE_TRACKER_RATE_LIMIT * 60, fastestPerHour / len(dclone.trackers))
+
+    def testThrottled(self):
+        tracker = dclone.DcloneTracker("t1", "http://localhost", {})
+        tracker.getData = lambda self, softcore, ladder: {"Americas": 1}
+        limiter = dclone.RateLimiter(0, 1)
+        with mock.patch('dclone.trackers', [tracker]), mock.patch.dict('dclone.trackerLimiters', {"t1": limiter}):
+            self.assertEqual(dclone.getDcloneStatus(True, False), {"Americas": 1})
+            dclone.responseCache.clear()
+            self.assertEqual(dclone.getDcloneStatus(True, False), None)
+        self.assertEqual(dclone.getTrackerStats()["t1"].throttled, 1)
+
+
+class TestDcloneCache(unittest.TestCase):
+    def setUp(self):
+        dclone.responseCache.clear()
+
+    def testCachedAndCoalesced(self):
+        calls = []
+        release = threading.Event()
+        tracker = dclone.DcloneTracker("t1", "http://localhost", {})
+
+        def getData(self, softcore, ladder):
+            calls.append((softcore, ladder))
+            release.wait(1)
+            return {"Americas": 3}
+        tracker.getData = getData
+
+        with mock.patch('dclone.trackers', [tracker]):
+            callers = [threading.Thread(target=dclone.getDcloneStatus, args=(True, False)) for _ in range(4)]
+            for caller in callers:
+                caller.start()
+            release.set()
+            for caller in callers:
+                caller.join()
+            self.assertEqual(dclone.getDcloneStatus(True, False), {"Americas": 3})
+            self.assertEqual(dclone.getDcloneStatus(True, False, dclone.POLICY_FASTEST), {"Americas": 3})
+            self.assertEqual(dclone.getDcloneStatus(False, False), {"Americas": 3})
+        self.assertEqual(calls, [(True, False), (False, False)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+###########################################################################
+#   dclonehistory.py  --  This file is part of traderie-bot.              #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import array
+import os
+import struct
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import log
+
+# Constants
+# Two weeks of samples at the slowest polling interval per realm and region, 5 bytes each
+HISTORY_CAPACITY = 4032
+HISTORY_FILE_MAGIC = b"DCH1"
+HISTORY_HEADER = struct.Struct("<4sII")
+SERIES_HEADER = struct.Struct("<HII")
+MAX_PROGRESS = 6
+
+# Global vars
+logger = log.getLogger(__name__)
+
+
+class RingBuffer():
+    capacity: int
+    timestamps: array.array
+    values: array.array
+    head: int
+    count: int
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.timestamps = array.array("I", bytes(4 * capacity))
+        self.values = array.array("B", bytes(capacity))
+        # Index of the next write, and number of valid samples
+        self.head = 0
+        self.count = 0
+
+    def append(self, timestamp: int, value: int) -> None:
+        self.timestamps[self.head] = timestamp
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def items(self) -> List[Tuple[int, int]]:
+        # Oldest first
+        start = (self.head - self.count) % self.capacity
+        return [
+            (self.timestamps[(start + i) % self.capacity], self.values[(start + i) % self.capacity]) for i in range(self.count)
+        ]
+
+    def last(self) -> Optional[Tuple[int, int]]:
+        if self.count == 0:
+            return None
+        index = (self.head - 1) % self.capacity
+        return (self.timestamps[index], self.values[index])
+
+
+class DcloneHistory():
+    capacity: int
+    series: Dict[Tuple[str, str], RingBuffer]
+
+    def __init__(self, capacity: int = HISTORY_CAPACITY):
+        self.capacity = capacity
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def record(self, realm: str, status: Dict[str, int], timestamp: Optional[int] = None) -> None:
+        if timestamp is None:
+            timestamp = int(time.time())
+        with self.lock:
+            for region, progress in status.items():
+                key = (realm, region)
+                if key not in self.series:
+                    self.series[key] = RingBuffer(self.capacity)
+                self.series[key].append(timestamp, progress)
+
+    def getSeries(self, realm: str, region: str) -> List[Tuple[int, int]]:
+        with self.lock:
+            buffer = self.series.get((realm, region))
+            return buffer.items() if buffer is not None else []
+
+    def getRegions(self, realm: str) -> List[str]:
+        with self.lock:
+            return sorted(region for seriesRealm, region in self.series if seriesRealm == realm)
+
+    def getTransitions(self, realm: str, region: str) -> List[Tuple[int, int]]:
+        transitions = []
+        previous = None
+        for timestamp, progress in self.getSeries(realm, region):
+            if progress != previous:
+                transitions.append((timestamp, progress))
+                previous = progress
+        return transitions
+
+    def estimateTimeToWalk(self, realm: str, region: str, now: Optional[int] = None) -> Optional[float]:
+        # Extrapolates the progress rate seen since the last reset (the last time progress went down) to 6/6
+        if now is None:
+            now = int(time.time())
+        samples = self.getSeries(realm, region)
+        if len(samples) == 0:
+            return None
+        current = samples[-1][1]
+        if current >= MAX_PROGRESS:
+            return 0
+        start = 0
+        for i in range(1, len(samples)):
+            if samples[i][1] < samples[i - 1][1]:
+                start = i
+        firstTimestamp, firstProgress = samples[start]
+        gained = current - firstProgress
+        if gained <= 0 or now <= firstTimestamp:
+            return None
+        return (MAX_PROGRESS - current) * (now - firstTimestamp) / gained
+
+    def save(self, path: str) -> Optional[str]:
+        tmpPath = f"{path}.tmp"
+        try:
+            with self.lock, open(tmpPath, "wb") as f:
+                f.write(HISTORY_HEADER.pack(HISTORY_FILE_MAGIC, self.capacity, len(self.series)))
+                for (realm, region), buffer in self.series.items():
+                    key = f"{realm}|{region}".encode()
+                    f.write(SERIES_HEADER.pack(len(key), buffer.head, buffer.count))
+                    f.write(key)
+                    f.write(toLittleEndian(buffer.timestamps).tobytes())
+                    f.write(buffer.values.tobytes())
+            os.replace(tmpPath, path)
+        except OSError as e:
+            logger.error(f"Failed to save dclone history to {path}: {str(e)}")
+            return f"Failed to save dclone history to {path}: {str(e)}"
+        return None
+
+    def load(self, path: str) -> Optional[str]:
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                magic, capacity, numSeries = HISTORY_HEADER.unpack(readExactly(f, HISTORY_HEADER.size))
+                if magic != HISTORY_FILE_MAGIC or capacity != self.capacity:
+                    logger.warning(f"Ignoring dclone history in {path}: incompatible format")
+                    return None
+                series = {}
+                for _ in range(numSeries):
+                    keyLength, head, count = SERIES_HEADER.unpack(readExactly(f, SERIES_HEADER.size))
+                    if head >= capacity or count > capacity:
+                        raise ValueError(f"series head {head} or count {count} out of range for capacity {capacity}")
+                    realm, region = readExactly(f, keyLength).decode().split("|", 1)
+                    buffer = RingBuffer(capacity)
+                    buffer.timestamps = toLittleEndian(array.array("I", readExactly(f, 4 * capacity)))
+                    buffer.values = array.array("B", readExactly(f, capacity))
+                    buffer.head = head
+                    buffer.count = count
+                    series[(realm, region)] = buffer
+                if len(f.read(1)) != 0:
+                    raise ValueError("trailing data after the last series")
+        except (OSError, struct.error, ValueError) as e:
+            logger.error(f"Failed to load dclone history from {path}: {str(e)}")
+            return f"Failed to load dclone history from {path}: {str(e)}"
+        with self.lock:
+            self.series = series
+        logger.info(f"Loaded {len(series)} dclone history series from {path}")
+        return None
+
+
+def readExactly(f, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError(f"file is truncated: expected {size} bytes, got {len(data)}")
+    return data
+
+
+def toLittleEndian(data: array.array) -> array.array:
+    # Byte swapping is its own inverse, so this also converts back from the on-disk format
+    if sys.byteorder == "little":
+        return data
+    swapped = array.array(data.typecode, data)
+    swapped.byteswap()
+    return swapped
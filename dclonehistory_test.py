@@ -0,0 +1,104 @@
+###########################################################################
+#   dclonehistory_test.py  --  This file is part of traderie-bot.         #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import os
+import tempfile
+import unittest
+
+import dclonehistory
+
+
+class TestRingBuffer(unittest.TestCase):
+    def testWrapAround(self):
+        buffer = dclonehistory.RingBuffer(3)
+        self.assertEqual(buffer.items(), [])
+        self.assertEqual(buffer.last(), None)
+        for i in range(5):
+            buffer.append(100 + i, i)
+        self.assertEqual(buffer.items(), [(102, 2), (103, 3), (104, 4)])
+        self.assertEqual(buffer.last(), (104, 4))
+        self.assertEqual(buffer.count, 3)
+
+
+class TestDcloneHistory(unittest.TestCase):
+    def testEstimate(self):
+        history = dclonehistory.DcloneHistory(100)
+        # Previous walk, then a reset
+        history.record("softcore-nonladder", {"Americas": 6}, 0)
+        history.record("softcore-nonladder", {"Americas": 1}, 1000)
+        history.record("softcore-nonladder", {"Americas": 2}, 4000)
+        history.record("softcore-nonladder", {"Americas": 3}, 7000)
+        # 2 levels in 6000 seconds, 3 levels to go
+        self.assertEqual(history.estimateTimeToWalk("softcore-nonladder", "Americas", now=7000), 9000)
+        self.assertEqual(history.getTransitions("softcore-nonladder", "Americas"), [(0, 6), (1000, 1), (4000, 2), (7000, 3)])
+
+        history.record("softcore-nonladder", {"Europe": 6}, 7000)
+        self.assertEqual(history.estimateTimeToWalk("softcore-nonladder", "Europe", now=7000), 0)
+        history.record("softcore-nonladder", {"Asia": 2}, 7000)
+        self.assertEqual(history.estimateTimeToWalk("softcore-nonladder", "Asia", now=8000), None)
+        self.assertEqual(history.estimateTimeToWalk("softcore-nonladder", "Nowhere"), None)
+        self.assertEqual(history.getRegions("softcore-nonladder"), ["Americas", "Asia", "Europe"])
+
+    def testPersistence(self):
+        history = dclonehistory.DcloneHistory(4)
+        for i in range(6):
+            history.record("hardcore-ladder", {"Americas": i % 6 + 1, "Europe": 1}, 1000 * i)
+
+        with tempfile.TemporaryDirectory() as tmpDir:
+            path = os.path.join(tmpDir, "history.bin")
+            self.assertEqual(history.save(path), None)
+            self.assertEqual(os.path.getsize(path), 12 + 2 * (10 + len("hardcore-ladder|Americas") + 5 * 4) - 2)
+            restored = dclonehistory.DcloneHistory(4)
+            self.assertEqual(restored.load(path), None)
+            incompatible = dclonehistory.DcloneHistory(8)
+            self.assertEqual(incompatible.load(path), None)
+
+        self.assertEqual(restored.getSeries("hardcore-ladder", "Americas"), history.getSeries("hardcore-ladder", "Americas"))
+        self.assertEqual(restored.getSeries("hardcore-ladder", "Europe"), [(2000, 1), (3000, 1), (4000, 1), (5000, 1)])
+        self.assertEqual(incompatible.getSeries("hardcore-ladder", "Europe"), [])
+
+    def testCorruptFileDiscarded(self):
+        history = dclonehistory.DcloneHistory(4)
+        history.record("hardcore-ladder", {"Americas": 3}, 1000)
+
+        with tempfile.TemporaryDirectory() as tmpDir:
+            path = os.path.join(tmpDir, "history.bin")
+            history.save(path)
+            with open(path, "rb") as f:
+                data = f.read()
+            # Truncated in the middle of the samples
+            with open(path, "wb") as f:
+                f.write(data[:-3])
+            restored = dclonehistory.DcloneHistory(4)
+            self.assertNotEqual(restored.load(path), None)
+            self.assertEqual(restored.getRegions("hardcore-ladder"), [])
+            # Head past the end of the buffer
+            header = dclonehistory.HISTORY_HEADER.size
+            keyLength, _, count = dclonehistory.SERIES_HEADER.unpack_from(data, header)
+            with open(path, "wb") as f:
+                f.write(data[:header] + dclonehistory.SERIES_HEADER.pack(keyLength, 4, count) + data[header + dclonehistory.SERIES_HEADER.size:])
+            self.assertNotEqual(restored.load(path), None)
+            self.assertEqual(restored.getRegions("hardcore-ladder"), [])
+            restored.record("hardcore-ladder", {"Americas": 4}, 2000)
+            self.assertEqual(restored.getSeries("hardcore-ladder", "Americas"), [(2000, 4)])
+
+
+if __name__ == '__main__':
+    unittest.main()
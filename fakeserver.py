@@ -0,0 +1,325 @@
+###########################################################################
+#   fakeserver.py  --  This file is part of traderie-bot.                 #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+# Local stand-in for the Traderie API, the dclone trackers and the Telegram Bot API, for tests and benchmarks. Only
+# the endpoints and fields the bot actually uses are emulated
+
+import collections
+from dataclasses import dataclass
+import datetime
+import http.server
+import json
+import random
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import urllib.parse
+
+import log
+
+# Constants
+TRADERIE_PREFIX = "/api/diablo2resurrected"
+D2RUNEWIZARD_PREFIX = "/dclone/d2runewizard"
+DIABLO2IO_PATH = "/dclone/diablo2io"
+TELEGRAM_PREFIX = "/bot"
+SELLER_ID = 1000
+SELLER_USERNAME = "seller"
+DCLONE_REGIONS = {"1": "Americas", "2": "Europe", "3": "Asia"}
+
+# Global vars
+logger = log.getLogger(__name__)
+
+
+@dataclass
+class FakeConfig:
+    # Seconds added to every response
+    latency: float = 0.0
+    # Fraction of requests answered with a 500
+    errorRate: float = 0.0
+    # Fraction of requests that take slowLatency seconds more, for a latency tail
+    slowRate: float = 0.0
+    slowLatency: float = 1.0
+    numListings: int = 100
+    numOffers: int = 10
+    numNotifications: int = 0
+    numUsers: int = 50
+    messagesPerConversation: int = 5
+    dcloneProgress: int = 1
+    seed: int = 0
+
+
+class FakeState:
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.requestCounts: "collections.Counter[str]" = collections.Counter()
+        self.telegramMessages: List[Dict[str, Any]] = []
+        self.nextMessageID = 1
+        self.status = "offline"
+        stale = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=2)).isoformat()
+        self.users = {SELLER_ID + 1 + i: f"user{i}" for i in range(config.numUsers)}
+        userIDs = list(self.users)
+        self.listings = {
+            i + 1: {
+                "id": str(i + 1),
+                "make_offer": False,
+                "updated_at": stale,
+                "prices": [{"group": 0, "quantity": 1, "name": "Ber Rune"}],
+                "properties": [
+                    {"id": "1", "property": "Platform", "type": "string", "string": "PC"},
+                    {"id": "2", "property": "Mode", "type": "string", "string": "softcore"},
+                    {"id": "3", "property": "Ladder", "type": "bool", "bool": False},
+                ],
+            } for i in range(config.numListings)
+        }
+        self.offers = {}
+        for i in range(config.numOffers):
+            buyerID = userIDs[i % len(userIDs)]
+            listingID = (i % max(config.numListings, 1)) + 1
+            self.offers[i + 1] = {
+                "id": str(i + 1),
+                "prices": [{"group": 0, "quantity": 2, "name": "Jah Rune"}, {"group": 1, "quantity": 1, "name": "Sur Rune"}],
+                "buyer": {"id": str(buyerID), "username": self.users[buyerID]},
+                "listing": {
+                    "id": str(listingID),
+                    "amount": "1",
+                    "item": {"id": str(5000 + listingID), "name": f"Item {listingID}"},
+                    "seller": {"id": str(SELLER_ID), "username": SELLER_USERNAME},
+                },
+            }
+        self.notifications = []
+        offerIDs = list(self.offers)
+        for i in range(config.numNotifications):
+            created = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            if i % 2 == 0 or len(offerIDs) == 0:
+                userID = userIDs[i % len(userIDs)]
+                message = f"You got a new message from {self.users[userID]}"
+                data = {}
+            else:
+                offer = self.offers[offerIDs[i % len(offerIDs)]]
+                userID = int(offer["buyer"]["id"])
+                message = f"{offer['buyer']['username']} made an offer for your {offer['listing']['item']['name']}"
+                data = {"listing_id": offer["listing"]["id"]}
+            self.notifications.append({
+                "id": f"notification-{i}",
+                "message": message,
+                "created_at": created,
+                "from_user_id": str(userID),
+                "data": data,
+                "read": False,
+            })
+        self.conversations = {userID: 9000 + index for index, userID in enumerate(userIDs)}
+
+    def getMessages(self, userID: int, limit: int) -> List[Dict[str, Any]]:
+        # Newest first, like the real API
+        messages = []
+        for i in range(min(limit, self.config.messagesPerConversation)):
+            messages.append({"id": f"msg-{userID}-{i}", "content": f"Message {i} from {self.users.get(userID)}", "from": str(userID), "to": str(SELLER_ID)})
+        return messages
+
+    def getDcloneStatus(self) -> List[Dict[str, Any]]:
+        return [{"region": region, "progress": str(self.config.dcloneProgress)} for region in DCLONE_REGIONS]
+
+
+class FakeRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes, Nagle would hold the body back until the client ACKs
+    disable_nagle_algorithm = True
+    state: FakeState
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.route("GET")
+
+    def do_PUT(self):
+        self.route("PUT")
+
+    def do_POST(self):
+        self.route("POST")
+
+    def route(self, method: str) -> None:
+        parsed = urllib.parse.urlparse(self.path)
+        query = {key: values[0] for key, values in urllib.parse.parse_qs(parsed.query, keep_blank_values=True).items()}
+        length = int(self.headers.get("Content-Length", 0))
+        rawBody = self.rfile.read(length) if length != 0 else b""
+        body = self.parseBody(rawBody)
+        state = self.state
+        with state.lock:
+            state.requestCounts[f"{method} {parsed.path}"] += 1
+        if state.config.latency > 0:
+            time.sleep(state.config.latency)
+        if state.config.slowRate > 0 and state.random.random() < state.config.slowRate:
+            time.sleep(state.config.slowLatency)
+        if state.config.errorRate > 0 and state.random.random() < state.config.errorRate:
+            self.reply(500, {"error": "Injected failure"})
+            return
+        try:
+            if parsed.path.startswith(TRADERIE_PREFIX):
+                code, payload = self.handleTraderie(method, parsed.path[len(TRADERIE_PREFIX):], query, body)
+            elif parsed.path.startswith(D2RUNEWIZARD_PREFIX):
+                code, payload = 200, {"servers": [{"server": f"softcore{region}", "progress": state.config.dcloneProgress} for region in DCLONE_REGIONS.values()]}
+            elif parsed.path == DIABLO2IO_PATH:
+                code, payload = 200, state.getDcloneStatus()
+            elif parsed.path.startswith(TELEGRAM_PREFIX):
+                code, payload = self.handleTelegram(parsed.path.rsplit("/", 1)[-1], body)
+            else:
+                code, payload = 404, {"error": "Not found"}
+        except (KeyError, ValueError) as e:
+            code, payload = 400, {"error": str(e)}
+        self.reply(code, payload)
+
+    def parseBody(self, rawBody: bytes) -> Dict[str, Any]:
+        if rawBody == b"":
+            return {}
+        contentType = self.headers.get("Content-Type", "")
+        if contentType.startswith("application/x-www-form-urlencoded"):
+            return {key: values[0] for key, values in urllib.parse.parse_qs(rawBody.decode()).items()}
+        try:
+            return json.loads(rawBody)
+        except ValueError:
+            return {}
+
+    def reply(self, code: int, payload: Any) -> None:
+        data = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handleTraderie(self, method: str, path: str, query: Dict[str, str], body: Dict[str, Any]) -> Tuple[int, Any]:
+        state = self.state
+        with state.lock:
+            if method == "GET" and path == "/accounts":
+                return 200, {"user": {"status": state.status}}
+            if method == "PUT" and path == "/accounts/update":
+                state.status = body["status"]
+                return 200, {"msg": "success"}
+            if method == "GET" and path == "/notifications":
+                notifications = state.notifications
+                if "new" in query:
+                    notifications = [n for n in notifications if not n["read"]]
+                return 200, {"notifications": notifications[:int(query.get("limit", 10))]}
+            if method == "PUT" and path == "/notifications/read":
+                readIDs = set(body["newNotifications"])
+                for notification in state.notifications:
+                    if notification["id"] in readIDs:
+                        notification["read"] = True
+                return 200, {"success": True}
+            if method == "GET" and path == "/conversations":
+                return 200, {"conversations": [{"id": str(convoID), "users": [str(SELLER_ID), str(userID)]} for userID, convoID in state.conversations.items()]}
+            if method == "GET" and path == "/messages":
+                return 200, {"messages": state.getMessages(int(query["user"]), int(query["limit"]))}
+            if method == "GET" and path == "/offers":
+                return 200, {"offers": list(state.offers.values())}
+            if method == "GET" and path == "/listings":
+                if "id" in query:
+                    listing = state.listings.get(int(query["id"]))
+                    return 200, {"listings": [listing] if listing is not None else []}
+                page = int(query.get("page", 0))
+                listings = list(state.listings.values())[page * 50:(page + 1) * 50]
+                return 200, {"listings": listings}
+            if method == "PUT" and path == "/listings/refresh":
+                state.listings[int(body["listing"])]["updated_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+                return 200, {"msg": "success"}
+            if method == "PUT" and path in ("/offers/accept", "/offers/deny"):
+                if state.offers.pop(int(body["offer"]), None) is None:
+                    return 200, {"error": "Offer not found"}
+                return 200, {"success": True}
+            if method == "POST" and path in ("/messages", "/conversations"):
+                return 200, {"msg": "success"}
+            if method == "GET" and path == "/users":
+                return 200, {"users": [{"id": str(userID), "username": username} for userID, username in state.users.items() if username.startswith(query["username"])]}
+            if method == "PUT" and path == "/conversations":
+                return 200, {}
+            if method == "POST" and path in ("/reviews/add", "/blocks"):
+                return 200, {}
+        return 404, {"error": "Not found"}
+
+    def handleTelegram(self, method: str, body: Dict[str, Any]) -> Tuple[int, Any]:
+        state = self.state
+        if method == "getMe":
+            return 200, {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}}
+        if method == "getUpdates":
+            time.sleep(0.1)
+            return 200, {"ok": True, "result": []}
+        if method in ("sendMessage", "editMessageReplyMarkup"):
+            with state.lock:
+                messageID = state.nextMessageID
+                state.nextMessageID += 1
+                state.telegramMessages.append(dict(body, method=method))
+            chatID = int(body.get("chat_id", 0))
+            return 200, {"ok": True, "result": {
+                "message_id": messageID,
+                "date": int(time.time()),
+                "chat": {"id": chatID, "type": "private"},
+                "text": body.get("text", ""),
+            }}
+        return 200, {"ok": True, "result": True}
+
+
+class FakeHTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients going away mid-request (killed bots, closed sessions) are expected here
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class FakeServer:
+    def __init__(self, config: Optional[FakeConfig] = None):
+        self.state = FakeState(config if config is not None else FakeConfig())
+        handler = type("BoundFakeRequestHandler", (FakeRequestHandler,), {"state": self.state})
+        self.server = FakeHTTPServer(("127.0.0.1", 0), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.name = "fake_server_thread"
+
+    @property
+    def baseURL(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @property
+    def traderieURL(self) -> str:
+        return self.baseURL + TRADERIE_PREFIX
+
+    @property
+    def telegramURL(self) -> str:
+        return self.baseURL + TELEGRAM_PREFIX
+
+    def start(self) -> "FakeServer":
+        self.thread.start()
+        logger.info(f"Fake server listening on {self.baseURL}")
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "FakeServer":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
@@ -0,0 +1,72 @@
+###########################################################################
+#   fakeserver_test.py  --  This file is part of traderie-bot.            #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import unittest
+
+import requests
+
+import dclone
+import fakeserver
+import traderie
+
+
+class TestFakeServer(unittest.TestCase):
+    def setUp(self):
+        self.server = fakeserver.FakeServer(fakeserver.FakeConfig(numListings=60, numOffers=3, numNotifications=4)).start()
+        self.originalURL = traderie.API_BASE_URL
+        traderie.API_BASE_URL = self.server.traderieURL
+
+    def tearDown(self):
+        traderie.API_BASE_URL = self.originalURL
+        self.server.stop()
+
+    def testTraderie(self):
+        listings = traderie.getAllListings(fakeserver.SELLER_ID)
+        self.assertEqual(len(listings), 60)
+        self.assertTrue(traderie.isListingRelistable(listings[1]))
+        self.assertIsNone(traderie.relistItem(1))
+        self.assertFalse(traderie.isListingRelistable(traderie.getListing(1)))
+        self.assertEqual(len(traderie.getOffers(toSellerID=fakeserver.SELLER_ID)), 3)
+        notifications = traderie.getNotifications(True, 10)
+        self.assertEqual(len(notifications), 4)
+        self.assertIsNone(traderie.markNewNotificationsAsRead(notifications))
+        self.assertEqual(len(traderie.getNotifications(True, 10)), 0)
+
+    def testDclone(self):
+        tracker = dclone.DcloneTracker("fake", self.server.baseURL + fakeserver.D2RUNEWIZARD_PREFIX, {})
+        status = dclone.getDcloneStatusTracker1(tracker, True, False)
+        self.assertEqual(status, {"Americas": 1, "Europe": 1, "Asia": 1})
+        tracker = dclone.DcloneTracker("fake", self.server.baseURL + fakeserver.DIABLO2IO_PATH, {})
+        status = dclone.getDcloneStatusTracker2(tracker, True, False)
+        self.assertEqual(status, {"Americas": 1, "Europe": 1, "Asia": 1})
+
+    def testErrorRate(self):
+        self.server.state.config.errorRate = 1.0
+        self.assertIsNone(traderie.getListing(1))
+        self.assertEqual(self.server.state.requestCounts[f"GET {fakeserver.TRADERIE_PREFIX}/listings"], 1)
+
+    def testTelegram(self):
+        response = requests.post(f"{self.server.telegramURL}123:token/sendMessage", json={"chat_id": 1, "text": "hi"})
+        self.assertTrue(response.json()["ok"])
+        self.assertEqual(self.server.state.telegramMessages[0]["text"], "hi")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+###########################################################################
+#   httpclient.py  --  This file is part of traderie-bot.                 #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import concurrent.futures
+import threading
+import time
+from typing import Optional
+
+import requests
+
+import jobwatchdog
+import metrics
+import recording
+import responsecapture
+
+# Constants
+# (connect, read) timeout for requests that don't set their own. Without one, a connection that stops answering
+# blocks its caller forever
+DEFAULT_TIMEOUT = (10, 30)
+# Fraction of hedgeable requests that may send a second, hedged attempt. 0 disables hedging
+HEDGE_BUDGET = 0.0
+# Unused budget piles up to this many hedges, so a short burst of slow responses can all be hedged
+HEDGE_BUDGET_BURST = 10
+# A request is hedged once it takes longer than this percentile of its endpoint's latency
+HEDGE_QUANTILE = 0.9
+# Endpoints need this many observed requests before their percentile is trusted
+HEDGE_MIN_SAMPLES = 50
+# Never hedge sooner than this, so endpoints that always answer fast aren't hedged on noise
+HEDGE_MIN_DELAY = 0.05
+
+# Global vars
+# Shared keep-alive connections for every upstream that doesn't bring its own session
+session = requests.Session()
+recorder: Optional[recording.Recorder] = None
+replayer: Optional[recording.Replayer] = None
+hedgeTokens = 0.0
+hedgeLock = threading.Lock()
+hedgeExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+
+def startRecording(path: str) -> None:
+    global recorder
+    recorder = recording.Recorder(path)
+
+
+def stopRecording() -> None:
+    global recorder
+    if recorder is not None:
+        recorder.close()
+        recorder = None
+
+
+def startReplay(path: str, speed: float = 1.0) -> None:
+    global replayer
+    replayer = recording.Replayer(recording.loadRecording(path), speed)
+
+
+def stopReplay() -> None:
+    global replayer
+    replayer = None
+
+
+def getHedgeDelay(endpoint: str) -> Optional[float]:
+    histogram = metrics.getHistogram("http_request_duration_seconds", {"endpoint": endpoint})
+    if histogram.count < HEDGE_MIN_SAMPLES:
+        return None
+    return max(histogram.percentile(HEDGE_QUANTILE), HEDGE_MIN_DELAY)
+
+
+def depositHedgeBudget() -> None:
+    global hedgeTokens
+    with hedgeLock:
+        hedgeTokens = min(hedgeTokens + HEDGE_BUDGET, HEDGE_BUDGET_BURST)
+
+
+def acquireHedge() -> bool:
+    global hedgeTokens
+    with hedgeLock:
+        if hedgeTokens < 1:
+            return False
+        hedgeTokens -= 1
+        return True
+
+
+def closeResponse(future: concurrent.futures.Future) -> None:
+    if future.exception() is None:
+        future.result().close()
+
+
+def sendHedged(endpoint: str, httpSession: requests.Session, method: str, url: str, **kwargs) -> requests.Response:
+    # Sends a second attempt if the first one is slower than usual and takes whichever answers first. The attempt
+    # that loses can't be cancelled, its response is just thrown away
+    depositHedgeBudget()
+    delay = getHedgeDelay(endpoint)
+    if delay is None:
+        return httpSession.request(method, url, **kwargs)
+    primary = hedgeExecutor.submit(httpSession.request, method, url, **kwargs)
+    done, _ = concurrent.futures.wait([primary], timeout=delay)
+    if len(done) != 0 or not acquireHedge():
+        return primary.result()
+    metrics.incCounter("http_hedges_total", {"endpoint": endpoint})
+    hedge = hedgeExecutor.submit(httpSession.request, method, url, **kwargs)
+    pending = {primary, hedge}
+    while len(pending) != 0:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is not None:
+                continue
+            if future is hedge:
+                metrics.incCounter("http_hedge_wins_total", {"endpoint": endpoint})
+            for loser in pending:
+                loser.add_done_callback(closeResponse)
+            return future.result()
+    # Both failed, report it like an unhedged request would
+    return primary.result()
+
+
+def request(endpoint: str, method: str, url: str, httpSession: Optional[requests.Session] = None, hedge: bool = False, **kwargs) -> requests.Response:
+    # Thin wrapper around requests that records latency and result per endpoint. Exceptions are left to the caller.
+    # hedge is only for idempotent requests, they may be sent twice
+    jobwatchdog.checkCancelled()
+    if httpSession is None:
+        httpSession = session
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    start = time.monotonic()
+    status = "error"
+    response = None
+    error = None
+    try:
+        if replayer is not None:
+            response = replayer.respond(method, url, **kwargs)
+        elif hedge and HEDGE_BUDGET > 0:
+            response = sendHedged(endpoint, httpSession, method, url, **kwargs)
+        else:
+            response = httpSession.request(method, url, **kwargs)
+        status = str(response.status_code)
+        if response.status_code != 200:
+            responsecapture.record(endpoint, response, f"HTTP {response.status_code}")
+        return response
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        elapsed = time.monotonic() - start
+        # Even a failed request means the caller isn't stuck
+        jobwatchdog.beat()
+        if recorder is not None:
+            recorder.record(endpoint, method, url, kwargs, start, elapsed, response, error)
+        metrics.observe("http_request_duration_seconds", elapsed, {"endpoint": endpoint})
+        metrics.incCounter("http_requests_total", {"endpoint": endpoint, "status": status})
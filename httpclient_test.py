@@ -0,0 +1,106 @@
+###########################################################################
+#   httpclient_test.py  --  This file is part of traderie-bot.            #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import io
+import threading
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+import httpclient
+import metrics
+
+
+class FakeSession:
+    # Answers the nth request after delays[n] seconds, or raises it if it's an exception
+    def __init__(self, delays: list):
+        self.delays = delays
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        with self.lock:
+            delay = self.delays[min(self.calls, len(self.delays) - 1)]
+            self.calls += 1
+            attempt = self.calls
+        if isinstance(delay, Exception):
+            raise delay
+        time.sleep(delay)
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = io.BytesIO(str(attempt).encode())
+        return response
+
+
+class TestHedging(unittest.TestCase):
+    def setUp(self):
+        metrics.counters.clear()
+        metrics.histograms.clear()
+        httpclient.hedgeTokens = 0.0
+        for _ in range(httpclient.HEDGE_MIN_SAMPLES):
+            metrics.observe("http_request_duration_seconds", 0.01, {"endpoint": "getOffers"})
+
+    def request(self, session: FakeSession, hedge: bool = True) -> requests.Response:
+        return httpclient.request("getOffers", "GET", "http://127.0.0.1/offers", httpSession=session, hedge=hedge)
+
+    def testDisabledByDefault(self):
+        session = FakeSession([0.2, 0])
+        self.assertEqual(self.request(session).text, "1")
+        self.assertEqual(session.calls, 1)
+
+    @mock.patch.object(httpclient, "HEDGE_BUDGET", 1.0)
+    def testSlowRequestIsHedged(self):
+        session = FakeSession([1, 0])
+        start = time.monotonic()
+        self.assertEqual(self.request(session).text, "2")
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(metrics.getCounter("http_hedge_wins_total", {"endpoint": "getOffers"}).value, 1)
+        # Only requests marked as idempotent get hedged
+        session = FakeSession([0.2, 0])
+        self.assertEqual(self.request(session, hedge=False).text, "1")
+        self.assertEqual(session.calls, 1)
+
+    @mock.patch.object(httpclient, "HEDGE_BUDGET", 1.0)
+    def testFailedAttemptLosesToTheOther(self):
+        session = FakeSession([0.2, requests.exceptions.ConnectionError("reset")])
+        self.assertEqual(self.request(session).text, "1")
+        session = FakeSession([requests.exceptions.ConnectionError("reset")])
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.request(session)
+
+    @mock.patch.object(httpclient, "HEDGE_BUDGET", 0.25)
+    @mock.patch.object(httpclient, "HEDGE_BUDGET_BURST", 1)
+    @mock.patch.object(httpclient, "HEDGE_MIN_DELAY", 0.01)
+    def testBudget(self):
+        # Enough fast history that a run of slow responses doesn't move the p90
+        for _ in range(1000):
+            metrics.observe("http_request_duration_seconds", 0.01, {"endpoint": "getOffers"})
+        session = FakeSession([0.03])
+        for _ in range(20):
+            self.request(session)
+        # 20 requests at 25% buy 5 hedges
+        self.assertEqual(metrics.getCounter("http_hedges_total", {"endpoint": "getOffers"}).value, 5)
+        self.assertEqual(session.calls, 25)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+###########################################################################
+#   jobwatchdog.py  --  This file is part of traderie-bot.                #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+# Heartbeats for background work. Code running under watch() calls beat() whenever it makes progress (httpclient and
+# the Telegram bot do it for every request), and check() reports the ones that went quiet for too long along with the
+# stack they are stuck on. A thread that is alive but hung looks the same as a busy one from the outside, this tells
+# them apart
+
+import contextlib
+from dataclasses import dataclass, field
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, Iterator, List
+
+import log
+import metrics
+
+# Global vars
+logger = log.getLogger(__name__)
+local = threading.local()
+# Thread ID -> heartbeat of the work it's running
+heartbeats: Dict[int, "Heartbeat"] = {}
+registryLock = threading.Lock()
+
+
+@dataclass
+class Heartbeat:
+    name: str
+    # Seconds without a beat before the work is considered stalled
+    timeout: float
+    threadID: int = 0
+    lastBeat: float = field(default_factory=time.monotonic)
+    beats: int = 0
+    stalled: bool = False
+    # Set when whoever started the work gave up on it. The work may still wake up later, and must not act by then
+    cancelled: bool = False
+
+
+class RunCancelled(Exception):
+    pass
+
+
+def beat() -> None:
+    # Cheap enough to call on every request. Does nothing outside watch()
+    heartbeat = getattr(local, "heartbeat", None)
+    if heartbeat is not None:
+        heartbeat.lastBeat = time.monotonic()
+        heartbeat.beats += 1
+
+
+def checkCancelled() -> None:
+    # Called before every side effect (requests, Telegram messages, state writes). Raises if the work running on this
+    # thread was given up on, so a run that comes back after being replaced can't repeat what the new one does
+    heartbeat = getattr(local, "heartbeat", None)
+    if heartbeat is not None and heartbeat.cancelled:
+        raise RunCancelled(f"{heartbeat.name} was cancelled")
+
+
+@contextlib.contextmanager
+def watch(heartbeat: Heartbeat) -> Iterator[Heartbeat]:
+    # The clock starts when the work does, not when it was queued
+    heartbeat.threadID = threading.get_ident()
+    heartbeat.lastBeat = time.monotonic()
+    previous = getattr(local, "heartbeat", None)
+    local.heartbeat = heartbeat
+    with registryLock:
+        heartbeats[heartbeat.threadID] = heartbeat
+    try:
+        yield heartbeat
+    finally:
+        with registryLock:
+            if previous is not None:
+                heartbeats[heartbeat.threadID] = previous
+            else:
+                heartbeats.pop(heartbeat.threadID, None)
+        local.heartbeat = previous
+
+
+def getStack(threadID: int) -> str:
+    frame = sys._current_frames().get(threadID)
+    if frame is None:
+        return "(thread is gone)"
+    return "".join(traceback.format_stack(frame))
+
+
+def check() -> List[Heartbeat]:
+    # Returns the heartbeats that stalled since the last check. Each stall is only reported once
+    now = time.monotonic()
+    with registryLock:
+        watched = list(heartbeats.values())
+    stalled = []
+    for heartbeat in watched:
+        if heartbeat.stalled or now - heartbeat.lastBeat < heartbeat.timeout:
+            continue
+        heartbeat.stalled = True
+        metrics.incCounter("watchdog_stalls_total", {"job": heartbeat.name})
+        logger.error(f"{heartbeat.name} made no progress in {now - heartbeat.lastBeat:.0f}s ({heartbeat.beats} beats so far). It's stuck at:\n{getStack(heartbeat.threadID)}")
+        stalled.append(heartbeat)
+    return stalled
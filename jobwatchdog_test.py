@@ -0,0 +1,96 @@
+###########################################################################
+#   jobwatchdog_test.py  --  This file is part of traderie-bot.           #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import threading
+import time
+import unittest
+
+import requests
+
+import httpclient
+import jobwatchdog
+
+
+class TestWatchdog(unittest.TestCase):
+    def setUp(self):
+        jobwatchdog.heartbeats.clear()
+
+    def testBeatOutsideWatchIsIgnored(self):
+        jobwatchdog.beat()
+        self.assertEqual(jobwatchdog.check(), [])
+
+    def testStallReportedOnceWithStack(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def stuckInHere():
+            with jobwatchdog.watch(jobwatchdog.Heartbeat("stuck", 0.05)):
+                started.set()
+                release.wait(5)
+
+        worker = threading.Thread(target=stuckInHere)
+        worker.start()
+        try:
+            started.wait(5)
+            self.assertEqual(jobwatchdog.check(), [])
+            time.sleep(0.1)
+            with self.assertLogs(jobwatchdog.logger, "ERROR") as logs:
+                stalled = jobwatchdog.check()
+            self.assertEqual([heartbeat.name for heartbeat in stalled], ["stuck"])
+            self.assertIn("stuckInHere", logs.output[0])
+            self.assertEqual(jobwatchdog.check(), [])
+        finally:
+            release.set()
+            worker.join()
+        self.assertEqual(jobwatchdog.heartbeats, {})
+
+    def testBeatsAndNesting(self):
+        outer = jobwatchdog.Heartbeat("outer", 0.05)
+        with jobwatchdog.watch(outer):
+            inner = jobwatchdog.Heartbeat("inner", 0.05)
+            with jobwatchdog.watch(inner):
+                jobwatchdog.beat()
+            self.assertEqual(inner.beats, 1)
+            jobwatchdog.beat()
+            self.assertEqual(outer.beats, 1)
+            self.assertIs(jobwatchdog.heartbeats[threading.get_ident()], outer)
+        self.assertEqual(jobwatchdog.heartbeats, {})
+
+    def testRequestsBeat(self):
+        calls = []
+
+        class FakeSession:
+            def request(self, method, url, **kwargs):
+                calls.append(kwargs)
+                response = requests.Response()
+                response.status_code = 200
+                return response
+
+        heartbeat = jobwatchdog.Heartbeat("requests", 60)
+        with jobwatchdog.watch(heartbeat):
+            httpclient.request("test", "GET", "http://127.0.0.1/", httpSession=FakeSession())
+            httpclient.request("test", "GET", "http://127.0.0.1/", httpSession=FakeSession(), timeout=1)
+        self.assertEqual(heartbeat.beats, 2)
+        # Nothing goes out without a timeout
+        self.assertEqual([kwargs["timeout"] for kwargs in calls], [httpclient.DEFAULT_TIMEOUT, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
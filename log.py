@@ -18,23 +18,118 @@
 #                                                                         #
 ###########################################################################
 
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from typing import Any, List, Optional
 
-loggers = []
+# Constants
+LOG_FORMAT = '%(levelname)s - %(asctime)s [%(filename)s:%(lineno)d %(funcName)s() TID:%(thread)d] %(message)s'
+# Longest payload (response bodies and such) that makes it into a log line
+MAX_PAYLOAD_LENGTH = 2000
+LOG_QUEUE_SIZE = 10000
 
-logging.basicConfig(format='%(levelname)s - %(asctime)s [%(filename)s:%(lineno)d %(funcName)s() TID:%(thread)d] %(message)s', level=logging.INFO)
+# Global vars
+loggers: List[logging.Logger] = []
+# Also applied to loggers created after setSeverity(), modules may be imported late
+severity: Optional[int] = None
+droppedRecords = 0
+droppedRecordsLock = threading.Lock()
+
+
+class Payload:
+    # Defers turning a payload into text until a handler actually formats the record, so debug payloads cost nothing
+    # when debug is off. Pass it as a %s argument, never inside an f-string
+    def __init__(self, payload: Any, maxLength: int = MAX_PAYLOAD_LENGTH):
+        self.payload = payload
+        self.maxLength = maxLength
+
+    def __str__(self) -> str:
+        text = str(self.payload)
+        if len(text) <= self.maxLength:
+            return text
+        return f"{text[:self.maxLength]}... [{len(text) - self.maxLength} more chars]"
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "file": record.filename,
+            "line": record.lineno,
+            "function": record.funcName,
+            "thread": record.thread,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    # The stock QueueHandler renders the message and traceback on the calling thread before queueing. Queue the record
+    # untouched instead, the listener thread does all the formatting
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        global droppedRecords
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Never block a hot thread on logging. Whatever doesn't fit is counted and dropped
+            with droppedRecordsLock:
+                droppedRecords += 1
+
+
+logQueue: "queue.Queue[logging.LogRecord]" = queue.Queue(LOG_QUEUE_SIZE)
+outputHandler = logging.StreamHandler(sys.stderr)
+outputHandler.setFormatter(logging.Formatter(LOG_FORMAT))
+listener = logging.handlers.QueueListener(logQueue, outputHandler, respect_handler_level=True)
+logging.basicConfig(level=logging.INFO, handlers=[LazyQueueHandler(logQueue)])
+listener.start()
+atexit.register(listener.stop)
 
 
 def getLogger(module: str) -> logging.Logger:
     global loggers
 
     logger = logging.getLogger(module)
+    if severity is not None:
+        logger.setLevel(severity)
     loggers.append(logger)
     return logger
 
 
-def setSeverity(severity: int) -> None:
+def setSeverity(newSeverity: int) -> None:
     global loggers
+    global severity
 
+    severity = newSeverity
     for logger in loggers:
         logger.setLevel(severity)
+
+
+def setJSONOutput(enabled: bool) -> None:
+    # Records already queued would otherwise come out in the new format
+    flush()
+    if enabled:
+        outputHandler.setFormatter(JSONFormatter())
+    else:
+        outputHandler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+
+def getDroppedRecords() -> int:
+    with droppedRecordsLock:
+        return droppedRecords
+
+
+def flush() -> None:
+    # Blocks until everything queued so far has been written. Meant for tests and shutdown
+    logQueue.join()
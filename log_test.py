@@ -0,0 +1,79 @@
+###########################################################################
+#   log_test.py  --  This file is part of traderie-bot.                   #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import json
+import logging
+import queue
+import sys
+import unittest
+
+import log
+
+
+class Unprintable:
+    def __str__(self):
+        raise AssertionError("Payload was formatted")
+
+
+class TestLog(unittest.TestCase):
+    def testPayloadTruncation(self):
+        self.assertEqual(str(log.Payload("short")), "short")
+        text = str(log.Payload("a" * 50, maxLength=10))
+        self.assertEqual(text, "aaaaaaaaaa... [40 more chars]")
+
+    def testPayloadIsLazy(self):
+        logger = log.getLogger("log_test_lazy")
+        logger.setLevel(logging.INFO)
+        logger.debug("Raw response: %s", log.Payload(Unprintable()))
+
+    def testQueueHandlerDoesNotFormat(self):
+        handler = log.LazyQueueHandler(queue.Queue())
+        payload = log.Payload(Unprintable())
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = logging.LogRecord("test", logging.ERROR, __file__, 1, "Raw response: %s", (payload,), sys.exc_info())
+        handler.emit(record)
+        queued = handler.queue.get_nowait()
+        self.assertIs(queued, record)
+        self.assertIs(queued.args[0], payload)
+        self.assertIsNone(queued.exc_text)
+
+    def testQueueFullDrops(self):
+        handler = log.LazyQueueHandler(queue.Queue(1))
+        dropped = log.getDroppedRecords()
+        for i in range(3):
+            handler.emit(logging.LogRecord("test", logging.INFO, __file__, 1, "message", None, None))
+        self.assertEqual(log.getDroppedRecords(), dropped + 2)
+
+    def testJSONFormatter(self):
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = logging.LogRecord("test", logging.ERROR, __file__, 7, "Failed: %s", ("reason",), sys.exc_info())
+        entry = json.loads(log.JSONFormatter().format(record))
+        self.assertEqual(entry["level"], "ERROR")
+        self.assertEqual(entry["line"], 7)
+        self.assertEqual(entry["message"], "Failed: reason")
+        self.assertIn("ValueError: boom", entry["exception"])
+
+
+if __name__ == '__main__':
+    unittest.main()
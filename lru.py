@@ -18,7 +18,12 @@
 #                                                                         #
 ###########################################################################
 
-from typing import Optional
+import collections
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
 import log
 
@@ -26,43 +31,126 @@ logger = log.getLogger(__name__)
 
 
 class LRUCache:
-    data = {}
-    itemList = []
+    data: "collections.OrderedDict[str, Tuple[Any, Optional[float]]]"
     length = 0
+    ttl: Optional[float] = None
+    hits = 0
+    misses = 0
+    evictions = 0
+    expirations = 0
 
-    def __init__(self, length):
+    def __init__(self, length: int, ttl: Optional[float] = None):
+        # Entries are kept in recency order, least recently used first. Each value is stored together with its expiry
+        # time (monotonic clock), or None if it never expires
         self.length = length
-        self.data = {}
-        self.itemList = []
+        self.ttl = ttl
+        self.data = collections.OrderedDict()
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
 
-    def get(self, key: str) -> Optional[str]:
-        return self.data.get(key)
+    @property
+    def itemList(self) -> List[str]:
+        # Most recently used first
+        with self.lock:
+            return list(reversed(self.data.keys()))
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expiry = entry
+            if expiry is not None and expiry <= time.monotonic():
+                del self.data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
 
     def numItems(self) -> int:
-        return len(self.itemList)
-
-    def put(self, key: str, value: str) -> None:
-        if key in self.data:
-            for i in range(len(self.itemList)):
-                if self.itemList[i] == key:
-                    del self.itemList[i]
-                    self.itemList.insert(0, key)
-                    self.data[key] = value
-                    return
-            logger.error("Inconsistency between cache map and list")
-        else:
-            self.itemList.insert(0, key)
-            self.data[key] = value
-            for evictedKey in self.itemList[self.length:]:
-                del self.data[evictedKey]
-            self.itemList = self.itemList[:self.length]
+        with self.lock:
+            return len(self.data)
+
+    def put(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        if ttl is None:
+            ttl = self.ttl
+        expiry = time.monotonic() + ttl if ttl is not None else None
+        with self.lock:
+            self.data[key] = (value, expiry)
+            self.data.move_to_end(key)
+            while len(self.data) > self.length:
+                self.data.popitem(last=False)
+                self.evictions += 1
 
     def evict(self, key: str) -> None:
-        if key in self.data:
-            for i in range(len(self.itemList)):
-                if self.itemList[i] == key:
-                    del self.itemList[i]
-                    del self.data[key]
-                    return
-        else:
-            logger.warning(f"Asked to evict key {key}, which is not cached")
+        with self.lock:
+            if key in self.data:
+                del self.data[key]
+            else:
+                logger.warning(f"Asked to evict key {key}, which is not cached")
+
+    def clear(self) -> None:
+        with self.lock:
+            self.data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "items": len(self.data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def dump(self) -> List[List[Any]]:
+        # Least recently used first, so that restoring the entries in order reproduces the same recency. Expiry times
+        # are converted to wall clock time so that they survive a restart
+        now = time.monotonic()
+        wallNow = time.time()
+        entries = []
+        with self.lock:
+            for key, (value, expiry) in self.data.items():
+                if expiry is None:
+                    entries.append([key, value, None])
+                elif expiry > now:
+                    entries.append([key, value, wallNow + (expiry - now)])
+        return entries
+
+    def restore(self, entries: List[List[Any]]) -> None:
+        wallNow = time.time()
+        for key, value, expiry in entries:
+            if expiry is None:
+                self.put(key, value)
+            elif expiry > wallNow:
+                self.put(key, value, ttl=expiry - wallNow)
+
+    def saveSnapshot(self, path: str) -> Optional[str]:
+        tmpPath = f"{path}.tmp"
+        try:
+            with open(tmpPath, "w") as f:
+                json.dump(self.dump(), f, separators=(",", ":"))
+            os.replace(tmpPath, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"Failed to save cache snapshot to {path}: {str(e)}")
+            return f"Failed to save cache snapshot to {path}: {str(e)}"
+        return None
+
+    def loadSnapshot(self, path: str) -> Optional[str]:
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as f:
+                entries = json.load(f)
+            self.restore(entries)
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"Failed to load cache snapshot from {path}: {str(e)}")
+            return f"Failed to load cache snapshot from {path}: {str(e)}"
+        logger.info(f"Loaded {len(entries)} cached entries from {path}")
+        return None
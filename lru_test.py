@@ -18,7 +18,10 @@
 #                                                                         #
 ###########################################################################
 
+import os
+import tempfile
 import unittest
+from unittest import mock
 
 import lru
 
@@ -70,13 +73,77 @@ class TestLRU(unittest.TestCase):
         cache.put("key3", "value3")
         cache.put("key1", "value4")
         self.assertEqual(cache.numItems(), 3)
+        self.assertEqual(cache.itemList[0], "key1")
+        self.assertEqual(cache.itemList[1], "key3")
+        self.assertEqual(cache.itemList[2], "key2")
+
         self.assertEqual(cache.get("key1"), "value4")
         self.assertEqual(cache.get("key2"), "value2")
         self.assertEqual(cache.get("key3"), "value3")
 
+    def testGetPromotes(self):
+        cache = lru.LRUCache(3)
+        cache.put("key1", "value1")
+        cache.put("key2", "value2")
+        cache.put("key3", "value3")
+        self.assertEqual(cache.get("key1"), "value1")
         self.assertEqual(cache.itemList[0], "key1")
-        self.assertEqual(cache.itemList[1], "key3")
-        self.assertEqual(cache.itemList[2], "key2")
+
+        cache.put("key4", "value4")
+        self.assertEqual(cache.get("key2"), None)
+        self.assertEqual(cache.get("key1"), "value1")
+        self.assertEqual(cache.numItems(), 3)
+
+    @mock.patch('lru.time.monotonic')
+    def testTTL(self, monotonic):
+        monotonic.return_value = 100.0
+        cache = lru.LRUCache(5, ttl=10)
+        cache.put("key1", "value1")
+        cache.put("key2", "value2", ttl=60)
+        cache.put("key3", "value3", ttl=None)
+
+        monotonic.return_value = 109.0
+        self.assertEqual(cache.get("key1"), "value1")
+        monotonic.return_value = 110.0
+        self.assertEqual(cache.get("key1"), None)
+        self.assertEqual(cache.get("key2"), "value2")
+        self.assertEqual(cache.numItems(), 2)
+
+        monotonic.return_value = 1000.0
+        self.assertEqual(cache.get("key2"), None)
+        self.assertEqual(cache.get("key3"), None)
+
+    def testStats(self):
+        cache = lru.LRUCache(2)
+        cache.put("key1", "value1")
+        cache.put("key2", "value2")
+        cache.put("key3", "value3")
+        cache.get("key1")
+        cache.get("key3")
+        cache.get("key3")
+        self.assertEqual(cache.stats(), {"items": 2, "hits": 2, "misses": 1, "evictions": 1, "expirations": 0})
+
+    def testSnapshot(self):
+        cache = lru.LRUCache(5)
+        cache.put("key1", "value1")
+        cache.put("key2", "value2", ttl=3600)
+        cache.put("key3", "value3")
+        cache.get("key1")
+
+        with tempfile.TemporaryDirectory() as tmpDir:
+            path = os.path.join(tmpDir, "cache.json")
+            self.assertEqual(cache.saveSnapshot(path), None)
+            restored = lru.LRUCache(5)
+            self.assertEqual(restored.loadSnapshot(path), None)
+
+        self.assertEqual(restored.itemList, ["key1", "key3", "key2"])
+        self.assertEqual(restored.get("key2"), "value2")
+        self.assertEqual(restored.numItems(), 3)
+
+    def testSnapshotSkipsExpired(self):
+        cache = lru.LRUCache(5)
+        cache.restore([["key1", "value1", 0], ["key2", "value2", None]])
+        self.assertEqual(cache.itemList, ["key2"])
 
 
 if __name__ == '__main__':
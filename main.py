@@ -24,32 +24,83 @@ import argparse
 import logging
 import signal
 import sys
+import threading
 
-import bot
+import config
 import log
+import profiler
 
 
 # Global vars
 logger = log.getLogger(__name__)
+# Imported by main() once the arguments and config are known to be good. telegram and requests are most of the
+# startup time, and --help or a broken config shouldn't pay for them
+bot = None
+responsecapture = None
 
 
 def signalHandler(signo, stackFrame):
-    bot.exitEvent.set()
+    bot.stop()
+
+
+def profileSignalHandler(signo, stackFrame):
+    # Writing the dump from the signal handler would block the main thread, so hand it off
+    threading.Thread(target=profiler.dump, name="profile_dump_thread").start()
+
+
+def responsesSignalHandler(signo, stackFrame):
+    threading.Thread(target=responsecapture.dump, name="responses_dump_thread").start()
 
 
 def main():
+    global bot
+    global responsecapture
+
     if sys.version_info.major < 3 or (sys.version_info.major == 3 and sys.version_info.minor < 9):
         logger.error("This bot requires at least Python 3.9 to run")
         exit(1)
-    signal.signal(signal.SIGINT, signalHandler)
-    signal.signal(signal.SIGTERM, signalHandler)
     parser = argparse.ArgumentParser(description="Telegram Traderie D2 Bot!")
+    parser.add_argument("--config", default=config.DEFAULT_CONFIG_FILE, help=f"INI file with the bot settings. {config.ENV_PREFIX}* environment variables override it")
     parser.add_argument("--debug", default=False, action="store_true")
+    parser.add_argument("--log-json", default=False, action="store_true", help="Write logs as one JSON object per line")
+    parser.add_argument("--profile", default=False, action="store_true", help="Sample the stacks of all threads. Dump them with SIGUSR1 or /profile")
+    parser.add_argument("--profile-mem", default=False, action="store_true", help="Trace memory allocations. Dump the top allocators with SIGUSR1 or /profile")
+    parser.add_argument("--record", metavar="FILE", help="Write every Traderie and dclone request and response to a gzipped JSONL file")
+    parser.add_argument("--replay", metavar="FILE", help="Serve Traderie and dclone responses from a recording instead of the network")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="Playback speed of recorded latencies. 0 replies immediately")
     args = parser.parse_args()
+    err = config.load(args.config)
+    if err is not None:
+        logger.error(err)
+        exit(1)
+    if args.log_json:
+        log.setJSONOutput(True)
     if args.debug:
         log.setSeverity(logging.DEBUG)
         logger.debug("Debug logs enabled")
+    if args.profile or args.profile_mem:
+        profiler.start(args.profile, args.profile_mem)
+        signal.signal(signal.SIGUSR1, profileSignalHandler)
+
+    import bot
+    import httpclient
+    import responsecapture
+
+    config.apply()
+    signal.signal(signal.SIGINT, signalHandler)
+    signal.signal(signal.SIGTERM, signalHandler)
+    signal.signal(signal.SIGUSR2, responsesSignalHandler)
+    if args.replay is not None:
+        httpclient.startReplay(args.replay, args.replay_speed)
+        logger.info(f"Replaying responses from {args.replay} at {args.replay_speed}x")
+    if args.record is not None:
+        httpclient.startRecording(args.record)
+        logger.info(f"Recording traffic to {args.record}")
     bot.start()
+    httpclient.stopRecording()
+    if profiler.isEnabled():
+        profiler.dump()
+        profiler.stop()
 
 
 if __name__ == "__main__":
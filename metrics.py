@@ -0,0 +1,320 @@
+###########################################################################
+#   metrics.py  --  This file is part of traderie-bot.                    #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import contextlib
+import http.server
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import log
+
+# Constants
+# Histograms have 2^SUB_BUCKET_BITS linear sub-buckets per power of two, which bounds the relative error of any
+# reported percentile to 1/2^SUB_BUCKET_BITS (~6%), like HdrHistogram does
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+# Values are recorded in microseconds, up to 2^32us (~71 minutes)
+MAX_MAGNITUDE = 32
+NUM_BUCKETS = SUB_BUCKETS * (MAX_MAGNITUDE - SUB_BUCKET_BITS + 1)
+REPORTED_QUANTILES = [0.5, 0.9, 0.99]
+
+# Global vars
+logger = log.getLogger(__name__)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Counter:
+    value: int
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        with self.lock:
+            self.value += amount
+
+
+def getBucketIndex(micros: int) -> int:
+    if micros < SUB_BUCKETS:
+        return max(micros, 0)
+    magnitude = micros.bit_length() - 1
+    if magnitude >= MAX_MAGNITUDE:
+        return NUM_BUCKETS - 1
+    shift = magnitude - SUB_BUCKET_BITS
+    return SUB_BUCKETS + shift * SUB_BUCKETS + ((micros >> shift) - SUB_BUCKETS)
+
+
+def getBucketUpperBound(index: int) -> int:
+    # Highest value (in microseconds) that falls into the bucket
+    if index < SUB_BUCKETS:
+        return index
+    shift = (index - SUB_BUCKETS) // SUB_BUCKETS
+    subBucket = (index - SUB_BUCKETS) % SUB_BUCKETS
+    return ((SUB_BUCKETS + subBucket + 1) << shift) - 1
+
+
+class Histogram:
+    counts: List[int]
+    count: int
+    total: float
+    maximum: float
+
+    def __init__(self):
+        self.counts = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        index = getBucketIndex(int(seconds * 1000000))
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            self.maximum = max(self.maximum, seconds)
+
+    def percentile(self, quantile: float) -> Optional[float]:
+        with self.lock:
+            if self.count == 0:
+                return None
+            target = max(1, int(quantile * self.count + 0.5))
+            seen = 0
+            for index, bucketCount in enumerate(self.counts):
+                seen += bucketCount
+                if seen >= target:
+                    return min(getBucketUpperBound(index) / 1000000, self.maximum)
+            return self.maximum
+
+
+class WindowedHistogram:
+    # Only covers the last window seconds, as a ring of per-slot histograms that get reset as they come back around
+    slots: List[Histogram]
+    slotSeconds: float
+    slotStarts: List[float]
+
+    def __init__(self, window: float, numSlots: int = 6):
+        self.slots = [Histogram() for _ in range(numSlots)]
+        self.slotSeconds = window / numSlots
+        self.slotStarts = [0.0] * numSlots
+        self.lock = threading.Lock()
+
+    def getSlot(self, now: float) -> Histogram:
+        start = now - now % self.slotSeconds
+        index = int(start // self.slotSeconds) % len(self.slots)
+        if self.slotStarts[index] != start:
+            self.slots[index] = Histogram()
+            self.slotStarts[index] = start
+        return self.slots[index]
+
+    def observe(self, seconds: float) -> None:
+        with self.lock:
+            slot = self.getSlot(time.monotonic())
+        slot.observe(seconds)
+
+    def merged(self) -> Histogram:
+        now = time.monotonic()
+        oldest = now - now % self.slotSeconds - (len(self.slots) - 1) * self.slotSeconds
+        merged = Histogram()
+        with self.lock:
+            slots = [slot for slot, start in zip(self.slots, self.slotStarts) if start >= oldest]
+        for slot in slots:
+            with slot.lock:
+                merged.counts = [a + b for a, b in zip(merged.counts, slot.counts)]
+                merged.count += slot.count
+                merged.total += slot.total
+                merged.maximum = max(merged.maximum, slot.maximum)
+        return merged
+
+    def percentile(self, quantile: float) -> Optional[float]:
+        return self.merged().percentile(quantile)
+
+
+# Metric name -> labels -> metric
+counters: Dict[str, Dict[Labels, Counter]] = {}
+histograms: Dict[str, Dict[Labels, Histogram]] = {}
+registryLock = threading.Lock()
+
+
+def toLabels(labels: Optional[Dict[str, str]]) -> Labels:
+    if labels is None:
+        return ()
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def getCounter(name: str, labels: Optional[Dict[str, str]] = None) -> Counter:
+    key = toLabels(labels)
+    metric = counters.get(name, {}).get(key)
+    if metric is None:
+        with registryLock:
+            metric = counters.setdefault(name, {}).setdefault(key, Counter())
+    return metric
+
+
+def getHistogram(name: str, labels: Optional[Dict[str, str]] = None) -> Histogram:
+    key = toLabels(labels)
+    metric = histograms.get(name, {}).get(key)
+    if metric is None:
+        with registryLock:
+            metric = histograms.setdefault(name, {}).setdefault(key, Histogram())
+    return metric
+
+
+def incCounter(name: str, labels: Optional[Dict[str, str]] = None, amount: int = 1) -> None:
+    getCounter(name, labels).inc(amount)
+
+
+def observe(name: str, seconds: float, labels: Optional[Dict[str, str]] = None) -> None:
+    getHistogram(name, labels).observe(seconds)
+
+
+@contextlib.contextmanager
+def timer(name: str, labels: Optional[Dict[str, str]] = None) -> Iterator[None]:
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        observe(name, time.monotonic() - start, labels)
+
+
+def formatLabels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra is not None else [])
+    if len(pairs) == 0:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+def snapshot() -> Dict[str, Dict]:
+    # Plain values only, so it pickles. The supervisor collects one from every worker process
+    with registryLock:
+        counterItems = [(name, dict(series)) for name, series in counters.items()]
+        histogramItems = [(name, dict(series)) for name, series in histograms.items()]
+    counterValues = {name: {labels: counter.value for labels, counter in series.items()} for name, series in counterItems}
+    histogramValues = {}
+    for name, series in histogramItems:
+        histogramValues[name] = {}
+        for labels, histogram in series.items():
+            with histogram.lock:
+                histogramValues[name][labels] = (list(histogram.counts), histogram.count, histogram.total, histogram.maximum)
+    return {"counters": counterValues, "histograms": histogramValues}
+
+
+def mergeSnapshots(snapshots: List[Dict[str, Dict]]) -> Tuple[Dict[str, Dict[Labels, Counter]], Dict[str, Dict[Labels, Histogram]]]:
+    # Counters add up and histograms add up bucket by bucket, so the merged percentiles keep the same error bound
+    mergedCounters: Dict[str, Dict[Labels, Counter]] = {}
+    mergedHistograms: Dict[str, Dict[Labels, Histogram]] = {}
+    for snap in snapshots:
+        for name, series in snap["counters"].items():
+            for labels, value in series.items():
+                mergedCounters.setdefault(name, {}).setdefault(labels, Counter()).inc(value)
+        for name, series in snap["histograms"].items():
+            for labels, (counts, count, total, maximum) in series.items():
+                histogram = mergedHistograms.setdefault(name, {}).setdefault(labels, Histogram())
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.count += count
+                histogram.total += total
+                histogram.maximum = max(histogram.maximum, maximum)
+    return mergedCounters, mergedHistograms
+
+
+def renderPrometheus(registry: Optional[Tuple[Dict[str, Dict[Labels, Counter]], Dict[str, Dict[Labels, Histogram]]]] = None) -> str:
+    # Renders this process' metrics, or the given (counters, histograms) pair, e.g. the output of mergeSnapshots
+    lines = []
+    if registry is None:
+        registry = (counters, histograms)
+    with registryLock:
+        counterItems = [(name, dict(series)) for name, series in registry[0].items()]
+        histogramItems = [(name, dict(series)) for name, series in registry[1].items()]
+    for name, series in sorted(counterItems):
+        lines.append(f"# TYPE {name} counter")
+        for labels, counter in series.items():
+            lines.append(f"{name}{formatLabels(labels)} {counter.value}")
+    for name, series in sorted(histogramItems):
+        lines.append(f"# TYPE {name} summary")
+        for labels, histogram in series.items():
+            for quantile in REPORTED_QUANTILES:
+                value = histogram.percentile(quantile)
+                lines.append(f"{name}{formatLabels(labels, ('quantile', str(quantile)))} {value if value is not None else 'NaN'}")
+            lines.append(f"{name}_sum{formatLabels(labels)} {histogram.total}")
+            lines.append(f"{name}_count{formatLabels(labels)} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+def renderSummary(name: str) -> List[str]:
+    # One human readable line per label set: count and latency percentiles in milliseconds
+    lines = []
+    with registryLock:
+        series = dict(histograms.get(name, {}))
+    for labels, histogram in sorted(series.items()):
+        percentiles = []
+        for quantile in REPORTED_QUANTILES:
+            value = histogram.percentile(quantile)
+            percentiles.append(f"p{int(quantile * 100)} {value * 1000:.0f}ms" if value is not None else f"p{int(quantile * 100)} N/A")
+        labelText = " ".join(value for _, value in labels) if len(labels) != 0 else "all"
+        lines.append(f"{labelText}: {histogram.count} calls, {', '.join(percentiles)}, max {histogram.maximum * 1000:.0f}ms")
+    return lines
+
+
+def renderErrorSummary(name: str, okStatus: str) -> List[str]:
+    # One human readable line per label set, without the status label: requests, failures and error rate
+    totals: Dict[Labels, List[int]] = {}
+    with registryLock:
+        series = dict(counters.get(name, {}))
+    for labels, counter in series.items():
+        key = tuple((key, value) for key, value in labels if key != "status")
+        status = dict(labels).get("status")
+        counts = totals.setdefault(key, [0, 0])
+        counts[0] += counter.value
+        if status != okStatus:
+            counts[1] += counter.value
+    lines = []
+    for labels, (total, errors) in sorted(totals.items()):
+        labelText = " ".join(value for _, value in labels) if len(labels) != 0 else "all"
+        lines.append(f"{labelText}: {errors}/{total} failed ({errors / total * 100 if total != 0 else 0:.1f}%)")
+    return lines
+
+
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def startHTTPServer(port: int, host: str = "127.0.0.1", render: Callable[[], str] = renderPrometheus) -> http.server.ThreadingHTTPServer:
+    server = http.server.ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.render = render
+    serverThread = threading.Thread(target=server.serve_forever, daemon=True)
+    serverThread.name = "metrics_thread"
+    serverThread.start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
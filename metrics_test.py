@@ -0,0 +1,120 @@
+###########################################################################
+#   metrics_test.py  --  This file is part of traderie-bot.               #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import unittest
+from unittest import mock
+import urllib.request
+
+import metrics
+
+
+class TestHistogram(unittest.TestCase):
+    def testBuckets(self):
+        for micros in [0, 1, 15, 16, 17, 100, 999, 1000, 12345, 1000000, 2 ** 31]:
+            index = metrics.getBucketIndex(micros)
+            self.assertGreaterEqual(metrics.getBucketUpperBound(index), micros)
+            self.assertLessEqual(metrics.getBucketUpperBound(index), micros * (1 + 1 / metrics.SUB_BUCKETS))
+            if index > 0:
+                self.assertLess(metrics.getBucketUpperBound(index - 1), micros)
+
+    def testPercentiles(self):
+        histogram = metrics.Histogram()
+        self.assertEqual(histogram.percentile(0.5), None)
+        for i in range(1, 101):
+            histogram.observe(i / 1000)
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.percentile(0.5), 0.050, delta=0.050 / metrics.SUB_BUCKETS)
+        self.assertAlmostEqual(histogram.percentile(0.99), 0.099, delta=0.099 / metrics.SUB_BUCKETS)
+        self.assertEqual(histogram.percentile(1), 0.1)
+
+
+class TestWindowedHistogram(unittest.TestCase):
+    @mock.patch('metrics.time.monotonic')
+    def testOldSlotsExpire(self, monotonic):
+        monotonic.return_value = 1000.0
+        histogram = metrics.WindowedHistogram(60, 6)
+        self.assertEqual(histogram.percentile(0.95), None)
+        histogram.observe(100.0)
+        monotonic.return_value = 1045.0
+        histogram.observe(1.0)
+        self.assertEqual(histogram.merged().count, 2)
+        self.assertAlmostEqual(histogram.percentile(0.95), 100.0, delta=100.0 / metrics.SUB_BUCKETS)
+        monotonic.return_value = 1065.0
+        self.assertEqual(histogram.merged().count, 1)
+        self.assertAlmostEqual(histogram.percentile(0.95), 1.0, delta=1.0 / metrics.SUB_BUCKETS)
+        monotonic.return_value = 2000.0
+        self.assertEqual(histogram.percentile(0.95), None)
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        metrics.counters.clear()
+        metrics.histograms.clear()
+
+    def testPrometheus(self):
+        metrics.incCounter("requests_total", {"endpoint": "getOffers", "status": "200"})
+        metrics.incCounter("requests_total", {"status": "200", "endpoint": "getOffers"}, 2)
+        with metrics.timer("duration_seconds", {"endpoint": "getOffers"}):
+            pass
+        text = metrics.renderPrometheus()
+        self.assertIn('requests_total{endpoint="getOffers",status="200"} 3', text)
+        self.assertIn('duration_seconds_count{endpoint="getOffers"} 1', text)
+        self.assertIn('duration_seconds{endpoint="getOffers",quantile="0.99"}', text)
+        self.assertEqual(len(metrics.renderSummary("duration_seconds")), 1)
+
+    def testErrorSummary(self):
+        metrics.incCounter("requests_total", {"endpoint": "getOffers", "status": "200"}, 3)
+        metrics.incCounter("requests_total", {"endpoint": "getOffers", "status": "500"})
+        metrics.incCounter("requests_total", {"endpoint": "getListing", "status": "error"})
+        self.assertEqual(metrics.renderErrorSummary("requests_total", "200"), [
+            "getListing: 1/1 failed (100.0%)",
+            "getOffers: 1/4 failed (25.0%)",
+        ])
+
+    def testMergeSnapshots(self):
+        metrics.incCounter("requests_total", {"endpoint": "getOffers"}, 2)
+        metrics.observe("duration_seconds", 0.1)
+        first = metrics.snapshot()
+        metrics.counters.clear()
+        metrics.histograms.clear()
+        metrics.incCounter("requests_total", {"endpoint": "getOffers"}, 3)
+        metrics.observe("duration_seconds", 2.0)
+        mergedCounters, mergedHistograms = metrics.mergeSnapshots([first, metrics.snapshot()])
+        self.assertEqual(mergedCounters["requests_total"][(("endpoint", "getOffers"),)].value, 5)
+        histogram = mergedHistograms["duration_seconds"][()]
+        self.assertEqual(histogram.count, 2)
+        self.assertAlmostEqual(histogram.percentile(0.99), 2.0, delta=2.0 / metrics.SUB_BUCKETS)
+        text = metrics.renderPrometheus((mergedCounters, mergedHistograms))
+        self.assertIn('requests_total{endpoint="getOffers"} 5', text)
+        self.assertIn("duration_seconds_count 2", text)
+
+    def testHTTPServer(self):
+        metrics.incCounter("requests_total")
+        server = metrics.startHTTPServer(0)
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+                self.assertIn("requests_total 1", response.read().decode())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+###########################################################################
+#   profiler.py  --  This file is part of traderie-bot.                   #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import collections
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import List, Optional
+
+import log
+
+# Constants
+PROFILE_DIR = "profiles"
+SAMPLING_INTERVAL = 0.01
+MEMORY_SNAPSHOT_INTERVAL = 300
+MEMORY_TRACE_FRAMES = 10
+TOP_ALLOCATORS = 25
+# Distinct stacks kept by the sampler. Samples of any new stack past this are counted under OVERFLOW_STACK
+MAX_STACKS = 20000
+OVERFLOW_STACK = "[other stacks]"
+
+# Global vars
+logger = log.getLogger(__name__)
+sampler: Optional["SamplingProfiler"] = None
+memoryProfiler: Optional["MemoryProfiler"] = None
+
+
+class SamplingProfiler():
+    interval: float
+    samples: "collections.Counter[str]"
+
+    def __init__(self, interval: float = SAMPLING_INTERVAL):
+        # Periodically samples the stack of every thread. Stacks are kept in collapsed form ("thread;outer;inner"),
+        # which is what flamegraph.pl and speedscope take as input
+        self.interval = interval
+        self.samples = collections.Counter()
+        self.numSamples = 0
+        self.lock = threading.Lock()
+        self.stopEvent = threading.Event()
+        self.thread = None
+
+    def start(self) -> None:
+        self.stopEvent.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.name = "profiler_thread"
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopEvent.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self) -> None:
+        ownID = threading.get_ident()
+        while not self.stopEvent.wait(self.interval):
+            threadNames = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = []
+            for threadID, frame in sys._current_frames().items():
+                if threadID == ownID:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(threadNames.get(threadID, str(threadID)))
+                stacks.append(";".join(reversed(stack)))
+            with self.lock:
+                for stack in stacks:
+                    if stack not in self.samples and len(self.samples) >= MAX_STACKS:
+                        stack = OVERFLOW_STACK
+                    self.samples[stack] += 1
+                self.numSamples += 1
+
+    def dump(self, path: str) -> int:
+        with self.lock:
+            samples = dict(self.samples)
+        with open(path, "w") as f:
+            for stack, count in sorted(samples.items()):
+                f.write(f"{stack} {count}\n")
+        return len(samples)
+
+
+class MemoryProfiler():
+    interval: float
+    baseline: Optional[tracemalloc.Snapshot]
+    latest: Optional[tracemalloc.Snapshot]
+
+    def __init__(self, interval: float = MEMORY_SNAPSHOT_INTERVAL):
+        self.interval = interval
+        self.baseline = None
+        self.latest = None
+        self.lock = threading.Lock()
+        self.stopEvent = threading.Event()
+        self.thread = None
+
+    def start(self) -> None:
+        tracemalloc.start(MEMORY_TRACE_FRAMES)
+        self.baseline = tracemalloc.take_snapshot()
+        self.stopEvent.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.name = "memory_profiler_thread"
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopEvent.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        tracemalloc.stop()
+
+    def run(self) -> None:
+        while not self.stopEvent.wait(self.interval):
+            self.takeSnapshot()
+
+    def takeSnapshot(self) -> tracemalloc.Snapshot:
+        snapshot = tracemalloc.take_snapshot()
+        with self.lock:
+            self.latest = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        logger.debug(f"Memory snapshot taken: {current / 1024:.0f} KiB traced, {peak / 1024:.0f} KiB peak")
+        return snapshot
+
+    def dump(self, path: str) -> None:
+        snapshot = self.takeSnapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        with open(path, "w") as f:
+            f.write(f"Traced memory: {current / 1024:.0f} KiB, peak {peak / 1024:.0f} KiB\n\n")
+            f.write(f"Top {TOP_ALLOCATORS} allocators:\n")
+            for stat in snapshot.statistics("lineno")[:TOP_ALLOCATORS]:
+                f.write(f"{stat}\n")
+            if self.baseline is not None:
+                f.write(f"\nTop {TOP_ALLOCATORS} changes since startup:\n")
+                for stat in snapshot.compare_to(self.baseline, "lineno")[:TOP_ALLOCATORS]:
+                    f.write(f"{stat}\n")
+
+
+def start(cpu: bool, memory: bool) -> None:
+    global sampler
+    global memoryProfiler
+
+    if cpu:
+        sampler = SamplingProfiler()
+        sampler.start()
+        logger.info(f"Sampling profiler started ({SAMPLING_INTERVAL * 1000:.0f}ms interval)")
+    if memory:
+        memoryProfiler = MemoryProfiler()
+        memoryProfiler.start()
+        logger.info(f"Memory profiler started ({MEMORY_SNAPSHOT_INTERVAL}s snapshot interval)")
+
+
+def stop() -> None:
+    if sampler is not None:
+        sampler.stop()
+    if memoryProfiler is not None:
+        memoryProfiler.stop()
+
+
+def isEnabled() -> bool:
+    return sampler is not None or memoryProfiler is not None
+
+
+def dump() -> List[str]:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    paths = []
+    if sampler is not None:
+        path = os.path.join(PROFILE_DIR, f"cpu-{timestamp}.folded")
+        numStacks = sampler.dump(path)
+        logger.info(f"Dumped {numStacks} stacks from {sampler.numSamples} samples to {path}")
+        paths.append(path)
+    if memoryProfiler is not None:
+        path = os.path.join(PROFILE_DIR, f"memory-{timestamp}.txt")
+        memoryProfiler.dump(path)
+        logger.info(f"Dumped memory profile to {path}")
+        paths.append(path)
+    return paths
@@ -0,0 +1,93 @@
+###########################################################################
+#   profiler_test.py  --  This file is part of traderie-bot.              #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import profiler
+
+
+class TestSamplingProfiler(unittest.TestCase):
+    def testCollapsedStacks(self):
+        done = threading.Event()
+
+        def idleLoop():
+            done.wait(5)
+        worker = threading.Thread(target=idleLoop, name="worker_thread")
+        worker.start()
+        sampler = profiler.SamplingProfiler(interval=0.001)
+        sampler.start()
+        try:
+            while sampler.numSamples < 5:
+                done.wait(0.01)
+        finally:
+            sampler.stop()
+            done.set()
+            worker.join()
+
+        with tempfile.TemporaryDirectory() as tmpDir:
+            path = os.path.join(tmpDir, "cpu.folded")
+            self.assertGreater(sampler.dump(path), 0)
+            with open(path) as f:
+                lines = f.read().splitlines()
+        workerStacks = [line for line in lines if line.startswith("worker_thread;")]
+        self.assertNotEqual(workerStacks, [])
+        stack, count = workerStacks[0].rsplit(" ", 1)
+        self.assertIn("idleLoop", stack)
+        self.assertGreater(int(count), 0)
+        self.assertFalse(any(line.startswith("profiler_thread;") for line in lines))
+
+    def testRestart(self):
+        sampler = profiler.SamplingProfiler(interval=0.001)
+        self.addCleanup(sampler.stop)
+        for _ in range(2):
+            sampler.start()
+            numSamples = sampler.numSamples
+            while sampler.numSamples == numSamples:
+                time.sleep(0.01)
+            sampler.stop()
+        numSamples = sampler.numSamples
+        time.sleep(0.02)
+        self.assertEqual(sampler.numSamples, numSamples)
+
+    def testStacksCapped(self):
+        # Makes sure there are at least two distinct stacks to sample
+        done = threading.Event()
+        worker = threading.Thread(target=done.wait, args=(5,), name="worker_thread")
+        worker.start()
+        self.addCleanup(worker.join)
+        self.addCleanup(done.set)
+        sampler = profiler.SamplingProfiler(interval=0.001)
+        self.addCleanup(sampler.stop)
+        with mock.patch('profiler.MAX_STACKS', 1):
+            sampler.start()
+            while sampler.numSamples < 5:
+                time.sleep(0.01)
+            sampler.stop()
+        self.assertLessEqual(len(sampler.samples), 2)
+        self.assertGreater(sampler.samples[profiler.OVERFLOW_STACK], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
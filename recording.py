@@ -0,0 +1,142 @@
+###########################################################################
+#   recording.py  --  This file is part of traderie-bot.                  #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import collections
+import gzip
+import json
+import threading
+import time
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import requests
+
+import log
+
+# Constants
+# Flushing a gzip stream ends the current block, so doing it on every entry would ruin the compression
+RECORDING_FLUSH_EVERY = 100
+
+# Global vars
+logger = log.getLogger(__name__)
+
+
+def getRequestKey(method: str, url: str, params: Optional[Dict[str, Any]], data: Optional[str]) -> str:
+    return json.dumps([method, url, params or {}, data], sort_keys=True, default=str)
+
+
+class Recorder:
+    # Appends every request and its response (or error) as one gzip-compressed JSON line. Request headers are left
+    # out, they carry the authorization token
+    def __init__(self, path: str):
+        self.file = gzip.open(path, "at", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self.pending = 0
+
+    def record(self, endpoint: str, method: str, url: str, kwargs: Dict[str, Any], started: float, elapsed: float, response: Optional[requests.Response] = None, error: Optional[Exception] = None) -> None:
+        entry = {
+            "t": round(started - self.start, 6),
+            "elapsed": round(elapsed, 6),
+            "endpoint": endpoint,
+            "method": method,
+            "url": url,
+            "params": kwargs.get("params"),
+            "data": kwargs.get("data"),
+        }
+        if response is not None:
+            entry["status"] = response.status_code
+            entry["reason"] = response.reason
+            entry["contentType"] = response.headers.get("Content-Type")
+            entry["body"] = response.text
+        else:
+            entry["error"] = type(error).__name__
+            entry["message"] = str(error)
+        line = json.dumps(entry, separators=(",", ":"), default=str)
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(line + "\n")
+            self.pending += 1
+            if self.pending >= RECORDING_FLUSH_EVERY:
+                self.file.flush()
+                self.pending = 0
+
+    def close(self) -> None:
+        with self.lock:
+            self.file.close()
+
+
+def loadRecording(path: str) -> List[Dict[str, Any]]:
+    entries = []
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping corrupt recording entry: {line[:100]}")
+    except EOFError:
+        # The recording process died before closing the file, everything up to the last flush is still usable
+        logger.warning(f"Recording {path} is truncated, using the {len(entries)} entries read so far")
+    return entries
+
+
+class Replayer:
+    # Serves recorded responses instead of hitting the network. Requests are matched by method, URL and payload first,
+    # and by method and URL if the payload never showed up in the recording. Each match is served in recorded order and
+    # the last one keeps being served once they run out, so polling loops can run past the end of the recording
+    def __init__(self, entries: List[Dict[str, Any]], speed: float = 1.0):
+        # speed multiplies how fast recorded latencies are played back. 0 serves everything immediately
+        self.speed = speed
+        self.lock = threading.Lock()
+        self.exact: Dict[str, Deque[Dict[str, Any]]] = collections.defaultdict(collections.deque)
+        self.loose: Dict[Tuple[str, str], Deque[Dict[str, Any]]] = collections.defaultdict(collections.deque)
+        for entry in sorted(entries, key=lambda x: x["t"]):
+            self.exact[getRequestKey(entry["method"], entry["url"], entry.get("params"), entry.get("data"))].append(entry)
+            self.loose[(entry["method"], entry["url"])].append(entry)
+
+    def take(self, queue: Deque[Dict[str, Any]]) -> Dict[str, Any]:
+        if len(queue) > 1:
+            return queue.popleft()
+        return queue[0]
+
+    def respond(self, method: str, url: str, **kwargs) -> requests.Response:
+        with self.lock:
+            queue = self.exact.get(getRequestKey(method, url, kwargs.get("params"), kwargs.get("data")))
+            if queue is None:
+                queue = self.loose.get((method, url))
+            if queue is None:
+                raise requests.exceptions.ConnectionError(f"No recorded response for {method} {url}")
+            entry = self.take(queue)
+        if self.speed > 0:
+            time.sleep(entry["elapsed"] / self.speed)
+        if entry.get("error") is not None:
+            if entry["error"] == "Timeout" or entry["error"].endswith("Timeout"):
+                raise requests.exceptions.Timeout(entry["message"])
+            raise requests.exceptions.ConnectionError(entry["message"])
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry["reason"]
+        response.url = url
+        response.encoding = "utf-8"
+        response._content = entry["body"].encode("utf-8")
+        if entry.get("contentType") is not None:
+            response.headers["Content-Type"] = entry["contentType"]
+        return response
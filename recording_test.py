@@ -0,0 +1,100 @@
+###########################################################################
+#   recording_test.py  --  This file is part of traderie-bot.             #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import os
+import tempfile
+import unittest
+
+import requests
+
+import fakeserver
+import httpclient
+import recording
+import traderie
+
+
+class TestRecording(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "traffic.jsonl.gz")
+        self.originalURL = traderie.API_BASE_URL
+
+    def tearDown(self):
+        httpclient.stopRecording()
+        httpclient.stopReplay()
+        traderie.API_BASE_URL = self.originalURL
+        self.tmpdir.cleanup()
+
+    def testRecordAndReplay(self):
+        with fakeserver.FakeServer(fakeserver.FakeConfig(numListings=3, numOffers=2)) as server:
+            traderie.API_BASE_URL = server.traderieURL
+            httpclient.startRecording(self.path)
+            recordedListing = traderie.getListing(2)
+            recordedOffers = traderie.getOffers(toSellerID=fakeserver.SELLER_ID)
+            self.assertIsNone(traderie.relistItem(2))
+            httpclient.stopRecording()
+            liveRequests = sum(server.state.requestCounts.values())
+
+            entries = recording.loadRecording(self.path)
+            self.assertEqual([x["endpoint"] for x in entries], ["getListing", "getOffers", "relistItem"])
+            self.assertNotIn("headers", entries[0])
+
+            httpclient.startReplay(self.path, speed=0)
+            self.assertEqual(traderie.getListing(2), recordedListing)
+            self.assertEqual(traderie.getOffers(toSellerID=fakeserver.SELLER_ID), recordedOffers)
+            self.assertIsNone(traderie.relistItem(2))
+            # Nothing reached the server during the replay
+            self.assertEqual(sum(server.state.requestCounts.values()), liveRequests)
+
+    def testReplayOrder(self):
+        entries = [
+            {"t": 0, "elapsed": 0, "method": "GET", "url": "http://x/a", "params": {"id": 1}, "data": None, "status": 200, "reason": "OK", "body": "first"},
+            {"t": 1, "elapsed": 0, "method": "GET", "url": "http://x/a", "params": {"id": 1}, "data": None, "status": 200, "reason": "OK", "body": "second"},
+            {"t": 2, "elapsed": 0, "method": "GET", "url": "http://x/a", "params": {"id": 2}, "data": None, "status": 500, "reason": "Error", "body": "other"},
+            {"t": 3, "elapsed": 0, "method": "GET", "url": "http://x/b", "params": None, "data": None, "error": "ConnectTimeout", "message": "timed out"},
+        ]
+        replayer = recording.Replayer(entries, speed=0)
+        self.assertEqual(replayer.respond("GET", "http://x/a", params={"id": 1}).text, "first")
+        self.assertEqual(replayer.respond("GET", "http://x/a", params={"id": 1}).text, "second")
+        # The last response keeps being served
+        self.assertEqual(replayer.respond("GET", "http://x/a", params={"id": 1}).text, "second")
+        self.assertEqual(replayer.respond("GET", "http://x/a", params={"id": 2}).status_code, 500)
+        # Unknown payloads fall back to any response for the same URL
+        self.assertEqual(replayer.respond("GET", "http://x/a", params={"id": 3}).text, "first")
+        with self.assertRaises(requests.exceptions.Timeout):
+            replayer.respond("GET", "http://x/b")
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            replayer.respond("GET", "http://x/c")
+
+    def testTruncatedRecording(self):
+        recorder = recording.Recorder(self.path)
+        for i in range(recording.RECORDING_FLUSH_EVERY):
+            recorder.record("test", "GET", "http://x/a", {}, recorder.start, 0.1, error=requests.exceptions.ConnectionError("down"))
+        with open(self.path, "rb") as f:
+            data = f.read()
+        recorder.close()
+        # Only what was flushed before the process died made it to disk
+        with open(self.path, "wb") as f:
+            f.write(data)
+        self.assertEqual(len(recording.loadRecording(self.path)), recording.RECORDING_FLUSH_EVERY)
+
+
+if __name__ == '__main__':
+    unittest.main()
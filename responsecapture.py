@@ -0,0 +1,127 @@
+###########################################################################
+#   responsecapture.py  --  This file is part of traderie-bot.            #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+# Keeps the last few bad responses per endpoint so they can be inspected without running with --debug
+
+import collections
+from dataclasses import dataclass
+import json
+import os
+import threading
+import time
+from typing import Deque, Dict, List
+import zlib
+
+import requests
+
+import log
+
+# Constants
+CAPTURE_DIR = "diagnostics"
+CAPTURES_PER_ENDPOINT = 20
+# Bodies are cut to this size before compression, so one entry can never take more than this
+MAX_CAPTURED_BODY = 64 * 1024
+
+# Global vars
+logger = log.getLogger(__name__)
+
+
+@dataclass
+class CapturedResponse:
+    timestamp: float
+    url: str
+    status: int
+    reason: str
+    cause: str
+    size: int
+    body: bytes
+
+    def toDict(self) -> Dict:
+        return {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.timestamp)),
+            "url": self.url,
+            "status": self.status,
+            "reason": self.reason,
+            "cause": self.cause,
+            "size": self.size,
+            "body": zlib.decompress(self.body).decode("utf-8", errors="replace"),
+        }
+
+
+class ResponseCapture():
+    def __init__(self, perEndpoint: int = CAPTURES_PER_ENDPOINT, maxBody: int = MAX_CAPTURED_BODY):
+        self.perEndpoint = perEndpoint
+        self.maxBody = maxBody
+        self.lock = threading.Lock()
+        self.captures: Dict[str, Deque[CapturedResponse]] = {}
+
+    def record(self, endpoint: str, response: requests.Response, cause: str) -> None:
+        content = response.content or b""
+        capture = CapturedResponse(
+            timestamp=time.time(),
+            url=response.url,
+            status=response.status_code,
+            reason=response.reason,
+            cause=cause,
+            size=len(content),
+            body=zlib.compress(content[:self.maxBody]),
+        )
+        with self.lock:
+            if endpoint not in self.captures:
+                self.captures[endpoint] = collections.deque(maxlen=self.perEndpoint)
+            self.captures[endpoint].append(capture)
+
+    def get(self, endpoint: str) -> List[CapturedResponse]:
+        with self.lock:
+            return list(self.captures.get(endpoint, []))
+
+    def getCounts(self) -> Dict[str, int]:
+        with self.lock:
+            return {endpoint: len(captures) for endpoint, captures in self.captures.items()}
+
+    def getMemoryUsage(self) -> int:
+        with self.lock:
+            return sum(len(capture.body) for captures in self.captures.values() for capture in captures)
+
+    def dump(self, path: str) -> int:
+        with self.lock:
+            snapshot = {endpoint: list(captures) for endpoint, captures in self.captures.items()}
+        numCaptures = 0
+        with open(path, "w") as f:
+            for endpoint, captures in snapshot.items():
+                for capture in captures:
+                    f.write(json.dumps(dict(capture.toDict(), endpoint=endpoint)) + "\n")
+                    numCaptures += 1
+        return numCaptures
+
+
+responses = ResponseCapture()
+
+
+def record(endpoint: str, response: requests.Response, cause: str) -> None:
+    responses.record(endpoint, response, cause)
+
+
+def dump() -> str:
+    os.makedirs(CAPTURE_DIR, exist_ok=True)
+    path = os.path.join(CAPTURE_DIR, f"responses-{time.strftime('%Y%m%d-%H%M%S')}.jsonl")
+    numCaptures = responses.dump(path)
+    logger.info(f"Dumped {numCaptures} captured responses to {path}")
+    return path
@@ -0,0 +1,101 @@
+###########################################################################
+#   responsecapture_test.py  --  This file is part of traderie-bot.       #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+import fakeserver
+import responsecapture
+import traderie
+
+
+def makeResponse(status: int, body: bytes) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response.reason = "Error" if status != 200 else "OK"
+    response.url = "http://x/test"
+    response._content = body
+    return response
+
+
+class TestResponseCapture(unittest.TestCase):
+    def testRing(self):
+        capture = responsecapture.ResponseCapture(perEndpoint=3, maxBody=10)
+        for i in range(5):
+            capture.record("test", makeResponse(500, f"body{i}".encode()), "HTTP 500")
+        captures = capture.get("test")
+        self.assertEqual(len(captures), 3)
+        self.assertEqual([x.toDict()["body"] for x in captures], ["body2", "body3", "body4"])
+        capture.record("big", makeResponse(200, b"x" * 1000), "Invalid JSON")
+        big = capture.get("big")[0]
+        self.assertEqual(big.size, 1000)
+        self.assertEqual(big.toDict()["body"], "x" * 10)
+        self.assertEqual(capture.getCounts(), {"test": 3, "big": 1})
+
+    def testDump(self):
+        capture = responsecapture.ResponseCapture()
+        capture.record("test", makeResponse(502, b"bad gateway"), "HTTP 502")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "dump.jsonl")
+            self.assertEqual(capture.dump(path), 1)
+            with open(path) as f:
+                entry = json.loads(f.readline())
+        self.assertEqual(entry["endpoint"], "test")
+        self.assertEqual(entry["status"], 502)
+        self.assertEqual(entry["body"], "bad gateway")
+
+    def testCapturedFromHTTPClient(self):
+        originalURL = traderie.API_BASE_URL
+        original = responsecapture.responses
+        responsecapture.responses = responsecapture.ResponseCapture()
+        try:
+            with fakeserver.FakeServer(fakeserver.FakeConfig(numListings=1)) as server:
+                traderie.API_BASE_URL = server.traderieURL
+                self.assertIsNotNone(traderie.getListing(1))
+                self.assertEqual(responsecapture.responses.getCounts(), {})
+                server.state.config.errorRate = 1.0
+                self.assertIsNone(traderie.getListing(1))
+            self.assertEqual(responsecapture.responses.getCounts(), {"getListing": 1})
+            self.assertEqual(responsecapture.responses.get("getListing")[0].cause, "HTTP 500")
+        finally:
+            traderie.API_BASE_URL = originalURL
+            responsecapture.responses = original
+
+    def testCapturedUndecodable(self):
+        original = responsecapture.responses
+        responsecapture.responses = responsecapture.ResponseCapture()
+        try:
+            with mock.patch('httpclient.request', return_value=makeResponse(200, b"<html>Cloudflare</html>")):
+                self.assertIsNone(traderie.getStatus(1))
+                self.assertEqual(traderie.relistItem(1), "Failed to relist item 1: API returned invalid JSON")
+            captures = responsecapture.responses.get("getStatus") + responsecapture.responses.get("relistItem")
+            self.assertEqual([capture.cause for capture in captures], ["Unable to decode JSON data from API"] * 2)
+            self.assertEqual(captures[0].toDict()["body"], "<html>Cloudflare</html>")
+        finally:
+            responsecapture.responses = original
+
+
+if __name__ == '__main__':
+    unittest.main()
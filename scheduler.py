@@ -0,0 +1,237 @@
+###########################################################################
+#   scheduler.py  --  This file is part of traderie-bot.                  #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+# Runs the periodic jobs of the bot as tasks of a single asyncio event loop. The jobs themselves are blocking code
+# (requests, sqlite), so every job runs in a worker thread of its own, but waiting between runs doesn't block the loop,
+# a job that raises is seen as soon as it does, and stopping cancels every wait at once
+
+import asyncio
+import concurrent.futures
+from dataclasses import dataclass, field
+import queue
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import jobwatchdog
+import log
+import metrics
+
+# Constants
+# Restart policies for a job whose run raised
+RESTART_ALWAYS = "always"
+RESTART_NEVER = "never"
+# Wait after a failed run, doubling with every consecutive failure up to the job's interval (or this, if shorter)
+RESTART_DELAY = 1
+# How long stop() lets runs already in a thread finish
+SHUTDOWN_TIMEOUT = 10
+# How often the watchdog looks for runs that stopped beating
+WATCHDOG_INTERVAL = 5
+
+# Global vars
+logger = log.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    name: str
+    # Blocking. Returns the seconds until its next run, or None to wait the interval
+    func: Callable[[], Optional[float]]
+    interval: float
+    # Every wait is randomly stretched or shrunk by up to this fraction
+    jitter: float = 0.0
+    # Seconds a run may go without a heartbeat (see jobwatchdog) before it's considered stalled. A stalled run can't be
+    # interrupted, so it's cancelled and abandoned to its thread, and the job carries on with a fresh one. If the
+    # abandoned run ever gets unstuck, its next side effect raises jobwatchdog.RunCancelled instead, so runs never
+    # overlap in what they do. None never gives up on a run
+    timeout: Optional[float] = None
+    restart: str = RESTART_ALWAYS
+    runAtStart: bool = True
+    runs: int = 0
+    failures: int = 0
+    running: Optional[asyncio.Future] = field(default=None, repr=False)
+    worker: Optional["DaemonPool"] = field(default=None, repr=False)
+
+
+class DaemonPool:
+    # Like a ThreadPoolExecutor, but its threads are daemons, which unlike executor ones aren't joined at exit, so a
+    # call stuck in one can't hold up shutdown. The threads are reused from call to call
+    def __init__(self, name: str, size: int = 1):
+        self.calls: queue.SimpleQueue = queue.SimpleQueue()
+        self.threads = [
+            threading.Thread(target=self.work, name=name if size == 1 else f"{name}_{i}", daemon=True)
+            for i in range(size)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def work(self) -> None:
+        while True:
+            call = self.calls.get()
+            if call is None:
+                return
+            future, func, args = call
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def submit(self, func: Callable, *args) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        self.calls.put((future, func, args))
+        return future
+
+    def shutdown(self) -> None:
+        # Doesn't wait. Threads exit once they're done with the calls already submitted, a stuck one never does
+        for _ in self.threads:
+            self.calls.put(None)
+
+
+def runInThread(name: str, func: Callable, *args) -> concurrent.futures.Future:
+    # For one-off calls, the thread exits when it's done
+    pool = DaemonPool(name)
+    future = pool.submit(func, *args)
+    pool.shutdown()
+    return future
+
+
+def runWatched(heartbeat: Optional[jobwatchdog.Heartbeat], func: Callable[[], Optional[float]]) -> Optional[float]:
+    if heartbeat is None:
+        return func()
+    with jobwatchdog.watch(heartbeat):
+        return func()
+
+
+class Scheduler:
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stopping = False
+
+    def add(self, job: Job) -> None:
+        self.jobs[job.name] = job
+
+    def getDelay(self, job: Job, result: Optional[float]) -> float:
+        delay = result if result is not None else job.interval
+        if job.jitter != 0:
+            delay *= random.uniform(1 - job.jitter, 1 + job.jitter)
+        return max(delay, 0.0)
+
+    async def runJob(self, job: Job) -> None:
+        delay = 0.0 if job.runAtStart else self.getDelay(job, None)
+        consecutiveFailures = 0
+        while True:
+            if delay > 0:
+                await asyncio.sleep(delay)
+            start = time.monotonic()
+            heartbeat = jobwatchdog.Heartbeat(job.name, job.timeout) if job.timeout is not None else None
+            if job.worker is None:
+                job.worker = DaemonPool(f"job_{job.name}")
+            job.running = asyncio.wrap_future(job.worker.submit(runWatched, heartbeat, job.func))
+            # Wake up now and then to see if the watchdog gave up on the run
+            done = set()
+            while len(done) == 0 and (heartbeat is None or not heartbeat.stalled):
+                done, _ = await asyncio.wait({job.running}, timeout=WATCHDOG_INTERVAL if heartbeat is not None else None)
+            if len(done) == 0:
+                # The watchdog already logged where it's stuck
+                job.failures += 1
+                self.abandon(job, heartbeat)
+                delay = self.getDelay(job, None)
+                continue
+            try:
+                result = job.running.result()
+            except Exception:
+                job.failures += 1
+                consecutiveFailures += 1
+                metrics.incCounter("job_failures_total", {"job": job.name})
+                if job.restart == RESTART_NEVER:
+                    logger.error(f"Uh oh, {job.name} failed. Not restarting it", exc_info=True)
+                    return
+                delay = min(RESTART_DELAY * 2 ** (consecutiveFailures - 1), max(job.interval, RESTART_DELAY))
+                logger.error(f"Uh oh, {job.name} failed. Restarting it in {delay:.0f}s", exc_info=True)
+                continue
+            metrics.observe("job_duration_seconds", time.monotonic() - start, {"job": job.name})
+            job.runs += 1
+            consecutiveFailures = 0
+            delay = self.getDelay(job, result)
+
+    def abandon(self, job: Job, heartbeat: jobwatchdog.Heartbeat) -> None:
+        logger.error(f"Abandoning the stalled {job.name} run, the next ones will use a fresh thread")
+        heartbeat.cancelled = True
+        # Its thread exits if the run ever returns
+        job.worker.shutdown()
+        job.worker = None
+        job.running.add_done_callback(lambda run: self.onAbandonedRunDone(job, run))
+        job.running = None
+
+    def onAbandonedRunDone(self, job: Job, run: asyncio.Future) -> None:
+        # Also retrieves the exception, so asyncio doesn't complain about it never being retrieved
+        if run.cancelled():
+            return
+        if isinstance(run.exception(), jobwatchdog.RunCancelled):
+            logger.info(f"Abandoned {job.name} run got unstuck, stopped it before its next side effect")
+        else:
+            logger.info(f"Abandoned {job.name} run got unstuck and finished")
+
+    async def watchdogLoop(self) -> None:
+        while True:
+            jobwatchdog.check()
+            await asyncio.sleep(WATCHDOG_INTERVAL)
+
+    def cancelAll(self) -> None:
+        for task in self.tasks.values():
+            task.cancel()
+
+    async def run(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        if self.stopping:
+            return
+        self.tasks = {name: asyncio.create_task(self.runJob(job), name=name) for name, job in self.jobs.items()}
+        # Also watches work that runs outside of jobs, like the relists
+        self.tasks["watchdog"] = asyncio.create_task(self.watchdogLoop(), name="watchdog")
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        running = [job.running for job in self.jobs.values() if job.running is not None and not job.running.done()]
+        if len(running) != 0:
+            logger.info(f"Waiting for {len(running)} jobs to finish their run...")
+            await asyncio.wait(running, timeout=SHUTDOWN_TIMEOUT)
+        for job in self.jobs.values():
+            if job.worker is not None:
+                job.worker.shutdown()
+                job.worker = None
+        self.loop = None
+
+    def start(self) -> None:
+        # Blocks until stop() is called
+        asyncio.run(self.run())
+
+    def stop(self) -> None:
+        # Safe to call from other threads and from signal handlers
+        self.stopping = True
+        loop = self.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self.cancelAll)
+            except RuntimeError:
+                # The loop finished in between, there's nothing left to cancel
+                pass
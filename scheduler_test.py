@@ -0,0 +1,153 @@
+###########################################################################
+#   scheduler_test.py  --  This file is part of traderie-bot.             #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+import jobwatchdog
+import scheduler
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = scheduler.Scheduler()
+        self.thread = None
+
+    def tearDown(self):
+        self.scheduler.stop()
+        if self.thread is not None:
+            self.thread.join(5)
+
+    def startScheduler(self) -> None:
+        self.thread = threading.Thread(target=self.scheduler.start)
+        self.thread.start()
+
+    def waitFor(self, condition, timeout: float = 5) -> None:
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def testIntervalAndStop(self):
+        calls = []
+        # Returning a delay overrides the interval
+        self.scheduler.add(scheduler.Job("fast", lambda: calls.append(1) or 0.01, 3600))
+        self.scheduler.add(scheduler.Job("slow", lambda: None, 3600, runAtStart=False))
+        self.startScheduler()
+        self.waitFor(lambda: len(calls) >= 5)
+        self.assertEqual(self.scheduler.jobs["slow"].runs, 0)
+        # Nothing waits out the hour long sleep
+        start = time.monotonic()
+        self.scheduler.stop()
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+        self.assertLess(time.monotonic() - start, 1)
+
+    def testRunsReuseTheirThread(self):
+        threads = []
+        self.scheduler.add(scheduler.Job("busy", lambda: threads.append(threading.current_thread()) or 0, 3600))
+        self.startScheduler()
+        self.waitFor(lambda: len(threads) >= 20)
+        self.assertEqual(len(set(threads)), 1)
+        self.scheduler.stop()
+        self.thread.join(5)
+        # The worker is let go on shutdown
+        threads[0].join(5)
+        self.assertFalse(threads[0].is_alive())
+
+    def testRestartPolicy(self):
+        attempts = {"flaky": 0, "fatal": 0}
+
+        def flaky():
+            attempts["flaky"] += 1
+            if attempts["flaky"] < 3:
+                raise RuntimeError("boom")
+            return 3600
+
+        def fatal():
+            attempts["fatal"] += 1
+            raise RuntimeError("boom")
+
+        self.scheduler.add(scheduler.Job("flaky", flaky, 3600))
+        self.scheduler.add(scheduler.Job("fatal", fatal, 0.01, restart=scheduler.RESTART_NEVER))
+        with mock.patch.object(scheduler, "RESTART_DELAY", 0.01):
+            self.startScheduler()
+            self.waitFor(lambda: self.scheduler.jobs["flaky"].runs == 1)
+        self.assertEqual(self.scheduler.jobs["flaky"].failures, 2)
+        self.assertEqual(attempts["fatal"], 1)
+
+    def testStalledRunIsReplaced(self):
+        release = threading.Event()
+        calls = []
+
+        def stuck():
+            calls.append(1)
+            release.wait(5)
+
+        self.scheduler.add(scheduler.Job("stuck", stuck, 0.01, timeout=0.05))
+        with mock.patch.object(scheduler, "WATCHDOG_INTERVAL", 0.01):
+            self.startScheduler()
+            # The job keeps going on a new thread while the first run is still stuck
+            self.waitFor(lambda: len(calls) >= 2)
+        self.assertGreaterEqual(self.scheduler.jobs["stuck"].failures, 1)
+        release.set()
+
+    def testAbandonedRunSkipsSideEffects(self):
+        release = threading.Event()
+        sideEffects = []
+        threads = []
+
+        def stuckOnce():
+            threads.append(threading.current_thread())
+            if len(threads) == 1:
+                release.wait(5)
+            jobwatchdog.checkCancelled()
+            sideEffects.append(len(threads))
+            return 3600
+
+        self.scheduler.add(scheduler.Job("stuck", stuckOnce, 0.01, timeout=0.05))
+        with mock.patch.object(scheduler, "WATCHDOG_INTERVAL", 0.01):
+            self.startScheduler()
+            self.waitFor(lambda: len(sideEffects) == 1)
+            # Runs are on daemon threads, so the stuck one can't hold up interpreter exit
+            self.assertTrue(all(thread.daemon for thread in threads))
+            release.set()
+            threads[0].join(5)
+        # Only the replacement run got to act
+        self.assertEqual(sideEffects, [2])
+
+    def testHeartbeatsKeepRunsAlive(self):
+        def slow():
+            for _ in range(10):
+                time.sleep(0.02)
+                jobwatchdog.beat()
+            return 3600
+
+        self.scheduler.add(scheduler.Job("slow", slow, 3600, timeout=0.1))
+        with mock.patch.object(scheduler, "WATCHDOG_INTERVAL", 0.01):
+            self.startScheduler()
+            self.waitFor(lambda: self.scheduler.jobs["slow"].runs == 1)
+        self.assertEqual(self.scheduler.jobs["slow"].failures, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+###########################################################################
+#   seenindex.py  --  This file is part of traderie-bot.                  #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import collections
+import sqlite3
+import threading
+from typing import Optional
+
+import log
+
+# Constants
+PRUNE_EVERY = 1000
+
+# Global vars
+logger = log.getLogger(__name__)
+
+
+class SeenIndex:
+    recent: "collections.OrderedDict[str, None]"
+    pending: "collections.OrderedDict[str, None]"
+    memorySize = 0
+    maxSize = 0
+
+    def __init__(self, path: str, memorySize: int = 1000, maxSize: int = 100000):
+        # The most recent IDs are kept in memory. New IDs are written to SQLite in one transaction whenever flush() is
+        # called, like StateStore does, and the oldest ones are pruned once there are more than maxSize of them. Lookups
+        # that miss in memory spill to an indexed table on disk
+        self.memorySize = memorySize
+        self.maxSize = maxSize
+        self.recent = collections.OrderedDict()
+        self.pending = collections.OrderedDict()
+        self.insertsSincePrune = 0
+        self.lock = threading.Lock()
+        # Serializes use of the connection, so flushes and disk lookups never hold self.lock
+        self.connLock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.connLock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS seen (seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE)")
+            self.conn.commit()
+            for (seenID,) in self.conn.execute("SELECT id FROM (SELECT id, seq FROM seen ORDER BY seq DESC LIMIT ?) ORDER BY seq", (memorySize,)):
+                self.recent[seenID] = None
+
+    def contains(self, seenID: str) -> bool:
+        seenID = str(seenID)
+        with self.lock:
+            if seenID in self.recent or seenID in self.pending:
+                return True
+        try:
+            with self.connLock:
+                return self.conn.execute("SELECT 1 FROM seen WHERE id = ?", (seenID,)).fetchone() is not None
+        except sqlite3.Error as e:
+            logger.error(f"Failed to look up seen ID {seenID}: {str(e)}")
+            return False
+
+    def add(self, seenID: str) -> None:
+        seenID = str(seenID)
+        with self.lock:
+            self.recent[seenID] = None
+            self.recent.move_to_end(seenID)
+            while len(self.recent) > self.memorySize:
+                self.recent.popitem(last=False)
+            self.pending[seenID] = None
+
+    def flush(self) -> Optional[str]:
+        with self.lock:
+            if len(self.pending) == 0:
+                return None
+            rows = [(seenID,) for seenID in self.pending]
+            self.pending.clear()
+        try:
+            with self.connLock, self.conn:
+                self.conn.executemany("INSERT OR IGNORE INTO seen (id) VALUES (?)", rows)
+                self.insertsSincePrune += len(rows)
+                if self.insertsSincePrune >= PRUNE_EVERY:
+                    self.conn.execute("DELETE FROM seen WHERE seq <= (SELECT MAX(seq) FROM seen) - ?", (self.maxSize,))
+                    self.insertsSincePrune = 0
+        except sqlite3.Error as e:
+            logger.error(f"Failed to store {len(rows)} seen IDs: {str(e)}")
+            # Keep them for the next flush, ahead of anything added since
+            with self.lock:
+                for (seenID,) in reversed(rows):
+                    self.pending[seenID] = None
+                    self.pending.move_to_end(seenID, last=False)
+            return f"Failed to store {len(rows)} seen IDs: {str(e)}"
+        return None
+
+    def close(self) -> None:
+        self.flush()
+        with self.connLock:
+            self.conn.close()
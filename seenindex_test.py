@@ -0,0 +1,82 @@
+###########################################################################
+#   seenindex_test.py  --  This file is part of traderie-bot.             #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import seenindex
+
+
+class TestSeenIndex(unittest.TestCase):
+    def testSpill(self):
+        index = seenindex.SeenIndex(":memory:", memorySize=2)
+        self.assertFalse(index.contains("id1"))
+        index.add("id1")
+        index.add("id2")
+        index.add("id3")
+        self.assertEqual(list(index.recent), ["id2", "id3"])
+        # Not written yet, but still known
+        self.assertTrue(index.contains("id1"))
+        self.assertEqual(index.flush(), None)
+        self.assertEqual(len(index.pending), 0)
+        self.assertTrue(index.contains("id1"))
+        self.assertTrue(index.contains("id3"))
+        self.assertFalse(index.contains("id4"))
+
+    def testAddDoesNotWrite(self):
+        index = seenindex.SeenIndex(":memory:", memorySize=2)
+        changes = index.conn.total_changes
+        for i in range(10):
+            index.add(f"id{i}")
+        self.assertEqual(index.conn.total_changes, changes)
+        index.flush()
+        self.assertEqual(index.conn.total_changes, changes + 10)
+
+    @mock.patch('seenindex.PRUNE_EVERY', 2)
+    def testPrune(self):
+        index = seenindex.SeenIndex(":memory:", memorySize=1, maxSize=3)
+        for i in range(6):
+            index.add(f"id{i}")
+            index.flush()
+        self.assertFalse(index.contains("id0"))
+        self.assertFalse(index.contains("id2"))
+        self.assertTrue(index.contains("id3"))
+        self.assertTrue(index.contains("id5"))
+
+    def testPersistence(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            path = os.path.join(tmpDir, "seen.db")
+            index = seenindex.SeenIndex(path, memorySize=2)
+            for i in range(4):
+                index.add(f"id{i}")
+            index.add("id1")
+            index.close()
+
+            index = seenindex.SeenIndex(path, memorySize=2)
+            self.assertEqual(list(index.recent), ["id2", "id3"])
+            self.assertTrue(index.contains("id0"))
+            self.assertFalse(index.contains("id4"))
+            index.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
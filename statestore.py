@@ -0,0 +1,92 @@
+###########################################################################
+#   statestore.py  --  This file is part of traderie-bot.                 #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Set
+
+import log
+
+logger = log.getLogger(__name__)
+
+
+class StateStore:
+    values: Dict[str, Any]
+    dirty: Set[str]
+
+    def __init__(self, path: str):
+        # Reads and writes only touch the in-memory copy. Changed keys are written to SQLite in a single transaction
+        # whenever flush() is called, which keeps disk I/O off the threads that update the state
+        self.lock = threading.Lock()
+        # Serializes use of the connection, so flushes never hold self.lock while writing
+        self.connLock = threading.Lock()
+        self.values = {}
+        self.dirty = set()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.connLock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated REAL NOT NULL)")
+            self.conn.commit()
+            for key, value in self.conn.execute("SELECT key, value FROM state"):
+                try:
+                    self.values[key] = json.loads(value)
+                except ValueError:
+                    logger.error(f"Ignoring corrupted state value for {key}")
+        logger.info(f"Loaded {len(self.values)} state values from {path}")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self.lock:
+            return self.values.get(key, default)
+
+    def set(self, key: str, value: Any) -> None:
+        with self.lock:
+            self.values[key] = value
+            self.dirty.add(key)
+
+    def flush(self) -> Optional[str]:
+        # Only the serialization happens under the lock, so set() never waits on the disk
+        with self.lock:
+            if len(self.dirty) == 0:
+                return None
+            now = time.time()
+            try:
+                rows = [(key, json.dumps(self.values[key], separators=(",", ":")), now) for key in self.dirty]
+            except (TypeError, ValueError) as e:
+                logger.error(f"Failed to flush state: {str(e)}")
+                return f"Failed to flush state: {str(e)}"
+            self.dirty.clear()
+        try:
+            with self.connLock, self.conn:
+                self.conn.executemany("INSERT OR REPLACE INTO state (key, value, updated) VALUES (?, ?, ?)", rows)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to flush state: {str(e)}")
+            # Retried on the next flush, which writes whatever the values are by then
+            with self.lock:
+                self.dirty.update(key for key, _, _ in rows)
+            return f"Failed to flush state: {str(e)}"
+        return None
+
+    def close(self) -> None:
+        self.flush()
+        with self.connLock:
+            self.conn.close()
@@ -0,0 +1,76 @@
+###########################################################################
+#   statestore_test.py  --  This file is part of traderie-bot.            #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import statestore
+
+
+class TestStateStore(unittest.TestCase):
+    def testGetSet(self):
+        store = statestore.StateStore(":memory:")
+        self.assertEqual(store.get("key1"), None)
+        self.assertEqual(store.get("key1", 5), 5)
+        store.set("key1", {"a": [1, 2]})
+        self.assertEqual(store.get("key1"), {"a": [1, 2]})
+
+    def testPersistence(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            path = os.path.join(tmpDir, "state.db")
+            store = statestore.StateStore(path)
+            store.set("key1", 1)
+            store.set("key2", "value2")
+            self.assertEqual(store.flush(), None)
+            store.set("key1", 2)
+            store.set("key3", [3])
+            store.close()
+
+            store = statestore.StateStore(path)
+            self.assertEqual(store.get("key1"), 2)
+            self.assertEqual(store.get("key2"), "value2")
+            self.assertEqual(store.get("key3"), [3])
+            store.close()
+
+    def testSetDuringFlush(self):
+        store = statestore.StateStore(":memory:")
+        store.set("key1", 1)
+        # Stalls the write, as a slow disk would
+        with store.connLock:
+            flusher = threading.Thread(target=store.flush)
+            flusher.start()
+            while "key1" in store.dirty:
+                time.sleep(0.001)
+            store.set("key2", 2)
+        flusher.join()
+        self.assertEqual(store.dirty, {"key2"})
+        self.assertEqual(store.conn.execute("SELECT key FROM state").fetchall(), [("key1",)])
+
+    def testUnserializable(self):
+        store = statestore.StateStore(":memory:")
+        store.set("key1", object())
+        self.assertNotEqual(store.flush(), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,372 @@
+###########################################################################
+#   supervisor.py  --  This file is part of traderie-bot.                 #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+# Runs the accounts of the config file across several worker processes. Accounts are sharded by a hash of their name,
+# each worker is a regular bot holding its shard, and the supervisor restarts the ones that die, the same way the job
+# scheduler does for jobs. A bot token can only have one getUpdates consumer, so the supervisor polls Telegram
+# and hands every update to the worker owning the chat it came from. Dclone progress is the same for every account, so
+# the supervisor is also the only one polling the trackers, and sends each poll's results to all workers, which alert
+# their own accounts. It also serves the metrics of all workers merged
+
+import argparse
+from dataclasses import dataclass, field
+import logging
+import multiprocessing
+import multiprocessing.process
+import os
+import queue
+import signal
+import sys
+import threading
+from typing import Any, Dict, List, Optional
+import zlib
+
+import telegram
+
+import config
+import log
+import metrics
+import statestore
+
+# Constants
+SUPERVISOR_INTERVAL = 10
+METRICS_PUSH_INTERVAL = 10
+WORKER_STOP_TIMEOUT = 30
+UPDATE_POLL_TIMEOUT = 10
+
+# Global vars
+logger = log.getLogger(__name__)
+# Imported once the config is known to be good, like main does
+bot = None
+supervisor: Optional["Supervisor"] = None
+
+
+@dataclass
+class Worker:
+    index: int
+    updates: Any
+    dcloneStatuses: Any
+    accounts: List[Dict[str, Any]] = field(default_factory=list)
+    process: Optional[multiprocessing.process.BaseProcess] = None
+    restarts: int = 0
+
+
+def getShard(name: str, numWorkers: int) -> int:
+    # crc32 rather than hash(), which is salted per process
+    return zlib.crc32(name.encode()) % numWorkers
+
+
+def assignShards(accountList: List[Dict[str, Any]], numWorkers: int) -> List[List[Dict[str, Any]]]:
+    shards: List[List[Dict[str, Any]]] = [[] for _ in range(numWorkers)]
+    for account in accountList:
+        shards[getShard(account["name"], numWorkers)].append(account)
+    return shards
+
+
+def metricsPushLoop(exitEvent: threading.Event, index: int, metricsQueue) -> None:
+    while not exitEvent.is_set():
+        exitEvent.wait(METRICS_PUSH_INTERVAL)
+        metricsQueue.put((index, metrics.snapshot()))
+
+
+def runWorker(index: int, accountList: List[Dict[str, Any]], configPath: str, updates, dcloneStatuses, metricsQueue, logJSON: bool, debug: bool) -> None:
+    # Entry point of the worker processes. They are spawned, not forked, so everything is set up again from scratch
+    global bot
+
+    if logJSON:
+        log.setJSONOutput(True)
+    if debug:
+        log.setSeverity(logging.DEBUG)
+    err = config.load(configPath)
+    if err is not None:
+        logger.error(err)
+        sys.exit(1)
+
+    import bot
+
+    config.apply()
+    bot.ACCOUNTS = accountList
+    bot.SNAPSHOT_DIR = f"worker-{index}"
+    # The supervisor serves the metrics of every worker
+    bot.METRICS_PORT = 0
+    signal.signal(signal.SIGINT, workerSignalHandler)
+    signal.signal(signal.SIGTERM, workerSignalHandler)
+    metricsThread = threading.Thread(target=metricsPushLoop, args=(bot.exitEvent, index, metricsQueue), daemon=True)
+    metricsThread.name = "metrics_push_thread"
+    metricsThread.start()
+    logger.info(f"Worker {index} starting with accounts: {', '.join(account['name'] for account in accountList)}")
+    bot.start(updates, dcloneStatuses)
+    metricsQueue.put((index, metrics.snapshot()))
+
+
+def workerSignalHandler(signo, stackFrame):
+    bot.stop()
+
+
+class Supervisor:
+    def __init__(self, configPath: str, numWorkers: int, logJSON: bool = False, debug: bool = False):
+        self.configPath = configPath
+        self.logJSON = logJSON
+        self.debug = debug
+        # Forking would copy the logging thread and any lock it holds, so workers start from a fresh interpreter
+        self.context = multiprocessing.get_context("spawn")
+        self.metricsQueue = self.context.Queue()
+        self.workers = [Worker(index=index, updates=self.context.Queue(), dcloneStatuses=self.context.Queue()) for index in range(numWorkers)]
+        # Chat ID -> worker index
+        self.chatRoutes: Dict[int, int] = {}
+        self.workerMetrics: Dict[int, Dict] = {}
+        self.metricsLock = threading.Lock()
+        self.exitEvent = threading.Event()
+        self.configMtime: Optional[float] = None
+        self.telegramBot = None
+
+    def startWorker(self, worker: Worker) -> None:
+        # Results queued before a restart are older than the previous status the worker loads from the state store
+        self.drainQueue(worker.dcloneStatuses)
+        worker.process = self.context.Process(
+            target=runWorker,
+            args=(worker.index, worker.accounts, self.configPath, worker.updates, worker.dcloneStatuses, self.metricsQueue, self.logJSON, self.debug),
+            name=f"worker-{worker.index}",
+        )
+        worker.process.start()
+
+    def stopWorkers(self, workers: List[Worker]) -> None:
+        # Signal all of them first, so they shut down in parallel
+        for worker in workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()
+        for worker in workers:
+            if worker.process is None:
+                continue
+            worker.process.join(WORKER_STOP_TIMEOUT)
+            if worker.process.is_alive():
+                logger.error(f"Worker {worker.index} didn't stop after {WORKER_STOP_TIMEOUT}s, killing it")
+                worker.process.kill()
+                worker.process.join()
+            worker.process = None
+
+    def drainQueue(self, workerQueue) -> List[Any]:
+        pending = []
+        while True:
+            try:
+                pending.append(workerQueue.get_nowait())
+            except queue.Empty:
+                return pending
+
+    def rebalance(self, accountList: List[Dict[str, Any]], restartAll: bool = False) -> int:
+        # Restarts only the workers whose accounts changed. Returns how many were
+        shards = assignShards(accountList, len(self.workers))
+        changed = [worker for worker, shard in zip(self.workers, shards) if restartAll or worker.accounts != shard]
+        self.stopWorkers(changed)
+        routes = {}
+        for worker, shard in zip(self.workers, shards):
+            worker.accounts = shard
+            for account in shard:
+                routes[account["chat_id"]] = worker.index
+        self.chatRoutes = routes
+        # Updates still queued for a restarted worker may belong to an account that moved elsewhere
+        pending = []
+        for worker in changed:
+            pending.extend(self.drainQueue(worker.updates))
+        for worker in changed:
+            if len(worker.accounts) != 0:
+                self.startWorker(worker)
+        for data in pending:
+            self.routeUpdate(data)
+        return len(changed)
+
+    def routeUpdate(self, data: Dict) -> None:
+        chat = telegram.Update.de_json(data, self.telegramBot).effective_chat
+        index = self.chatRoutes.get(chat.id) if chat is not None else None
+        if index is None:
+            if len(self.chatRoutes) != 1:
+                logger.warning(f"Ignoring update from unknown chat: {chat.id if chat is not None else None}")
+                return
+            # With a single account, keep answering wherever the command came from, like withAccount does
+            index = list(self.chatRoutes.values())[0]
+        self.workers[index].updates.put(data)
+
+    def checkConfig(self) -> None:
+        try:
+            mtime = os.stat(self.configPath).st_mtime
+        except OSError:
+            return
+        if mtime == self.configMtime:
+            return
+        firstLoad = self.configMtime is None
+        self.configMtime = mtime
+        if firstLoad:
+            return
+        previousSettings = config.settings
+        err = loadConfig(self.configPath)
+        if err is not None:
+            logger.error(f"Not applying config changes: {err}")
+            return
+        # Other settings only reach the workers when they start, so changing them restarts all of them
+        restarted = self.rebalance(config.accountSettings, restartAll=config.settings != previousSettings)
+        logger.info(f"Config changed, restarted {restarted} workers")
+
+    def superviseLoop(self) -> None:
+        while not self.exitEvent.is_set():
+            self.checkConfig()
+            for worker in self.workers:
+                if worker.process is None or worker.process.is_alive():
+                    continue
+                logger.error(f"Uh oh, worker {worker.index} exited with code {worker.process.exitcode}. Restarting...")
+                worker.restarts += 1
+                metrics.incCounter("supervisor_worker_restarts_total", {"worker": str(worker.index)})
+                self.startWorker(worker)
+            self.exitEvent.wait(SUPERVISOR_INTERVAL)
+
+    def pollUpdatesLoop(self) -> None:
+        offset = None
+        while not self.exitEvent.is_set():
+            try:
+                updates = self.telegramBot.get_updates(offset=offset, timeout=UPDATE_POLL_TIMEOUT)
+            except telegram.error.TelegramError as e:
+                logger.error(f"Unable to get updates: {str(e)}")
+                self.exitEvent.wait(5)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                self.routeUpdate(update.to_dict())
+
+    def pollDclone(self) -> float:
+        statuses = bot.dclone.getAllDcloneStatuses()
+        for realm, status in statuses.items():
+            if status is None:
+                logger.error(f"Unable to get dclone status for {realm}")
+            else:
+                bot.dclonePreviousStatus[realm] = status
+        bot.saveState("dclonePreviousStatus", dict(bot.dclonePreviousStatus))
+        bot.flushState()
+        # Alert realms are chosen per account inside the workers, so go by the most advanced of all realms
+        interval = bot.getDclonePollingInterval(set(bot.dclone.REALMS))
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.dcloneStatuses.put((statuses, interval))
+        logger.debug(f"Next dclone poll in {interval:.0f}s")
+        return interval
+
+    def dclonePollLoop(self) -> None:
+        while not self.exitEvent.is_set():
+            try:
+                interval = self.pollDclone()
+            except Exception:
+                logger.error("Uh oh, dclone polling failed. Retrying in a minute", exc_info=True)
+                interval = 60
+            self.exitEvent.wait(interval)
+
+    def collectMetricsLoop(self) -> None:
+        while not self.exitEvent.is_set():
+            try:
+                index, snapshot = self.metricsQueue.get(timeout=1)
+            except queue.Empty:
+                continue
+            with self.metricsLock:
+                self.workerMetrics[index] = snapshot
+
+    def renderMetrics(self) -> str:
+        with self.metricsLock:
+            snapshots = [metrics.snapshot()] + list(self.workerMetrics.values())
+        return metrics.renderPrometheus(metrics.mergeSnapshots(snapshots))
+
+    def run(self) -> None:
+        self.telegramBot = bot.MeteredBot(token=bot.APIKEY, base_url=bot.TELEGRAM_API_URL)
+        if bot.METRICS_PORT != 0:
+            metrics.startHTTPServer(bot.METRICS_PORT, render=self.renderMetrics)
+        self.checkConfig()
+        os.makedirs(bot.DATA_DIR, exist_ok=True)
+        bot.stateStore = statestore.StateStore(os.path.join(bot.DATA_DIR, bot.STATE_DB))
+        bot.dclonePreviousStatus.update(bot.stateStore.get("dclonePreviousStatus", {}))
+        self.rebalance(config.accountSettings)
+
+        threadList = []
+        threadTargets = [
+            (self.pollUpdatesLoop, "update_poll_thread"),
+            (self.collectMetricsLoop, "metrics_collect_thread"),
+            (self.dclonePollLoop, "dclone_poll_thread"),
+        ]
+        for target, name in threadTargets:
+            thread = threading.Thread(target=target)
+            thread.name = name
+            thread.start()
+            threadList.append(thread)
+        self.superviseLoop()
+
+        logger.info("Stopping workers...")
+        self.stopWorkers(self.workers)
+        for worker in self.workers:
+            # Nobody will read what's left, don't wait on flushing it at exit
+            worker.updates.cancel_join_thread()
+            worker.dcloneStatuses.cancel_join_thread()
+        for thread in threadList:
+            thread.join()
+            logger.info(f"{thread.name} shutdown!")
+        logger.info("Shutting down...")
+
+
+def loadConfig(path: str) -> Optional[str]:
+    err = config.load(path)
+    if err is not None:
+        return err
+    if len(config.accountSettings) == 0:
+        return "The supervisor needs at least one [account:NAME] section in the config file"
+    return None
+
+
+def signalHandler(signo, stackFrame):
+    supervisor.exitEvent.set()
+
+
+def main():
+    global bot
+    global supervisor
+
+    parser = argparse.ArgumentParser(description="Runs the accounts of a traderie-bot config file across several processes")
+    parser.add_argument("--config", default=config.DEFAULT_CONFIG_FILE, help="INI file with the bot settings and [account:NAME] sections. Changes to it are picked up while running")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes. Defaults to the number of CPUs")
+    parser.add_argument("--debug", default=False, action="store_true")
+    parser.add_argument("--log-json", default=False, action="store_true", help="Write logs as one JSON object per line")
+    args = parser.parse_args()
+    if args.workers < 1:
+        logger.error("--workers must be at least 1")
+        exit(1)
+    err = loadConfig(args.config)
+    if err is not None:
+        logger.error(err)
+        exit(1)
+    if args.log_json:
+        log.setJSONOutput(True)
+    if args.debug:
+        log.setSeverity(logging.DEBUG)
+
+    import bot
+
+    config.apply()
+    supervisor = Supervisor(args.config, args.workers, args.log_json, args.debug)
+    signal.signal(signal.SIGINT, signalHandler)
+    signal.signal(signal.SIGTERM, signalHandler)
+    logger.info(f"Running {len(config.accountSettings)} accounts on {args.workers} workers")
+    supervisor.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+###########################################################################
+#   supervisor_test.py  --  This file is part of traderie-bot.            #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import time
+import unittest
+from unittest import mock
+
+import supervisor
+
+
+def makeUpdate(updateID: int, chatID: int) -> dict:
+    return {
+        "update_id": updateID,
+        "message": {"message_id": updateID, "date": 0, "text": "/help", "chat": {"id": chatID, "type": "private"}},
+    }
+
+
+class TestSharding(unittest.TestCase):
+    def testStableShards(self):
+        # Workers must agree with the supervisor on where an account lives, across processes and restarts
+        self.assertEqual(supervisor.getShard("main", 4), supervisor.getShard("main", 4))
+        self.assertEqual(supervisor.getShard("main", 1), 0)
+        accountList = [{"name": f"seller{i}", "chat_id": i} for i in range(100)]
+        shards = supervisor.assignShards(accountList, 4)
+        self.assertEqual(sum(len(shard) for shard in shards), 100)
+        self.assertTrue(all(len(shard) != 0 for shard in shards))
+
+
+class TestSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.supervisor = supervisor.Supervisor("config.ini", 4)
+        patcherStart = mock.patch.object(self.supervisor, "startWorker")
+        patcherStop = mock.patch.object(self.supervisor, "stopWorkers")
+        self.startWorker = patcherStart.start()
+        self.stopWorkers = patcherStop.start()
+        self.addCleanup(patcherStart.stop)
+        self.addCleanup(patcherStop.stop)
+        self.accountList = [{"name": f"seller{i}", "chat_id": i} for i in range(20)]
+
+    def testRebalance(self):
+        started = self.supervisor.rebalance(self.accountList)
+        self.assertEqual(started, 4)
+        self.assertEqual(self.startWorker.call_count, 4)
+        self.assertEqual(len(self.supervisor.chatRoutes), 20)
+
+        # Removing an account only restarts the worker that held it
+        self.startWorker.reset_mock()
+        removed = self.accountList.pop()
+        self.assertEqual(self.supervisor.rebalance(self.accountList), 1)
+        worker = self.startWorker.call_args[0][0]
+        self.assertEqual(worker.index, supervisor.getShard(removed["name"], 4))
+        self.assertNotIn(removed["chat_id"], self.supervisor.chatRoutes)
+
+        self.assertEqual(self.supervisor.rebalance(self.accountList), 0)
+        self.assertEqual(self.supervisor.rebalance(self.accountList, restartAll=True), 4)
+
+    def testRouteUpdate(self):
+        self.supervisor.rebalance(self.accountList)
+        self.supervisor.routeUpdate(makeUpdate(1, 7))
+        self.supervisor.routeUpdate(makeUpdate(2, 12345))
+        index = supervisor.getShard("seller7", 4)
+        self.assertEqual([update["update_id"] for update in self.waitForUpdates(index, 1)], [1])
+        for worker in self.supervisor.workers:
+            self.assertEqual(self.supervisor.drainQueue(worker.updates), [])
+
+    def testRouteUpdateSingleAccount(self):
+        self.supervisor.rebalance(self.accountList[:1])
+        self.supervisor.routeUpdate(makeUpdate(1, 12345))
+        self.assertEqual(len(self.waitForUpdates(supervisor.getShard("seller0", 4), 1)), 1)
+
+    def testPendingUpdatesFollowAccounts(self):
+        self.supervisor.rebalance(self.accountList)
+        self.supervisor.routeUpdate(makeUpdate(1, 7))
+        # multiprocessing queues hand items over from a feeder thread, give it time to land
+        time.sleep(0.2)
+        # Growing to 5 workers moves accounts around. The queued update has to end up with the new owner
+        self.supervisor.workers.append(supervisor.Worker(index=4, updates=self.supervisor.context.Queue(), dcloneStatuses=self.supervisor.context.Queue()))
+        self.supervisor.rebalance(self.accountList)
+        newIndex = supervisor.getShard("seller7", 5)
+        self.assertNotEqual(newIndex, supervisor.getShard("seller7", 4))
+        self.assertEqual([update["update_id"] for update in self.waitForUpdates(newIndex, 1)], [1])
+
+    def testPollDcloneFansOut(self):
+        import bot
+        import statestore
+
+        self.supervisor.rebalance(self.accountList[:1])
+        running = self.supervisor.workers[supervisor.getShard("seller0", 4)]
+        running.process = mock.Mock()
+        statuses = {"softcore-nonladder": {"Americas": 5}, "hardcore-ladder": None}
+        with mock.patch.object(supervisor, "bot", bot), mock.patch.object(bot, "stateStore", statestore.StateStore(":memory:")), \
+                mock.patch.dict(bot.dclonePreviousStatus, {}), mock.patch("dclone.getAllDcloneStatuses", return_value=statuses):
+            interval = self.supervisor.pollDclone()
+            self.assertEqual(bot.stateStore.get("dclonePreviousStatus")["softcore-nonladder"], {"Americas": 5})
+        self.assertLessEqual(interval, bot.dclone.DCLONE_POLLING_INTERVALS[5] * (1 + bot.dclone.DCLONE_POLLING_JITTER))
+        self.assertEqual(running.dcloneStatuses.get(timeout=5), (statuses, interval))
+        for worker in self.supervisor.workers:
+            self.assertEqual(self.supervisor.drainQueue(worker.dcloneStatuses), [])
+
+    def waitForUpdates(self, index: int, count: int) -> list:
+        return [self.supervisor.workers[index].updates.get(timeout=5) for _ in range(count)]
+
+
+if __name__ == '__main__':
+    unittest.main()
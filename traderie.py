@@ -21,15 +21,16 @@
 from dataclasses import dataclass
 import datetime
 import json
-import traceback
-from typing import Dict, List, Optional
+import re
+from typing import Any, Callable, Dict, List, Optional
 import urllib3
 
 import requests
 
-import dateutil.parser
-
+import accounts
+import httpclient
 import log
+import responsecapture
 
 
 @dataclass
@@ -54,6 +55,7 @@ class Notification:
     date: str
     fromUserID: Optional[int]
     listingID: Optional[int]
+    fromUsername: Optional[str] = None
 
 
 @dataclass
@@ -85,7 +87,15 @@ class Offer:
 
 
 # Constants
+API_BASE_URL = "https://traderie.com/api/diablo2resurrected"
 LISTINGS_PER_PAGE = 50
+NOTIFICATION_USERNAME_PATTERNS = [
+    "^You got a new message from (.*)$",
+    "^You have a chat request from (.*)$",
+    "^You just got a 5 star review from (.*)$",
+    "^(.*?) made an? offer for .*$",
+    "^(.*?) completed their offer for your .*$",
+]
 
 
 # Global vars
@@ -96,29 +106,72 @@ httpHeaders = {
     'authorization': '',
     'Content-Type': 'application/json; charset=utf-8'
 }
+# Called with (userID, username) for every user seen in an API payload
+userObservers: List[Callable[[int, str], None]] = []
+
+
+def getHeaders() -> Dict[str, str]:
+    # Requests made on behalf of an account carry its own authorization, httpHeaders only has the shared defaults
+    account = accounts.getCurrent()
+    if account is None:
+        return httpHeaders
+    return dict(httpHeaders, authorization=account.auth)
+
+
+def notifyUserSeen(userID: Optional[int], username: Optional[str]) -> None:
+    if userID is None or username is None:
+        return
+    for observer in userObservers:
+        try:
+            observer(userID, username)
+        except Exception as e:
+            logger.error(f"User observer failed for {userID} ({username}): {str(e)}")
+
+
+def getUsernameFromNotificationText(text: str) -> Optional[str]:
+    for pattern in NOTIFICATION_USERNAME_PATTERNS:
+        match = re.search(pattern, text)
+        if match is not None:
+            return match.group(1)
+    return None
 
 
 def isListingRelistable(listing: Listing) -> bool:
+    import dateutil.parser
+
     return (datetime.datetime.now(datetime.timezone.utc) - dateutil.parser.isoparse(listing.updated)) > datetime.timedelta(days=1)
 
 
+def decodeJSON(endpoint: str, response: requests.Response) -> Optional[Any]:
+    # A 200 with an HTML error page is the most common bad response, so it gets captured like any other
+    try:
+        return json.loads(response.text)
+    except json.JSONDecodeError:
+        logger.error(f"Unable to decode JSON data from {endpoint} call")
+        logger.debug("Raw response: %s", log.Payload(response.text))
+        responsecapture.record(endpoint, response, "Unable to decode JSON data from API")
+        return None
+
+
 def getStatus(user: int) -> str:
     params = {'user': user}
     try:
-        response = requests.get("https://traderie.com/api/diablo2resurrected/accounts", params=params, headers=httpHeaders)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to get user status: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request("getStatus", "GET", f"{API_BASE_URL}/accounts", params=params, headers=getHeaders())
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to get user status: {str(e)}", exc_info=True)
         return None
     if response.status_code != 200:
         logger.error(f"Failed to get user status: Request returned code {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return None
 
-    data = json.loads(response.text)
+    data = decodeJSON("getStatus", response)
+    if data is None:
+        return None
     if data.get("user") is None or data.get("user").get("status") is None:
         logger.error("Invalid JSON data from status call")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
+        responsecapture.record("getStatus", response, "Invalid JSON data from status call")
         return None
     return data.get("user").get("status")
 
@@ -126,21 +179,23 @@ def getStatus(user: int) -> str:
 def setStatus(newStatus: str) -> Optional[str]:
     params = {'status': newStatus}
     try:
-        response = requests.put("https://traderie.com/api/diablo2resurrected/accounts/update", data=json.dumps(params), headers=httpHeaders)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to set status {newStatus}: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request("setStatus", "PUT", f"{API_BASE_URL}/accounts/update", data=json.dumps(params), headers=getHeaders())
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to set status {newStatus}: {str(e)}", exc_info=True)
         return f"Failed to set status {newStatus}: {str(e)}"
     if response.status_code != 200:
         logger.error(f"Failed to set status {newStatus} {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return f"Failed to set status {newStatus}: API returned error {response.status_code}"
 
-    data = json.loads(response.text)
+    data = decodeJSON("setStatus", response)
+    if data is None:
+        return f"Failed to set status {newStatus}: API returned invalid JSON"
     if data.get("msg") is None:
         if data.get("error") is None:
             logger.error("Invalid JSON data from status set call")
-            logger.debug(f"Raw response: {response.text}")
+            logger.debug("Raw response: %s", log.Payload(response.text))
+            responsecapture.record("setStatus", response, "Invalid JSON data from status set call")
             return f"Failed to set status {newStatus}: API returned unexpected response"
         else:
             logger.error(f"Error setting status: {data.get('error')}")
@@ -156,20 +211,22 @@ def getNotifications(new: bool, limit: int) -> Optional[List[Notification]]:
     if new:
         params['new'] = ''
     try:
-        response = requests.get("https://traderie.com/api/diablo2resurrected/notifications", params=params, headers=httpHeaders)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to get notifications: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request("getNotifications", "GET", f"{API_BASE_URL}/notifications", params=params, headers=getHeaders(), hedge=True)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to get notifications: {str(e)}", exc_info=True)
         return None
     if response.status_code != 200:
         logger.error(f"Failed to get notifications: Request returned code {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return None
 
-    data = json.loads(response.text)
+    data = decodeJSON("getNotifications", response)
+    if data is None:
+        return None
     if data.get("notifications") is None:
         logger.error("Invalid JSON data from notifications call")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
+        responsecapture.record("getNotifications", response, "Invalid JSON data from notifications call")
         return None
     for notification in data.get("notifications"):
         try:
@@ -182,10 +239,12 @@ def getNotifications(new: bool, limit: int) -> Optional[List[Notification]]:
             )
             if notification.get("data") is not None and notification.get("data").get("listing_id") is not None:
                 n.listingID = int(notification["data"]["listing_id"])
+            n.fromUsername = getUsernameFromNotificationText(n.text)
+            notifyUserSeen(n.fromUserID, n.fromUsername)
             ret.append(n)
         except KeyError:
             logger.error("Some notification is missing the message or date field")
-            logger.debug(f"Raw notification: {notification}")
+            logger.debug("Raw notification: %s", log.Payload(notification))
     return ret
 
 
@@ -193,26 +252,29 @@ def getConversations(active: bool, ownUserID: int) -> Optional[Dict[int, Convers
     ret = {}
     params = {'active': 'true' if active else 'false'}
     try:
-        response = requests.get("https://traderie.com/api/diablo2resurrected/conversations", params=params, headers=httpHeaders)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to get conversations: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request("getConversations", "GET", f"{API_BASE_URL}/conversations", params=params, headers=getHeaders(), hedge=True)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to get conversations: {str(e)}", exc_info=True)
         return None
     if response.status_code != 200:
         logger.error(f"Failed to get conversations: Request returned code {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return None
 
-    data = json.loads(response.text)
+    data = decodeJSON("getConversations", response)
+    if data is None:
+        return None
     if data.get("conversations") is None:
         logger.error("Invalid JSON data from conversations call")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
+        responsecapture.record("getConversations", response, "Invalid JSON data from conversations call")
         return None
     for convo in data.get("conversations"):
         partnerUserID = 0
         if convo.get("users") is None:
             logger.error("Invalid JSON data from conversations call")
-            logger.debug(f"Raw response: {response.text}")
+            logger.debug("Raw response: %s", log.Payload(response.text))
+            responsecapture.record("getConversations", response, "Invalid JSON data from conversations call")
             return None
         for userID in convo.get("users"):
             if int(userID) != ownUserID:
@@ -222,7 +284,7 @@ def getConversations(active: bool, ownUserID: int) -> Optional[Dict[int, Convers
             ret[partnerUserID] = Conversation(conversationID=int(convo["id"]), userID=int(partnerUserID))
         except KeyError:
             logger.error("Some conversation is missing a required field")
-            logger.debug(f"Raw message: {convo}")
+            logger.debug("Raw message: %s", log.Payload(convo))
     return ret
 
 
@@ -230,20 +292,22 @@ def getMessages(fromUserID: int, limit: int, conversationID: int) -> Optional[Li
     ret = []
     params = {'user': fromUserID, 'limit': limit, 'convoId': conversationID}
     try:
-        response = requests.get("https://traderie.com/api/diablo2resurrected/messages", params=params, headers=httpHeaders)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to get messages: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request("getMessages", "GET", f"{API_BASE_URL}/messages", params=params, headers=getHeaders(), hedge=True)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to get messages: {str(e)}", exc_info=True)
         return None
     if response.status_code != 200:
         logger.error(f"Failed to get messages: Request returned code {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return None
 
-    data = json.loads(response.text)
+    data = decodeJSON("getMessages", response)
+    if data is None:
+        return None
     if data.get("messages") is None:
         logger.error("Invalid JSON data from messages call")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
+        responsecapture.record("getMessages", response, "Invalid JSON data from messages call")
         return None
     for message in data.get("messages"):
         try:
@@ -251,7 +315,7 @@ def getMessages(fromUserID: int, limit: int, conversationID: int) -> Optional[Li
             ret.append(m)
         except KeyError:
             logger.error("Some message is missing a required field")
-            logger.debug(f"Raw message: {message}")
+            logger.debug("Raw message: %s", log.Payload(message))
     return ret
 
 
@@ -282,20 +346,22 @@ def getOffers(toSellerID: Optional[int] = None, fromUserID: Optional[int] = None
     else:
         params = {'accepted': 'open', 'user': fromUserID}
     try:
-        response = requests.get("https://traderie.com/api/diablo2resurrected/offers", params=params, headers=httpHeaders)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to get offers: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request("getOffers", "GET", f"{API_BASE_URL}/offers", params=params, headers=getHeaders(), hedge=True)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to get offers: {str(e)}", exc_info=True)
         return None
     if response.status_code != 200:
         logger.error(f"Failed to get offers: Request returned code {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return None
 
-    data = json.loads(response.text)
+    data = decodeJSON("getOffers", response)
+    if data is None:
+        return None
     if data.get("offers") is None:
         logger.error("Invalid JSON data from offers call")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
+        responsecapture.record("getOffers", response, "Invalid JSON data from offers call")
         return None
     for offer in data.get("offers"):
         try:
@@ -315,30 +381,34 @@ def getOffers(toSellerID: Optional[int] = None, fromUserID: Optional[int] = None
                 amount=int(offer["listing"].get("amount"))
             )
             ret[o.offerID] = o
+            notifyUserSeen(o.buyerID, o.buyerUsername)
+            notifyUserSeen(o.sellerID, o.sellerUsername)
         except KeyError:
             logger.error("Some offer is missing a required field")
-            logger.debug(f"Raw offer: {offer}")
+            logger.debug("Raw offer: %s", log.Payload(offer))
     return ret
 
 
 def relistItem(listingID: int) -> Optional[str]:
     params = {'listing': str(listingID)}
     try:
-        response = requests.put("https://traderie.com/api/diablo2resurrected/listings/refresh", data=json.dumps(params), headers=httpHeaders)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to relist item {listingID}: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request("relistItem", "PUT", f"{API_BASE_URL}/listings/refresh", data=json.dumps(params), headers=getHeaders())
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to relist item {listingID}: {str(e)}", exc_info=True)
         return f"Failed to relist item {listingID}: {str(e)}"
     if response.status_code != 200:
         logger.error(f"Failed to relist item {listingID} {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return f"Failed to relist item{listingID}: API returned error {response.status_code}"
 
-    data = json.loads(response.text)
+    data = decodeJSON("relistItem", response)
+    if data is None:
+        return f"Failed to relist item {listingID}: API returned invalid JSON"
     if data.get("msg") is None:
         if data.get("error") is None:
-            logger.error("Invalid JSON data from notifications call")
-            logger.debug(f"Raw response: {response.text}")
+            logger.error("Invalid JSON data from relist call")
+            logger.debug("Raw response: %s", log.Payload(response.text))
+            responsecapture.record("relistItem", response, "Invalid JSON data from relist call")
             return f"Failed to relist item {listingID}: API returned unexpected response"
         else:
             logger.error(f"Error listing item: {data.get('error')}")
@@ -376,7 +446,7 @@ def parseListing(listingJSONData) -> Optional[Listing]:
         return lst
     except KeyError:
         logger.error("Some listing is missing the message or date field")
-        logger.debug(f"Raw listing: {listingJSONData}")
+        logger.debug("Raw listing: %s", log.Payload(listingJSONData))
     return None
 
 
@@ -391,20 +461,22 @@ def getListings(seller: int, page: int, includeCompleted: bool) -> Optional[Dict
         'active': 'all',
     }
     try:
-        response = requests.get("https://traderie.com/api/diablo2resurrected/listings", params=params, headers=httpHeaders)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to get listings: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request("getListings", "GET", f"{API_BASE_URL}/listings", params=params, headers=getHeaders(), hedge=True)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to get listings: {str(e)}", exc_info=True)
         return None
     if response.status_code != 200:
         logger.error(f"Failed to get listings: Request returned code {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return None
 
-    data = json.loads(response.text)
+    data = decodeJSON("getListings", response)
+    if data is None:
+        return None
     if data.get("listings") is None:
         logger.error("Invalid JSON data from listings call")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
+        responsecapture.record("getListings", response, "Invalid JSON data from listings call")
         return None
     for listing in data.get("listings"):
         lst = parseListing(listing)
@@ -421,20 +493,22 @@ def getListing(listingID: int) -> Optional[Listing]:
         'id': listingID,
     }
     try:
-        response = requests.get("https://traderie.com/api/diablo2resurrected/listings", params=params, headers=httpHeaders)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to get listings: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request("getListing", "GET", f"{API_BASE_URL}/listings", params=params, headers=getHeaders(), hedge=True)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to get listings: {str(e)}", exc_info=True)
         return None
     if response.status_code != 200:
         logger.error(f"Failed to get listings: Request returned code {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return None
 
-    data = json.loads(response.text)
+    data = decodeJSON("getListing", response)
+    if data is None:
+        return None
     if data.get("listings") is None:
         logger.error("Invalid JSON data from listings call")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
+        responsecapture.record("getListing", response, "Invalid JSON data from listings call")
         return None
     if len(data["listings"]) > 1:
         logger.error(f"More than one listing returned for specified ID: {listingID}")
@@ -460,21 +534,23 @@ def getAllListings(seller: int, includeCompleted: bool = False) -> Optional[Dict
 def markNewNotificationsAsRead(newNotif: List[Notification]) -> Optional[str]:
     params = {'newNotifications': list(map(lambda x: x.notificationID, newNotif))}
     try:
-        response = requests.put("https://traderie.com/api/diablo2resurrected/notifications/read", data=json.dumps(params), headers=httpHeaders)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to mark notifications as read: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request("markNewNotificationsAsRead", "PUT", f"{API_BASE_URL}/notifications/read", data=json.dumps(params), headers=getHeaders())
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to mark notifications as read: {str(e)}", exc_info=True)
         return f"Failed to mark notifications as read: {str(e)}"
     if response.status_code != 200:
         logger.error(f"Failed to mark notifications as read {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return f"Failed to mark notifications as read: API returned error {response.status_code}"
 
-    data = json.loads(response.text)
+    data = decodeJSON("markNewNotificationsAsRead", response)
+    if data is None:
+        return "Failed to mark notifications as read: API returned invalid JSON"
     if data.get("success") is None:
         if data.get("error") is None:
             logger.error("Invalid JSON data from read notifications call")
-            logger.debug(f"Raw response: {response.text}")
+            logger.debug("Raw response: %s", log.Payload(response.text))
+            responsecapture.record("markNewNotificationsAsRead", response, "Invalid JSON data from read notifications call")
             return "Failed to mark notifications as read: API returned unexpected response"
         else:
             logger.error(f"Failed to mark notifications as read: {data.get('error')}")
@@ -487,21 +563,23 @@ def markNewNotificationsAsRead(newNotif: List[Notification]) -> Optional[str]:
 def declineOffer(offerID: int, buyerID: int, listingID: int, reason: str = "the offer was too low") -> Optional[str]:
     params = {'offer': offerID, 'buyer': str(buyerID), 'listing': listingID, 'reason': reason}
     try:
-        response = requests.put("https://traderie.com/api/diablo2resurrected/offers/deny", data=json.dumps(params), headers=httpHeaders)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to decline offer: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request("declineOffer", "PUT", f"{API_BASE_URL}/offers/deny", data=json.dumps(params), headers=getHeaders())
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to decline offer: {str(e)}", exc_info=True)
         return f"Failed to decline offer: {str(e)}"
     if response.status_code != 200:
         logger.error(f"Failed to decline offer {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return f"Failed to decline offer: API returned error {response.status_code}"
 
-    data = json.loads(response.text)
+    data = decodeJSON("declineOffer", response)
+    if data is None:
+        return "Failed to decline offer: API returned invalid JSON"
     if data.get("success") is None:
         if data.get("error") is None:
             logger.error("Invalid JSON data from decline offer call")
-            logger.debug(f"Raw response: {response.text}")
+            logger.debug("Raw response: %s", log.Payload(response.text))
+            responsecapture.record("declineOffer", response, "Invalid JSON data from decline offer call")
             return "Failed to decline offer: API returned unexpected response"
         else:
             logger.error(f"Failed to decline offer: {data.get('error')}")
@@ -523,21 +601,23 @@ def acceptOffer(offerID: int, buyerID: int, listingID: int, amount: int, itemID:
         'offerAmount': offerAmount
     }
     try:
-        response = requests.put("https://traderie.com/api/diablo2resurrected/offers/accept", data=json.dumps(params), headers=httpHeaders)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to accept offer: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request("acceptOffer", "PUT", f"{API_BASE_URL}/offers/accept", data=json.dumps(params), headers=getHeaders())
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to accept offer: {str(e)}", exc_info=True)
         return f"Failed to accept offer: {str(e)}"
     if response.status_code != 200:
         logger.error(f"Failed to accept offer {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return f"Failed to accept offer: API returned error {response.status_code}"
 
-    data = json.loads(response.text)
+    data = decodeJSON("acceptOffer", response)
+    if data is None:
+        return "Failed to accept offer: API returned invalid JSON"
     if data.get("success") is None:
         if data.get("error") is None:
             logger.error("Invalid JSON data from accept offer call")
-            logger.debug(f"Raw response: {response.text}")
+            logger.debug("Raw response: %s", log.Payload(response.text))
+            responsecapture.record("acceptOffer", response, "Invalid JSON data from accept offer call")
             return "Failed to accept offer: API returned unexpected response"
         else:
             logger.error(f"Failed to accept offer: {data.get('error')}")
@@ -555,21 +635,23 @@ def sendMessage(userID: int, message: str) -> Optional[str]:
         }
     }
     try:
-        response = requests.post("https://traderie.com/api/diablo2resurrected/messages", data=json.dumps(params), headers=httpHeaders)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to send message: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request("sendMessage", "POST", f"{API_BASE_URL}/messages", data=json.dumps(params), headers=getHeaders())
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to send message: {str(e)}", exc_info=True)
         return f"Failed to send message: {str(e)}"
     if response.status_code != 200:
         logger.error(f"Failed to send message {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return f"Failed to send message: API returned error {response.status_code}"
 
-    data = json.loads(response.text)
+    data = decodeJSON("sendMessage", response)
+    if data is None:
+        return "Failed to send message: API returned invalid JSON"
     if data.get("msg") is None:
         if data.get("error") is None:
             logger.error("Invalid JSON data from send message call")
-            logger.debug(f"Raw response: {response.text}")
+            logger.debug("Raw response: %s", log.Payload(response.text))
+            responsecapture.record("sendMessage", response, "Invalid JSON data from send message call")
             return "Failed to send message: API returned unexpected response"
         else:
             logger.error(f"Failed to send message: {data.get('error')}")
@@ -586,21 +668,23 @@ def openConversation(userID: int, username: str, offerID: int) -> Optional[str]:
         'offer': offerID,
     }
     try:
-        response = requests.post("https://traderie.com/api/diablo2resurrected/conversations", data=json.dumps(params), headers=httpHeaders)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to open conversation: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request("openConversation", "POST", f"{API_BASE_URL}/conversations", data=json.dumps(params), headers=getHeaders())
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to open conversation: {str(e)}", exc_info=True)
         return f"Failed to open conversation: {str(e)}"
     if response.status_code != 200:
         logger.error(f"Failed to open conversation {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return f"Failed to open conversation: API returned error {response.status_code}"
 
-    data = json.loads(response.text)
+    data = decodeJSON("openConversation", response)
+    if data is None:
+        return "Failed to open conversation: API returned invalid JSON"
     if data.get("msg") is None:
         if data.get("error") is None:
             logger.error("Invalid JSON data from open conversation call")
-            logger.debug(f"Raw response: {response.text}")
+            logger.debug("Raw response: %s", log.Payload(response.text))
+            responsecapture.record("openConversation", response, "Invalid JSON data from open conversation call")
             return "Failed to open conversation: API returned unexpected response"
         else:
             logger.error(f"Failed to open conversation: {data.get('error')}")
@@ -613,24 +697,28 @@ def openConversation(userID: int, username: str, offerID: int) -> Optional[str]:
 def searchUser(username: str) -> Optional[int]:
     params = {'username': username}
     try:
-        response = requests.get("https://traderie.com/api/diablo2resurrected/users", params=params, headers=httpHeaders)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to search user: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request("searchUser", "GET", f"{API_BASE_URL}/users", params=params, headers=getHeaders())
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to search user: {str(e)}", exc_info=True)
         return None
     if response.status_code != 200:
         logger.error(f"Failed to search user: Request returned code {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return None
 
-    data = json.loads(response.text)
+    data = decodeJSON("searchUser", response)
+    if data is None:
+        return None
     if data.get("users") is None or (not isinstance(data.get("users"), list)):
-        logger.error("Invalid JSON data from status call")
-        logger.debug(f"Raw response: {response.text}")
+        logger.error("Invalid JSON data from user search call")
+        logger.debug("Raw response: %s", log.Payload(response.text))
+        responsecapture.record("searchUser", response, "Invalid JSON data from user search call")
         return None
     userList = data.get("users")
     userID = None
     for user in userList:
+        if user.get("id") is not None:
+            notifyUserSeen(int(user.get("id")), user.get("username"))
         if user.get("username") == username:
             userID = user.get("id")
             if userID is not None:
@@ -645,17 +733,18 @@ def sendReview(userID: int, stars: int, description: str) -> Optional[str]:
         'user': str(userID),
     }
     try:
-        response = requests.post("https://traderie.com/api/diablo2resurrected/reviews/add", data=json.dumps(params), headers=httpHeaders)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to send review: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request("sendReview", "POST", f"{API_BASE_URL}/reviews/add", data=json.dumps(params), headers=getHeaders())
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to send review: {str(e)}", exc_info=True)
         return f"Failed to send review: {str(e)}"
     if response.status_code != 200:
         logger.error(f"Failed to send review {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return f"Failed to send review: API returned error {response.status_code}"
 
-    data = json.loads(response.text)
+    data = decodeJSON("sendReview", response)
+    if data is None:
+        return "Failed to send review: API returned invalid JSON"
     if data.get("error") is not None:
         logger.error(f"Failed to send review: {data.get('error')}")
         return f"Failed to send review: {data.get('error')}"
@@ -668,17 +757,18 @@ def acceptChatRequest(conversationID: str) -> Optional[str]:
         'active': True,
     }
     try:
-        response = requests.put("https://traderie.com/api/diablo2resurrected/conversations", data=json.dumps(params), headers=httpHeaders)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to accept chat request: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request("acceptChatRequest", "PUT", f"{API_BASE_URL}/conversations", data=json.dumps(params), headers=getHeaders())
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to accept chat request: {str(e)}", exc_info=True)
         return f"Failed to accept chat request: {str(e)}"
     if response.status_code != 200:
         logger.error(f"Failed to accept chat request {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return f"Failed to accept chat request: API returned error {response.status_code}"
 
-    data = json.loads(response.text)
+    data = decodeJSON("acceptChatRequest", response)
+    if data is None:
+        return "Failed to accept chat request: API returned invalid JSON"
     if data.get("error") is not None:
         logger.error(f"Failed to accept chat request: {data.get('error')}")
         return f"Failed to accept chat request: {data.get('error')}"
@@ -691,17 +781,18 @@ def archiveChat(conversationID: str) -> Optional[str]:
         'active': False,
     }
     try:
-        response = requests.put("https://traderie.com/api/diablo2resurrected/conversations", data=json.dumps(params), headers=httpHeaders)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to archive chat: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request("archiveChat", "PUT", f"{API_BASE_URL}/conversations", data=json.dumps(params), headers=getHeaders())
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to archive chat: {str(e)}", exc_info=True)
         return f"Failed to archive chat: {str(e)}"
     if response.status_code != 200:
         logger.error(f"Failed to archive chat {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return f"Failed to archive chat: API returned error {response.status_code}"
 
-    data = json.loads(response.text)
+    data = decodeJSON("archiveChat", response)
+    if data is None:
+        return "Failed to archive chat: API returned invalid JSON"
     if data.get("error") is not None:
         logger.error(f"Failed to archive chat: {data.get('error')}")
         return f"Failed to archive chat: {data.get('error')}"
@@ -713,17 +804,18 @@ def blockUser(userID: int) -> Optional[str]:
         'user': str(userID),
     }
     try:
-        response = requests.post("https://traderie.com/api/diablo2resurrected/blocks", data=json.dumps(params), headers=httpHeaders)
-    except (requests.exceptions.ConnectionError, urllib3.exceptions.NewConnectionError) as e:
-        logger.error(f"Failed to block user: {str(e)}")
-        logger.error(f"Stacktrace:\n{traceback.format_exc()}")
+        response = httpclient.request("blockUser", "POST", f"{API_BASE_URL}/blocks", data=json.dumps(params), headers=getHeaders())
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, urllib3.exceptions.NewConnectionError) as e:
+        logger.error(f"Failed to block user: {str(e)}", exc_info=True)
         return f"Failed to block user: {str(e)}"
     if response.status_code != 200:
         logger.error(f"Failed to block user {response.status_code}: {response.reason}")
-        logger.debug(f"Raw response: {response.text}")
+        logger.debug("Raw response: %s", log.Payload(response.text))
         return f"Failed to block user: API returned error {response.status_code}"
 
-    data = json.loads(response.text)
+    data = decodeJSON("blockUser", response)
+    if data is None:
+        return "Failed to block user: API returned invalid JSON"
     if data.get("error") is not None:
         logger.error(f"Failed to block user: {data.get('error')}")
         return f"Failed to block user: {data.get('error')}"
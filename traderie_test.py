@@ -22,6 +22,8 @@ import datetime
 import unittest
 from unittest import mock
 
+import requests
+
 import traderie
 
 
@@ -136,5 +138,37 @@ class TestIsRelistable(unittest.TestCase):
             self.assertEqual(res, c[1], f"returned {res}, expected {c[1]}\ncase #{c[0].listingID}")
 
 
+class TestNotificationUsername(unittest.TestCase):
+    def testUsernameFromText(self):
+        cases = [
+            ("You got a new message from someuser", "someuser"),
+            ("You have a chat request from some user", "some user"),
+            ("You just got a 5 star review from someuser", "someuser"),
+            ("someuser made an offer for your Shako", "someuser"),
+            ("someuser completed their offer for your Shako. Leave them a review", "someuser"),
+            ("Your listing has expired", None),
+        ]
+        for c in cases:
+            res = traderie.getUsernameFromNotificationText(c[0])
+            self.assertEqual(res, c[1], f"returned {res}, expected {c[1]}\ncase #{c[0]}")
+
+    def testUserObservers(self):
+        seen = []
+        traderie.userObservers.append(lambda userID, username: seen.append((userID, username)))
+        try:
+            traderie.notifyUserSeen(1, "user1")
+            traderie.notifyUserSeen(2, None)
+        finally:
+            traderie.userObservers.clear()
+        self.assertEqual(seen, [(1, "user1")])
+
+
+class TestTimeouts(unittest.TestCase):
+    @mock.patch('httpclient.request', side_effect=requests.exceptions.ReadTimeout("read timed out"))
+    def testReadTimeoutIsAFailure(self, _):
+        self.assertIsNone(traderie.getNotifications(True, 10))
+        self.assertEqual(traderie.relistItem(1), "Failed to relist item 1: read timed out")
+
+
 if __name__ == '__main__':
     unittest.main()
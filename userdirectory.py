@@ -0,0 +1,111 @@
+###########################################################################
+#   userdirectory.py  --  This file is part of traderie-bot.              #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import log
+
+logger = log.getLogger(__name__)
+
+
+class UserDirectory:
+    usernames: Dict[int, str]
+    userIDs: Dict[str, int]
+    # User ID -> (username, time it was seen) to store, or None to delete
+    pending: Dict[int, Optional[Tuple[str, float]]]
+
+    def __init__(self, path: str):
+        # The whole directory is mirrored in memory, so lookups never touch the database. Mappings that are new or have
+        # changed are written to SQLite in one transaction whenever flush() is called, like StateStore does
+        self.lock = threading.Lock()
+        # Serializes use of the connection, so flushes never hold self.lock
+        self.connLock = threading.Lock()
+        self.usernames = {}
+        self.userIDs = {}
+        self.pending = {}
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.connLock:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, username TEXT NOT NULL, updated REAL NOT NULL)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS users_username ON users (username)")
+            self.conn.commit()
+            for userID, username in self.conn.execute("SELECT user_id, username FROM users ORDER BY updated"):
+                self.usernames[userID] = username
+                self.userIDs[username] = userID
+        logger.info(f"Loaded {len(self.usernames)} users from {path}")
+
+    def record(self, userID: int, username: Optional[str]) -> None:
+        if not username or not userID:
+            return
+        userID = int(userID)
+        with self.lock:
+            if self.usernames.get(userID) == username and self.userIDs.get(username) == userID:
+                return
+            # Usernames can change hands, so drop any stale mapping in either direction
+            previousUsername = self.usernames.get(userID)
+            if previousUsername is not None and self.userIDs.get(previousUsername) == userID:
+                del self.userIDs[previousUsername]
+            previousUserID = self.userIDs.get(username)
+            if previousUserID is not None:
+                del self.usernames[previousUserID]
+                self.pending[previousUserID] = None
+            self.usernames[userID] = username
+            self.userIDs[username] = userID
+            self.pending[userID] = (username, time.time())
+
+    def flush(self) -> Optional[str]:
+        with self.lock:
+            if len(self.pending) == 0:
+                return None
+            rows = self.pending
+            self.pending = {}
+        deleted: List[Tuple[int]] = [(userID,) for userID, row in rows.items() if row is None]
+        stored: List[Tuple[int, str, float]] = [(userID, row[0], row[1]) for userID, row in rows.items() if row is not None]
+        try:
+            with self.connLock, self.conn:
+                self.conn.executemany("DELETE FROM users WHERE user_id = ?", deleted)
+                self.conn.executemany("INSERT OR REPLACE INTO users (user_id, username, updated) VALUES (?, ?, ?)", stored)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to store {len(rows)} users: {str(e)}")
+            # Keep them for the next flush, unless the user has been seen again since
+            with self.lock:
+                for userID, row in rows.items():
+                    self.pending.setdefault(userID, row)
+            return f"Failed to store {len(rows)} users: {str(e)}"
+        return None
+
+    def getUserID(self, username: str) -> Optional[int]:
+        with self.lock:
+            return self.userIDs.get(username)
+
+    def getUsername(self, userID: int) -> Optional[str]:
+        with self.lock:
+            return self.usernames.get(int(userID))
+
+    def numUsers(self) -> int:
+        with self.lock:
+            return len(self.usernames)
+
+    def close(self) -> None:
+        self.flush()
+        with self.connLock:
+            self.conn.close()
@@ -0,0 +1,95 @@
+###########################################################################
+#   userdirectory_test.py  --  This file is part of traderie-bot.         #
+#                                                                         #
+#   Copyright (C) 2022 Imanol-Mikel Barba Sabariego                       #
+#                                                                         #
+#   traderie-bot is free software: you can redistribute it and/or modify  #
+#   it under the terms of the GNU General Public License as published     #
+#   by the Free Software Foundation, either version 3 of the License,     #
+#   or (at your option) any later version.                                #
+#                                                                         #
+#   traderie-bot is distributed in the hope that it will be useful,       #
+#   but WITHOUT ANY WARRANTY; without even the implied warranty           #
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.               #
+#   See the GNU General Public License for more details.                  #
+#                                                                         #
+#   You should have received a copy of the GNU General Public License     #
+#   along with this program.  If not, see http://www.gnu.org/licenses/.   #
+#                                                                         #
+###########################################################################
+
+import os
+import tempfile
+import unittest
+
+import userdirectory
+
+
+class TestUserDirectory(unittest.TestCase):
+    def testLookups(self):
+        directory = userdirectory.UserDirectory(":memory:")
+        directory.record(1, "user1")
+        directory.record(2, "user2")
+        directory.record(3, None)
+        self.assertEqual(directory.getUserID("user1"), 1)
+        self.assertEqual(directory.getUsername(2), "user2")
+        self.assertEqual(directory.getUserID("user3"), None)
+        self.assertEqual(directory.getUsername(3), None)
+        self.assertEqual(directory.numUsers(), 2)
+
+    def testRename(self):
+        directory = userdirectory.UserDirectory(":memory:")
+        directory.record(1, "user1")
+        directory.record(1, "renamed")
+        self.assertEqual(directory.getUserID("user1"), None)
+        self.assertEqual(directory.getUserID("renamed"), 1)
+
+        directory.record(2, "renamed")
+        self.assertEqual(directory.getUserID("renamed"), 2)
+        self.assertEqual(directory.getUsername(1), None)
+        self.assertEqual(directory.numUsers(), 1)
+
+    def testPersistence(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            path = os.path.join(tmpDir, "users.db")
+            directory = userdirectory.UserDirectory(path)
+            directory.record(1, "user1")
+            directory.record(2, "user2")
+            directory.record(2, "user3")
+            directory.close()
+
+            directory = userdirectory.UserDirectory(path)
+            self.assertEqual(directory.getUserID("user1"), 1)
+            self.assertEqual(directory.getUserID("user3"), 2)
+            self.assertEqual(directory.getUserID("user2"), None)
+            directory.close()
+
+    def testBatchedFlush(self):
+        directory = userdirectory.UserDirectory(":memory:")
+        changes = directory.conn.total_changes
+        directory.record(1, "user1")
+        directory.record(2, "user2")
+        directory.record(2, "user1")
+        # Nothing reaches the database until the flush
+        self.assertEqual(directory.conn.total_changes, changes)
+        self.assertIsNone(directory.flush())
+        rows = directory.conn.execute("SELECT user_id, username FROM users ORDER BY user_id").fetchall()
+        self.assertEqual(rows, [(2, "user1")])
+        changes = directory.conn.total_changes
+        self.assertIsNone(directory.flush())
+        self.assertEqual(directory.conn.total_changes, changes)
+        directory.close()
+
+    def testFailedFlushIsRetried(self):
+        directory = userdirectory.UserDirectory(":memory:")
+        directory.record(1, "user1")
+        directory.conn.execute("DROP TABLE users")
+        self.assertIsNotNone(directory.flush())
+        directory.conn.execute("CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT NOT NULL, updated REAL NOT NULL)")
+        self.assertIsNone(directory.flush())
+        self.assertEqual(directory.conn.execute("SELECT user_id, username FROM users").fetchall(), [(1, "user1")])
+        directory.close()
+
+
+if __name__ == '__main__':
+    unittest.main()